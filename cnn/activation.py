@@ -0,0 +1,160 @@
+from nmigen import *
+from cnn.interfaces import DataStream
+from cnn.hdl_utils import Pipeline, signal_delay
+from cnn.utils.bits import range_required_bits
+
+import numpy as np
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+def tanh(x):
+    return np.tanh(x)
+
+def pwl_table(function, width_i, frac_i, width_o, frac_o, seg_bits):
+    """ Piecewise linear table of the function, as two lists
+    (base, delta), with one entry for each of the 2**seg_bits
+    segments of the input range. The segment k starts at the input
+    x_k, and base[k] = f(x_k), delta[k] = f(x_k+1) - f(x_k), in the
+    output fixed point format (saturated).
+    """
+    r = width_i - seg_bits
+    _min, _max = -2**(width_o-1), 2**(width_o-1)-1
+    to_output = lambda x: int(min(max(np.round(function(x / 2**frac_i) * 2**frac_o), _min), _max))
+    points = [to_output(-2**(width_i-1) + k * 2**r) for k in range(2**seg_bits + 1)]
+    base = points[:-1]
+    delta = [y1 - y0 for y0, y1 in zip(points[:-1], points[1:])]
+    return base, delta
+
+def pwl_interpolate(x, base, delta, width_i, seg_bits):
+    """ Reference model of the Activation core. """
+    r = width_i - seg_bits
+    offset = x + 2**(width_i-1)
+    k, frac = offset >> r, offset % 2**r
+    half = 2**(r-1) if r > 0 else 0
+    return base[k] + ((delta[k] * frac + half) >> r)
+
+
+class Activation(Elaboratable):
+    _doc_ = """
+    Activation function by a lookup table with piecewise linear
+    interpolation.
+    The input range is splitted in 2**seg_bits segments. The upper
+    seg_bits bits of the input select the segment, whose base value
+    and slope are read from a memory, and the lower bits are used to
+    interpolate linearly inside the segment (rounded to the nearest).
+    The table is generated at elaboration time from the function.
+    It takes one input per clock.
+
+    Interfaces
+    ----------
+    input : Data Stream, input
+        Signed fixed point input, with frac_i fractional bits.
+
+    output : Data Stream, output
+        Signed fixed point output, with frac_o fractional bits.
+
+    Parameters
+    ----------
+    function : callable
+        Function to apply, over numpy arrays or floats.
+
+    width_i : int
+        Bit width of the input data.
+
+    frac_i : int
+        Fractional bits of the input data.
+
+    width_o : int
+        Bit width of the output data.
+
+    frac_o : int
+        Fractional bits of the output data.
+
+    seg_bits : int
+        log2 of the number of segments (table depth). With
+        seg_bits = width_i, there is no interpolation.
+    """
+
+    def __init__(self, function, width_i, frac_i, width_o, frac_o, seg_bits=6):
+        assert 0 < seg_bits <= width_i, f'0 < {seg_bits} <= {width_i}'
+        self.width_i = width_i
+        self.width_o = width_o
+        self.seg_bits = seg_bits
+        self.base, self.delta = pwl_table(function, width_i, frac_i, width_o, frac_o, seg_bits)
+        self.width_d = max([range_required_bits(d, d) for d in self.delta])
+        self.table = Memory(width=width_o + self.width_d,
+                            depth=2**seg_bits,
+                            init=[(b % 2**width_o) | ((d % 2**self.width_d) << width_o)
+                                  for b, d in zip(self.base, self.delta)])
+        self.input = DataStream(width=width_i, direction='sink', name='input')
+        self.output = DataStream(width=width_o, direction='source', name='output')
+        self.latency = 3
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        r = self.width_i - self.seg_bits
+        half = 2**(r-1) if r > 0 else 0
+
+        clken = Signal()
+        comb += clken.eq(~self.output.valid | self.output.ready)
+        comb += self.input.ready.eq(clken)
+
+        # segment: upper bits of the input as an offset binary number
+        m.submodules.rd_port = rd_port = self.table.read_port(domain='sync', transparent=False)
+        data = self.input.data
+        comb += [rd_port.addr.eq(Cat(data[r:-1], ~data[-1])),
+                 rd_port.en.eq(clken),
+                ]
+
+        frac = Signal(max(r, 1))
+        with m.If(clken):
+            sync += frac.eq(data[0:r] if r > 0 else 0)
+
+        base = rd_port.data[0:self.width_o].as_signed()
+        delta = rd_port.data[self.width_o:].as_signed()
+
+        # base and base + delta are in the output range, so the
+        # interpolation doesn't need to be saturated
+        pipeline = Pipeline()
+        b1, p1 = pipeline.add_stage( [base, delta * frac] )
+        y2, = pipeline.add_stage( [b1 + ((p1 + half) >> r)] )
+        pipeline.generate(m=m, ce=clken, domain='sync')
+
+        accepted = self.input.accepted()
+        comb += [self.output.valid.eq(signal_delay(m, accepted, self.latency, ce=clken)),
+                 self.output.last.eq(signal_delay(m, accepted & self.input.last, self.latency, ce=clken)),
+                 self.output.data.eq(y2),
+                ]
+
+        return m
+
+
+class Sigmoid(Activation):
+    _doc_ = """
+    Sigmoid activation, 1 / (1 + exp(-x)).
+    See Activation.
+    """
+
+    def __init__(self, width_i, frac_i, width_o, frac_o, seg_bits=6):
+        Activation.__init__(self, sigmoid, width_i, frac_i, width_o, frac_o, seg_bits)
+
+
+class Tanh(Activation):
+    _doc_ = """
+    Hyperbolic tangent activation.
+    See Activation.
+    """
+
+    def __init__(self, width_i, frac_i, width_o, frac_o, seg_bits=6):
+        Activation.__init__(self, tanh, width_i, frac_i, width_o, frac_o, seg_bits)
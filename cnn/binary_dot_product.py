@@ -0,0 +1,136 @@
+from nmigen import *
+from cnn.interfaces import DataStream, MatrixStream
+from cnn.hdl_utils import signal_delay
+from cnn.tree_operations import TreeAdderUnsigned
+from cnn.utils.bits import range_required_bits
+
+from math import ceil, log2
+
+
+class BinaryDotProduct(Elaboratable):
+    _doc_ = """
+    Dot product of two binarized matrixes, where each element is
+    one bit: 1 means +1 and 0 means -1.
+    The element products are computed with XNOR (1 if both signs
+    are equal), and the result is
+        dot = 2 * popcount(xnor) - n_inputs
+    where the popcount is done by an unsigned adder tree, so it
+    takes one input per clock and uses no multipliers.
+
+    The dataflow is controlled ONLY by the input_a Stream interface.
+    The input_b stream interface is DUMMY, same as in the DotProduct.
+
+    Interfaces
+    ----------
+    input_a : Matrix Stream, input
+        Input a matrix data (activations).
+
+    input_b : Matrix Stream, input
+        Input b matrix data (weights).
+
+    output : Data Stream, output
+        Dot product (signed).
+
+    Parameters
+    ----------
+    shape : tuple
+        Input shape (N, M).
+    """
+
+    width_i = 1
+    _n_trees = 1
+
+    def __init__(self, shape):
+        self.input_a = MatrixStream(width=self.width_i, shape=shape, direction='sink', name='input_a')
+        self.input_b = MatrixStream(width=self.width_i, shape=shape, direction='sink', name='input_b')
+        self.n_inputs = self.input_a.dataport.n_elements
+        self.shape = self.input_a.dataport.shape
+        self.output_w = range_required_bits(-self.n_inputs, self.n_inputs)
+        self.output = DataStream(self.output_w, direction='source', name='output')
+        n_stages = max(1, int(ceil(log2(self.n_inputs))))
+        self.trees = [TreeAdderUnsigned(width_i=1,
+                                        n_stages=n_stages,
+                                        reg_in=False,
+                                        reg_out=False) for _ in range(self._n_trees)]
+        self.latency = 2 + self.trees[0].latency
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input_a[f] for f in self.input_a.fields]
+        ports += [self.input_b[f] for f in self.input_b.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def _products(self, a, b):
+        # bits to count for each tree
+        return [~(a ^ b)]
+
+    def _result(self, counts):
+        return (counts[0] << 1) - self.n_inputs
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        clken = Signal()
+        comb += clken.eq(~self.output.valid | self.output.ready)
+        comb += self.input_a.ready.eq(clken)
+
+        # DUMMY input_b interface
+        comb += self.input_b.ready.eq(self.input_a.accepted())
+
+        # element products
+        bits = [Signal(self.n_inputs, name='bits_' + str(i)) for i in range(self._n_trees)]
+        products = [self._products(a, b) for a, b in zip(self.input_a.data_ports, self.input_b.data_ports)]
+        with m.If(clken):
+            for i, b in enumerate(bits):
+                sync += b.eq(Cat(*[p[i] for p in products]))
+
+        # popcount
+        counts = []
+        for i, (tree, b) in enumerate(zip(self.trees, bits)):
+            m.submodules['tree_' + str(i)] = tree
+            comb += tree.clken.eq(clken)
+            for j, tree_input in enumerate(tree.inputs):
+                comb += tree_input.eq(b[j] if j < self.n_inputs else 0)
+            counts.append(tree.output.as_unsigned())
+
+        result = Signal(signed(self.output_w))
+        with m.If(clken):
+            sync += result.eq(self._result(counts))
+
+        accepted = self.input_a.accepted()
+        comb += [self.output.valid.eq(signal_delay(m, accepted, self.latency, ce=clken)),
+                 self.output.last.eq(signal_delay(m, accepted & self.input_a.last, self.latency, ce=clken)),
+                 self.output.data.eq(result),
+                ]
+
+        return m
+
+
+class TernaryDotProduct(BinaryDotProduct):
+    _doc_ = """
+    Dot product of two ternary matrixes, where each element is
+    -1, 0 or +1, as a 2 bit signed number.
+    Each element product is +1 if both elements are non zero with
+    the same sign, and -1 if they are non zero with different
+    signs. The positive and negative products are counted by two
+    unsigned adder trees, and the result is
+        dot = popcount(positive) - popcount(negative)
+    It takes one input per clock and uses no multipliers.
+
+    Interfaces and parameters are the same as in the Binary Dot
+    Product.
+    """
+
+    width_i = 2
+    _n_trees = 2
+
+    def _products(self, a, b):
+        non_zero = a[0] & b[0]
+        different_sign = a[1] ^ b[1]
+        return [non_zero & ~different_sign, non_zero & different_sign]
+
+    def _result(self, counts):
+        return counts[0] - counts[1]
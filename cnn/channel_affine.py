@@ -0,0 +1,147 @@
+from nmigen import *
+from cnn.interfaces import DataStream
+from cnn.rom import CircularROM
+from cnn.hdl_utils import Pipeline, signal_delay
+from cnn.utils.bits import range_required_bits
+
+import numpy as np
+
+
+def channel_affine(x, scale, offset, shift, width_o):
+    """ Reference model of the Channel Affine, for one sample of a
+    channel with the given scale and offset.
+    """
+    half = 2**(shift - 1) if shift > 0 else 0
+    _min, _max = -2**(width_o-1), 2**(width_o-1)-1
+    r = (x * scale + offset + half) >> shift
+    return min(max(r, _min), _max)
+
+def batchnorm_affine(gamma, beta, mean, var, shift, eps=1e-3):
+    """ Integer (scale, offset) of each channel for the Channel
+    Affine, from the BatchNorm parameters:
+        y = gamma * (x - mean) / sqrt(var + eps) + beta
+          = x * s + (beta - mean * s)
+    with s = gamma / sqrt(var + eps). Both are scaled by 2**shift.
+    """
+    s = np.array(gamma, dtype=float) / np.sqrt(np.array(var, dtype=float) + eps)
+    offset = np.array(beta, dtype=float) - np.array(mean, dtype=float) * s
+    scale = [int(x) for x in np.round(s * 2**shift)]
+    offset = [int(x) for x in np.round(offset * 2**shift)]
+    return scale, offset
+
+def fold_batchnorm(kernel, bias, gamma, beta, mean, var, eps=1e-3, frac_bits=None):
+    """ Folds a BatchNorm after a convolution into its kernel and
+    bias, so it needs no extra hardware:
+        kernel' = kernel * s
+        bias' = (bias - mean) * s + beta
+    with s = gamma / sqrt(var + eps). kernel can be a single kernel
+    (and scalar BatchNorm parameters), or have one kernel per output
+    channel in its first axis.
+    If frac_bits is given, the results are rounded to integers with
+    frac_bits fractional bits (the bias in the scale of the products,
+    for Convolution(kernel=..., bias=..., bias_shift=0)).
+    """
+    kernel = np.array(kernel, dtype=float)
+    s = np.array(gamma, dtype=float) / np.sqrt(np.array(var, dtype=float) + eps)
+    bias = 0 if bias is None else np.array(bias, dtype=float)
+    folded_bias = (bias - np.array(mean, dtype=float)) * s + np.array(beta, dtype=float)
+    folded_kernel = kernel * np.reshape(s, np.shape(s) + (1,) * (kernel.ndim - np.ndim(s)))
+    if frac_bits is not None:
+        folded_kernel = np.round(folded_kernel * 2**frac_bits).astype(int)
+        folded_bias = np.round(folded_bias * 2**frac_bits).astype(int)
+    return folded_kernel, folded_bias
+
+
+class ChannelAffine(Elaboratable):
+    _doc_ = """
+    Per channel affine transformation (as a BatchNorm):
+        output = saturate(round((input * scale + offset) / 2**shift))
+    The scale and offset of each channel are read from a Circular
+    ROM, so the samples have to be sorted by channel: 0, 1, ...,
+    n_channels-1, 0, 1, ... (the ROM wraps around, so each vector
+    must have a whole number of pixels). The rounding is to the
+    nearest integer (halves rounded up), and the result is clamped
+    to the range of a signed number of width_o bits.
+    It takes one input per clock.
+
+    Interfaces
+    ----------
+    input : Data Stream, input
+        Signed input data.
+
+    output : Data Stream, output
+        Signed output data.
+
+    Parameters
+    ----------
+    width_i : int
+        Bit width of the input data.
+
+    width_o : int
+        Bit width of the output data.
+
+    scale : list
+        Multiplier of each channel. See batchnorm_affine().
+
+    offset : list
+        Offset of each channel, in the scale of the products.
+
+    shift : int
+        The result is shifted to the right by this number.
+    """
+
+    def __init__(self, width_i, width_o, scale, offset, shift):
+        assert len(scale) == len(offset), f'{len(scale)} != {len(offset)}'
+        self.width_i = width_i
+        self.width_o = width_o
+        self.shift = shift
+        self.n_channels = len(scale)
+        self.width_s = range_required_bits(min(scale), max(scale))
+        self.width_off = range_required_bits(min(offset), max(offset))
+        init = [(s % 2**self.width_s) | ((o % 2**self.width_off) << self.width_s)
+                for s, o in zip(scale, offset)]
+        self.rom = CircularROM(width=self.width_s + self.width_off, init=init)
+        self.input = DataStream(width=width_i, direction='sink', name='input')
+        self.output = DataStream(width=width_o, direction='source', name='output')
+        self.latency = 4
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        _min, _max = -2**(self.width_o-1), 2**(self.width_o-1)-1
+        half = 2**(self.shift - 1) if self.shift > 0 else 0
+
+        m.submodules.rom = rom = self.rom
+
+        clken = Signal()
+        comb += clken.eq(~self.output.valid | self.output.ready)
+        comb += [self.input.ready.eq(clken & rom.r_rdy),
+                 rom.r_en.eq(self.input.accepted()),
+                 rom.restart.eq(0),
+                ]
+
+        scale = rom.r_data[0:self.width_s].as_signed()
+        offset = rom.r_data[self.width_s:].as_signed()
+
+        pipeline = Pipeline()
+        x0, s0, o0 = pipeline.add_stage( [self.input.data.as_signed(), scale, offset] )
+        p1, o1 = pipeline.add_stage( [x0 * s0, o0] )
+        r2, = pipeline.add_stage( [(p1 + o1 + half) >> self.shift] )
+        s3, = pipeline.add_stage( [Mux(r2 > _max, _max, Mux(r2 < _min, _min, r2))] )
+        pipeline.generate(m=m, ce=clken, domain='sync')
+
+        accepted = self.input.accepted()
+        comb += [self.output.valid.eq(signal_delay(m, accepted, self.latency, ce=clken)),
+                 self.output.last.eq(signal_delay(m, accepted & self.input.last, self.latency, ce=clken)),
+                 self.output.data.eq(s3),
+                ]
+
+        return m
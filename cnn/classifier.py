@@ -0,0 +1,349 @@
+from nmigen import *
+from cnn.interfaces import DataStream, MatrixStream, SparseStream
+from cnn.hdl_utils import signal_delay
+from cnn.tree_operations import TreeHighestSigned
+from cnn.utils.operations import _incr
+
+import numpy as np
+from math import ceil, log2
+
+
+class Argmax(Elaboratable):
+    _doc_ = """
+    Argmax of each vector of the input, delimited by the last.
+    When the last sample of a vector is received, the index and
+    the value of its highest element are output (in a single
+    sample, with last=1). If the highest value is repeated, the
+    lowest index is output.
+    With more than one lane, the highest element of each sample
+    is selected by a TreeHighestSigned, with the lane number in
+    the lower bits of the compared values, so the tree also
+    returns its index.
+
+    Interfaces
+    ----------
+    input : Data Stream (n_lanes=1) or Matrix Stream (n_lanes,), input
+        Signed input data (scores).
+
+    output : Sparse Stream, output
+        index: position of the highest element in the vector.
+        data: highest element.
+
+    Parameters
+    ----------
+    width : int
+        Bit width of the input data.
+
+    n_inputs : int
+        Maximum length of the vectors (to size the index).
+
+    n_lanes : int
+        Number of elements in each input sample.
+    """
+
+    def __init__(self, width, n_inputs, n_lanes=1):
+        self.width = width
+        self.n_inputs = n_inputs
+        self.n_lanes = n_lanes
+        self.index_w = max(1, ceil(log2(n_inputs)))
+        self.lane_w = max(1, ceil(log2(n_lanes))) if n_lanes > 1 else 0
+        if n_lanes == 1:
+            self.input = DataStream(width=width, direction='sink', name='input')
+        else:
+            self.input = MatrixStream(width=width, shape=(n_lanes,), direction='sink', name='input')
+        self.output = SparseStream(width=width, index_w=self.index_w, direction='source', name='output')
+        self.tree = None
+        if n_lanes > 1:
+            self.tree = TreeHighestSigned(width_i=width + self.lane_w,
+                                          n_stages=self.lane_w,
+                                          reg_in=False,
+                                          reg_out=False)
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        clken = Signal()
+        comb += clken.eq(~self.output.valid | self.output.ready)
+        comb += self.input.ready.eq(clken)
+
+        accepted = self.input.accepted()
+        n_words = int(ceil(self.n_inputs / self.n_lanes))
+
+        # position of the sample in the vector
+        word_cnt = Signal(range(n_words))
+        with m.If(accepted):
+            with m.If(self.input.last):
+                sync += word_cnt.eq(0)
+            with m.Else():
+                sync += word_cnt.eq(_incr(word_cnt, n_words))
+
+        # lanes with the inverted lane number in the lsbs, so the
+        # lowest lane wins when the values are equal
+        packed = [Signal(signed(self.width + self.lane_w), name='packed_' + str(i)) for i in range(self.n_lanes)]
+        with m.If(clken):
+            for i, (p, d) in enumerate(zip(packed, self.input.data_ports)):
+                if self.lane_w > 0:
+                    sync += p.eq(Cat(Const(self.n_lanes - 1 - i, self.lane_w), d))
+                else:
+                    sync += p.eq(d)
+
+        latency = 1
+        if self.tree is None:
+            highest = packed[0]
+        else:
+            m.submodules.tree = tree = self.tree
+            comb += tree.clken.eq(clken)
+            for i, tree_input in enumerate(tree.inputs):
+                if i < self.n_lanes:
+                    comb += tree_input.eq(packed[i])
+                else:
+                    comb += tree_input.eq(Cat(Const(0, self.lane_w), Const(-2**(self.width-1), signed(self.width))))
+            highest = tree.output
+            latency += tree.latency
+
+        c_valid = signal_delay(m, accepted, latency, ce=clken)
+        c_last = signal_delay(m, accepted & self.input.last, latency, ce=clken)
+        c_word = signal_delay(m, word_cnt, latency, ce=clken)
+        c_value = highest[self.lane_w:].as_signed()
+        if self.lane_w > 0:
+            c_index = c_word * self.n_lanes + (self.n_lanes - 1 - highest[0:self.lane_w])
+        else:
+            c_index = c_word
+
+        # highest element of the vector so far
+        best_value = Signal(signed(self.width))
+        best_index = Signal(self.index_w)
+        first = Signal(reset=1)
+        new_value = Signal(signed(self.width))
+        new_index = Signal(self.index_w)
+
+        comb += [new_value.eq(best_value),
+                 new_index.eq(best_index),
+                ]
+        with m.If(first | (c_value > best_value)):
+            comb += [new_value.eq(c_value),
+                     new_index.eq(c_index),
+                    ]
+
+        with m.If(clken):
+            sync += self.output.valid.eq(c_valid & c_last)
+            with m.If(c_valid):
+                sync += [best_value.eq(new_value),
+                         best_index.eq(new_index),
+                         first.eq(c_last),
+                         self.output.index.eq(new_index),
+                         self.output.data.eq(new_value),
+                        ]
+
+        comb += self.output.last.eq(1)
+
+        return m
+
+
+def exp_table(width_i, frac_i, frac_e):
+    """ exp(-d) in fixed point (frac_e fractional bits) for each
+    input difference d, with frac_i fractional bits. The table ends
+    at the first difference that rounds to zero.
+    """
+    table = []
+    for d in range(2**width_i):
+        table.append(int(np.round(np.exp(-d / 2**frac_i) * 2**frac_e)))
+        if table[-1] == 0:
+            break
+    return table
+
+def softmax(x, table, sum_w, width_o, frac_o):
+    """ Reference model of the Softmax core. """
+    top = max(x)
+    e = [table[min(top - xi, len(table) - 1)] for xi in x]
+    recip = 2**(sum_w + frac_o) // sum(e)
+    return [min((ei * recip + 2**(sum_w - 1)) >> sum_w, 2**width_o - 1) for ei in e]
+
+
+class Softmax(Elaboratable):
+    _doc_ = """
+    Softmax of each vector of the input, delimited by the last.
+    The vector is stored in a buffer while its highest element is
+    searched. Then, the buffer is read twice: first to add the
+    exponentials of (x - highest), read from a lookup table, and
+    then to output each exponential multiplied by the reciprocal
+    of the sum. The reciprocal is computed by a sequential divider
+    between both reads (one cycle per bit).
+    The output is an unsigned fixed point number with frac_o
+    fractional bits (saturated to width_o bits), one per clock,
+    with last asserted with the last element of the vector.
+    A new vector is accepted after the previous one is output.
+
+    Interfaces
+    ----------
+    input : Data Stream, input
+        Signed fixed point input data (scores).
+
+    output : Data Stream, output
+        Unsigned fixed point probabilities.
+
+    Parameters
+    ----------
+    width_i : int
+        Bit width of the input data.
+
+    frac_i : int
+        Fractional bits of the input data.
+
+    n_inputs : int
+        Maximum length of the vectors (buffer depth).
+
+    width_o : int
+        Bit width of the output data.
+
+    frac_o : int
+        Fractional bits of the output data. If None, width_o
+        (so 1.0 saturates to the highest value).
+
+    frac_e : int
+        Fractional bits of the exponentials.
+    """
+
+    def __init__(self, width_i, frac_i, n_inputs, width_o=8, frac_o=None, frac_e=16):
+        if frac_o is None:
+            frac_o = width_o
+        self.width_i = width_i
+        self.n_inputs = n_inputs
+        self.width_o = width_o
+        self.frac_o = frac_o
+        self.table = exp_table(width_i, frac_i, frac_e)
+        self.width_e = frac_e + 1
+        self.sum_w = ceil(log2(n_inputs * 2**frac_e + 1))
+        # reciprocal: 2**recip_shift // sum, with sum >= 2**frac_e
+        self.recip_shift = self.sum_w + frac_o
+        self.recip_w = self.recip_shift - frac_e + 1
+        self.buffer = Memory(width=width_i, depth=n_inputs)
+        self.exp_lut = Memory(width=self.width_e, depth=len(self.table), init=self.table)
+        self.input = DataStream(width=width_i, direction='sink', name='input')
+        self.output = DataStream(width=width_o, direction='source', name='output')
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        m.submodules.wr_port = wr_port = self.buffer.write_port()
+        m.submodules.rd_port = rd_port = self.buffer.read_port(domain='sync', transparent=False)
+        m.submodules.exp_port = exp_port = self.exp_lut.read_port(domain='sync', transparent=False)
+
+        clken = Signal()
+        comb += clken.eq(~self.output.valid | self.output.ready)
+
+        length = Signal(range(self.n_inputs + 1))
+        wr_addr = Signal(range(self.n_inputs))
+        rd_addr = Signal(range(self.n_inputs + 1))
+        highest = Signal(signed(self.width_i))
+        first = Signal(reset=1)
+        acc = Signal(self.sum_w)
+        remainder = Signal(self.sum_w + 1)
+        recip = Signal(self.recip_w)
+        bit = Signal(range(self.recip_shift + 1))
+        reading = Signal()
+        output_phase = Signal()
+
+        # buffer --> exp lut --> scaling pipeline
+        issue = Signal()
+        comb += [issue.eq(reading & (rd_addr < length) & clken),
+                 rd_port.addr.eq(rd_addr),
+                 rd_port.en.eq(clken),
+                 exp_port.en.eq(clken),
+                ]
+        with m.If(issue):
+            sync += rd_addr.eq(rd_addr + 1)
+
+        diff = highest - rd_port.data.as_signed()
+        end = len(self.table) - 1
+        comb += exp_port.addr.eq(Mux(diff > end, end, diff))
+
+        e_valid = signal_delay(m, issue, 2, ce=clken)
+        e_last = signal_delay(m, issue & (rd_addr == length - 1), 2, ce=clken)
+        e = exp_port.data
+
+        scaled = (e * recip + 2**(self.sum_w - 1)) >> self.sum_w
+        with m.If(clken):
+            sync += self.output.data.eq(Mux(scaled > 2**self.width_o - 1, 2**self.width_o - 1, scaled))
+        comb += [self.output.valid.eq(signal_delay(m, issue & output_phase, 3, ce=clken)),
+                 self.output.last.eq(signal_delay(m, issue & output_phase & (rd_addr == length - 1), 3, ce=clken)),
+                ]
+
+        # sequential division: 2**recip_shift // acc
+        partial = Cat(bit == self.recip_shift, remainder)
+
+        with m.FSM() as fsm:
+
+            with m.State("LOAD"):
+                comb += [self.input.ready.eq(1),
+                         wr_port.addr.eq(wr_addr),
+                         wr_port.data.eq(self.input.data),
+                         wr_port.en.eq(self.input.accepted()),
+                        ]
+                with m.If(self.input.accepted()):
+                    sync += [wr_addr.eq(_incr(wr_addr, self.n_inputs)),
+                             first.eq(0),
+                            ]
+                    with m.If(first | (self.input.data.as_signed() > highest)):
+                        sync += highest.eq(self.input.data)
+                    with m.If(self.input.last):
+                        m.next = "SUM"
+                        sync += [length.eq(wr_addr + 1),
+                                 wr_addr.eq(0),
+                                 rd_addr.eq(0),
+                                 reading.eq(1),
+                                 acc.eq(0),
+                                ]
+
+            with m.State("SUM"):
+                with m.If(e_valid):
+                    sync += acc.eq(acc + e)
+                with m.If(e_last):
+                    m.next = "DIVIDE"
+                    sync += [reading.eq(0),
+                             remainder.eq(0),
+                             bit.eq(self.recip_shift),
+                            ]
+
+            with m.State("DIVIDE"):
+                with m.If(partial >= acc):
+                    sync += [remainder.eq(partial - acc),
+                             recip.eq(Cat(1, recip)),
+                            ]
+                with m.Else():
+                    sync += [remainder.eq(partial),
+                             recip.eq(Cat(0, recip)),
+                            ]
+                sync += bit.eq(bit - 1)
+                with m.If(bit == 0):
+                    m.next = "OUTPUT"
+                    sync += [rd_addr.eq(0),
+                             reading.eq(1),
+                             output_phase.eq(1),
+                            ]
+
+            with m.State("OUTPUT"):
+                with m.If(self.output.accepted() & self.output.last):
+                    m.next = "LOAD"
+                    sync += [reading.eq(0),
+                             output_phase.eq(0),
+                             first.eq(1),
+                            ]
+
+        return m
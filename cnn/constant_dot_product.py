@@ -0,0 +1,148 @@
+from nmigen import *
+from cnn.interfaces import DataStream, MatrixStream
+from cnn.hdl_utils import signal_delay
+from cnn.tree_operations import TreeAdderSigned
+from cnn.utils.bits import dot_product_bits, signed_range
+
+import numpy as np
+from math import ceil, log2
+
+
+def csd(value):
+    """ Canonical signed digit representation of value, as a list
+    of (shift, sign) with value = sum(sign * 2**shift). It has no
+    two consecutive non zero digits, so it has the minimum number
+    of non zero digits (adders).
+    """
+    digits = []
+    shift = 0
+    while value != 0:
+        if value % 2:
+            sign = 2 - (value % 4) # +1 if value = 1 (mod 4), -1 if value = 3 (mod 4)
+            digits.append((shift, sign))
+            value -= sign
+        value //= 2
+        shift += 1
+    return digits
+
+
+class ConstantDotProduct(Elaboratable):
+    _doc_ = """
+    Dot product of the input matrix with a constant kernel,
+    without multipliers.
+    The taps with the same absolute value are added first
+    (with their sign), so each different coefficient is applied
+    only once, and the zero taps are pruned. Each coefficient
+    is then applied as the canonical signed digit shift-add
+    of its partial sum, and all the terms are added by an adder
+    tree. It takes one input per clock.
+
+    Interfaces
+    ----------
+    input : Matrix Stream, input
+        Input matrix, with the shape of the kernel.
+
+    output : Data Stream, output
+        Dot product of the input with the kernel.
+
+    Parameters
+    ----------
+    width_i : int
+        Bit width of the input data.
+
+    kernel : list or np.array
+        Constant coefficients (integers). The element [i][j] of
+        the kernel multiplies the element (i, j) of the input.
+
+    output_w : int
+        Bit width of the output. If None, the exact width for
+        the kernel and any input of width_i bits is used.
+
+    signed_i : bool
+        If the input data is signed.
+    """
+
+    def __init__(self, width_i, kernel, output_w=None, signed_i=True):
+        kernel = np.array(kernel)
+        self.shape = kernel.shape
+        self.coeffs = [int(c) for c in kernel.flatten()]
+        input_range = signed_range(width_i) if signed_i else (0, 2**width_i - 1)
+        if output_w is None:
+            output_w = dot_product_bits(self.coeffs, input_range)
+        self.width_i = width_i
+        self.signed_i = signed_i
+        self.output_w = output_w
+        self.input = MatrixStream(width=width_i, shape=self.shape, direction='sink', name='input')
+        self.output = DataStream(width=output_w, direction='source', name='output')
+
+        # taps with the same absolute value share the coefficient
+        self.groups = {}
+        for i, c in enumerate(self.coeffs):
+            if c != 0:
+                self.groups.setdefault(abs(c), []).append((i, 1 if c > 0 else -1))
+
+        self.n_terms = max(1, sum([len(csd(c)) for c in self.groups]))
+        self.tree = None
+        self.latency = 2
+        if self.n_terms > 1:
+            self.tree = TreeAdderSigned(width_i=output_w,
+                                        n_stages=int(ceil(log2(self.n_terms))),
+                                        reg_in=False,
+                                        reg_out=False,
+                                        width_o=output_w)
+            self.latency += self.tree.latency
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        clken = Signal()
+        comb += clken.eq(~self.output.valid | self.output.ready)
+        comb += self.input.ready.eq(clken)
+
+        # input register
+        # unsigned data is zero extended, so all the sums are signed
+        data_w = self.width_i + int(not self.signed_i)
+        data = [Signal(signed(data_w), name='data_' + str(i)) for i in range(len(self.coeffs))]
+        with m.If(clken):
+            sync += [d.eq(x) for d, x in zip(data, self.input.data_ports)]
+
+        # signed partial sum of the taps of each coefficient
+        terms = []
+        for c, taps in self.groups.items():
+            partial_sum = Signal(signed(data_w + len(taps)), name='sum_' + str(c))
+            expr = 0
+            for i, sign in taps:
+                expr = expr + data[i] if sign > 0 else expr - data[i]
+            with m.If(clken):
+                sync += partial_sum.eq(expr)
+            for shift, sign in csd(c):
+                term = partial_sum << shift
+                terms.append(term if sign > 0 else -term)
+
+        if len(terms) == 0:
+            terms = [Const(0)]
+
+        if self.tree is None:
+            result = terms[0]
+        else:
+            m.submodules.tree = tree = self.tree
+            comb += tree.clken.eq(clken)
+            for i, tree_input in enumerate(tree.inputs):
+                comb += tree_input.eq(terms[i] if i < len(terms) else 0)
+            result = tree.output
+
+        accepted = self.input.accepted()
+        comb += [self.output.valid.eq(signal_delay(m, accepted, self.latency, ce=clken)),
+                 self.output.last.eq(signal_delay(m, accepted & self.input.last, self.latency, ce=clken)),
+                 self.output.data.eq(result),
+                ]
+
+        return m
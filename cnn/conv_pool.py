@@ -0,0 +1,123 @@
+from nmigen import *
+from cnn.interfaces import DataStream
+from cnn.convolution import Convolution
+from cnn.utils.operations import _incr
+
+
+class ConvPool(Elaboratable):
+    _doc_ = """
+    Convolution followed by a max pooling, without the line
+    buffers of the pooling.
+    The convolution outputs are produced in raster order, so each
+    one is reduced into the partial maximum of its pooling column
+    as soon as it is produced. Only one register per pooling
+    column (conv output width / pool_size) is needed, instead of
+    the pool_size line buffers of the Pooling core, and there is
+    no intermediate full resolution stream.
+    The maximum is signed, as the convolution outputs.
+
+    Interfaces
+    ----------
+    input : Stream, input
+        Input image, where each data is an incomming pixel.
+
+    coeff : Matrix Stream, input
+        Kernel coefficients (see Convolution). Only present if
+        the kernel is not constant.
+
+    output : Data Stream, output
+        Pooled convolution, with last asserted with the last
+        pixel of the image.
+
+    Parameters
+    ----------
+    width : int
+        Bit width of the image data.
+
+    input_shape : tuple
+        Image input shape (rows, columns).
+
+    N : int
+        Kernel size (NxN).
+
+    n_cores : int
+        Number of paralell computations of dot product.
+
+    pool_size : int
+        Pooling window size (pool_size x pool_size, without
+        overlap). The shape of the convolution output must be
+        a multiple of it.
+
+    **kwargs :
+        Other parameters of the Convolution (output_w, kernel,
+        fused output stage, etc).
+    """
+
+    def __init__(self, width, input_shape, N, n_cores, pool_size, **kwargs):
+        self.convolution = Convolution(width, input_shape, N, n_cores, **kwargs)
+        conv_shape = (input_shape[0] + 1 - N, input_shape[1] + 1 - N)
+        assert conv_shape[0] % pool_size == 0 and conv_shape[1] % pool_size == 0, (
+            f'convolution output shape {conv_shape} must be a multiple of {pool_size}')
+        self.conv_shape = conv_shape
+        self.pool_size = pool_size
+        self.output_shape = (conv_shape[0] // pool_size, conv_shape[1] // pool_size)
+        self.input = self.convolution.input
+        if self.convolution.kernel is None:
+            self.coeff = self.convolution.coeff
+        self.output_w = self.convolution.output_w
+        self.output = DataStream(width=self.output_w, direction='source', name='output')
+        self.N = N
+
+    def get_ports(self):
+        ports = [self.input[f] for f in self.input.fields]
+        if self.convolution.kernel is None:
+            ports += [self.coeff[f] for f in self.coeff.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        m.submodules.convolution = convolution = self.convolution
+        conv = convolution.output
+        P = self.pool_size
+        n_rows, n_cols = self.output_shape
+
+        clken = Signal()
+        comb += clken.eq(~self.output.valid | self.output.ready)
+        comb += conv.ready.eq(clken)
+
+        # position of the convolution output
+        col_in_pool = Signal(range(P))
+        row_in_pool = Signal(range(P))
+        pool_col = Signal(range(n_cols))
+        pool_row = Signal(range(n_rows))
+
+        with m.If(conv.accepted()):
+            sync += col_in_pool.eq(_incr(col_in_pool, P))
+            with m.If(col_in_pool == P - 1):
+                sync += pool_col.eq(_incr(pool_col, n_cols))
+                with m.If(pool_col == n_cols - 1):
+                    sync += row_in_pool.eq(_incr(row_in_pool, P))
+                    with m.If(row_in_pool == P - 1):
+                        sync += pool_row.eq(_incr(pool_row, n_rows))
+
+        # partial maximum of each pooling column
+        partial = Array([Signal(signed(self.output_w), name='partial_' + str(i)) for i in range(n_cols)])
+        data = conv.data.as_signed()
+        start = (row_in_pool == 0) & (col_in_pool == 0)
+        end = (row_in_pool == P - 1) & (col_in_pool == P - 1)
+        highest = Signal(signed(self.output_w))
+        comb += highest.eq(Mux(start | (data > partial[pool_col]), data, partial[pool_col]))
+
+        with m.If(clken):
+            sync += self.output.valid.eq(conv.accepted() & end)
+            with m.If(conv.accepted()):
+                sync += [partial[pool_col].eq(highest),
+                         self.output.data.eq(highest),
+                         self.output.last.eq((pool_row == n_rows - 1) & (pool_col == n_cols - 1)),
+                        ]
+
+        return m
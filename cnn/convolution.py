@@ -2,6 +2,10 @@ from nmigen import *
 from cnn.interfaces import MatrixStream, DataStream
 from cnn.matrix_feeder import MatrixFeeder
 from cnn.farm import Farm
+from cnn.constant_dot_product import ConstantDotProduct
+from cnn.hdl_utils import Pipeline, signal_delay
+from cnn.relu import _relu
+from cnn.requantize import requantize_stages
 
 class Convolution(Elaboratable):
     _doc_ = """
@@ -13,14 +17,16 @@ class Convolution(Elaboratable):
         Input image, where each data is an incomming pixel.
 
     coeff : Matrix Stream, input
-        Kernel coefficients.
+        Kernel coefficients. Only present if the kernel is not
+        constant.
         TO DO: should not be a stream, but plain "matrix shaped" values.
 
 
     Parameters
     ----------
     width : int
-        Bit width of both the image data and kernel coefficients.
+        Bit width of the image data (and of the kernel
+        coefficients, if width_coeff is None).
 
     input_shape : tuple
         Image input shape (rows, columns).
@@ -30,34 +36,129 @@ class Convolution(Elaboratable):
 
     n_cores : int
         Number of paralell computations of dot product.
+
+    output_w : int
+        Bit width of the output. See Farm.
+
+    kernel : list or np.array
+        Constant NxN kernel. If given, there is no coeff
+        interface, and the kernel is applied by a Constant Dot
+        Product (shift-add network, without multipliers) instead
+        of a Farm, so n_cores is ignored.
+
+    width_coeff : int
+        Bit width of the kernel coefficients. If None, same as
+        width.
+
+    signed_data : bool
+        If the image data is signed.
+
+    signed_coeff : bool
+        If the kernel coefficients are signed.
+
+    log_exp_w : int
+        If not None, the coefficients are power of two weight
+        codes (see cnn.log_quant), applied with shifts instead
+        of multipliers. Ignored with a constant kernel.
+
+    Fused output stage
+    ------------------
+    The dot products can go through an output pipeline (with a
+    single handshake) instead of chaining Relu and Requantizer
+    cores after the convolution:
+        output = requantize(relu(dot + bias << bias_shift))
+    Each operation is only present if its parameters are given.
+    The stages are not folded into the output registers of the
+    Farm (or Constant Dot Product): they are a pipeline after
+    its output, with its own clock enable, which adds 1 clock
+    of latency for the bias, 1 for the ReLu and 3 for the
+    requantization (see output_latency). The requantization is
+    the same as in the Requantizer (see requantize_stages()).
+
+    bias : int
+        Bias added to the dot products (in the accumulator width,
+        so output_w has to fit it). None for no bias.
+
+    bias_shift : int
+        Fixed point scale of the bias in the accumulator.
+
+    relu_leak : int
+        Leak of the ReLu (see Relu), relative to the accumulator
+        width. None for no activation.
+
+    multiplier : int
+        Multiplier to requantize the output (see Requantizer).
+        None to output the accumulator.
+
+    shift : int
+        The product by the multiplier will be shifted to the
+        right by this number.
+
+    zero_point : int
+        Offset added after the scaling.
+
+    width_act : int
+        Bit width of the requantized output (saturated).
     """
     
-    def __init__(self, width, input_shape, N, n_cores):
+    def __init__(self, width, input_shape, N, n_cores, output_w=None, kernel=None, width_coeff=None, signed_data=True, signed_coeff=True, log_exp_w=None,
+                 bias=None, bias_shift=0, relu_leak=None, multiplier=None, shift=0, zero_point=0, width_act=None):
         self.input_shape = input_shape
         self.n_cores = n_cores
+        self.kernel = kernel
         self.matrix_feeder = MatrixFeeder(data_w=width,
                                           input_shape=input_shape,
                                           N=N,
                                           invert=False)
-        self.farm = Farm(width=width,
-                         shape=(N, N),
-                         n_cores=n_cores)
-        self.coeff = MatrixStream(width=width, shape=(N, N), direction='sink', name='coeff')
+        if kernel is None:
+            self.farm = Farm(width=width,
+                             shape=(N, N),
+                             n_cores=n_cores,
+                             output_w=output_w,
+                             width_coeff=width_coeff,
+                             signed_data=signed_data,
+                             signed_coeff=signed_coeff,
+                             log_exp_w=log_exp_w)
+            self.coeff = MatrixStream(width=self.farm.input_b.dataport.width, shape=(N, N), direction='sink', name='coeff')
+            output_w = len(self.farm.output.data)
+        else:
+            self.dot_product = ConstantDotProduct(width_i=width,
+                                                  kernel=kernel,
+                                                  output_w=output_w,
+                                                  signed_i=signed_data)
+            assert self.dot_product.shape == (N, N), f'{self.dot_product.shape} != {(N, N)}'
+            output_w = len(self.dot_product.output.data)
+        self.acc_w = output_w
+        self.bias = bias
+        self.bias_shift = bias_shift
+        self.relu_leak = relu_leak
+        self.multiplier = multiplier
+        self.shift = shift
+        self.zero_point = zero_point
+        self.output_latency = ((bias is not None) + (relu_leak is not None)
+                               + 3 * (multiplier is not None))
+        if multiplier is not None:
+            assert width_act is not None, 'width_act is required to requantize'
+            output_w = width_act
         self.input = DataStream(width=width, direction='sink', name='input')
-        self.output = DataStream(width=len(self.farm.output.data), direction='source', name='output')
+        self.output = DataStream(width=output_w, direction='source', name='output')
         self.input_w = len(self.input.data)
         self.output_w = len(self.output.data)
-        self.shape = self.coeff.dataport.shape
-        self.N = self.coeff.dataport.shape[0]
+        self.shape = (N, N)
+        self.N = N
 
     def get_ports(self):
         ports = [self.input[f] for f in self.input.fields]
-        ports += [self.coeff[f] for f in self.coeff.fields]
+        if self.kernel is None:
+            ports += [self.coeff[f] for f in self.coeff.fields]
         ports += [self.output[f] for f in self.output.fields]
         return ports
 
 
     def elaborate(self, platform):
+        if self.kernel is not None:
+            return self.elaborate_constant(platform)
+
         m = Module()
         sync = m.d.sync
         comb = m.d.comb
@@ -87,11 +188,65 @@ class Convolution(Elaboratable):
                 ]
 
         # farm --> output
-        comb += [self.output.valid.eq(farm.output.valid),
-                 self.output.last.eq(farm.output.last),
-                 self.output.data.eq(farm.output.data),
-                 farm.output.ready.eq(self.output.ready),
+        self.elaborate_output(m, farm.output)
+
+        return m
+
+    def elaborate_constant(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        m.submodules.matrix_feeder = matrix_feeder = self.matrix_feeder
+        m.submodules.dot_product = dot_product = self.dot_product
+
+        # input --> matrix feeder
+        comb += [matrix_feeder.input.valid.eq(self.input.valid),
+                 matrix_feeder.input.last.eq(self.input.last),
+                 matrix_feeder.input.data.eq(self.input.data),
+                 self.input.ready.eq(matrix_feeder.input.ready),
+                ]
+
+        # matrix feeder --> constant dot product
+        comb += [dot_product.input.valid.eq(matrix_feeder.output.valid),
+                 dot_product.input.last.eq(matrix_feeder.output.last),
+                 dot_product.input.dataport.eq(matrix_feeder.output.dataport),
+                 matrix_feeder.output.ready.eq(dot_product.input.ready)
                 ]
 
+        # constant dot product --> output
+        self.elaborate_output(m, dot_product.output)
+
         return m
 
+    def elaborate_output(self, m, source):
+        # fused bias, relu and requantize stages
+        sync = m.d.sync
+        comb = m.d.comb
+
+        pipeline = Pipeline()
+        x = source.data.as_signed()
+        if self.bias is not None:
+            x, = pipeline.add_stage( [(x + (self.bias << self.bias_shift))[0:self.acc_w].as_signed()] )
+        if self.relu_leak is not None:
+            x, = pipeline.add_stage( [_relu(x, self.relu_leak)] )
+        if self.multiplier is not None:
+            x = requantize_stages(pipeline, x, self.multiplier, self.shift, self.output_w, self.zero_point)
+
+        if pipeline.latency == 0:
+            comb += [self.output.valid.eq(source.valid),
+                     self.output.last.eq(source.last),
+                     self.output.data.eq(source.data),
+                     source.ready.eq(self.output.ready),
+                    ]
+            return
+
+        clken = Signal()
+        comb += clken.eq(~self.output.valid | self.output.ready)
+        comb += source.ready.eq(clken)
+        pipeline.generate(m=m, ce=clken, domain='sync')
+
+        comb += [self.output.valid.eq(signal_delay(m, source.accepted(), pipeline.latency, ce=clken)),
+                 self.output.last.eq(signal_delay(m, source.accepted() & source.last, pipeline.latency, ce=clken)),
+                 self.output.data.eq(x),
+                ]
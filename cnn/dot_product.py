@@ -1,13 +1,15 @@
 from nmigen import *
-from cnn.mac import MAC
-from cnn.utils.bits import required_bits
+from cnn.mac import MAC, DualMAC
+from cnn.utils.bits import required_bits, range_required_bits, signed_range
 from cnn.interfaces import DataStream, MatrixStream
+from cnn.log_quant import log_code_width, log_product_width
 
-def calculate_output_width(width_i, n_inputs):
-    worst_value = -2**(width_i - 1)
-    worst_mult = worst_value ** 2
-    worst_result = worst_mult * n_inputs
-    return required_bits(worst_result)
+def calculate_output_width(width_i, n_inputs, width_c=None, signed_i=True, signed_c=True):
+    if width_c is None:
+        width_c = width_i
+    _range = lambda width, is_signed: signed_range(width) if is_signed else (0, 2**width - 1)
+    products = [a * b for a in _range(width_i, signed_i) for b in _range(width_c, signed_c)]
+    return range_required_bits(min(products) * n_inputs, max(products) * n_inputs)
 
 class DotProduct(Elaboratable):
     #
@@ -20,12 +22,38 @@ class DotProduct(Elaboratable):
     # Why?
     # I want to avoid a combinational path between the valid of input_b and the ready of input_a.
     #
-    def __init__(self, width_i, shape):
+    # output_w: accumulator and output width. By default, the worst case for
+    # any coefficients. With known coefficients, it can be reduced to
+    # dot_product_bits(coeffs, input_range) (see cnn.utils.bits).
+    #
+    # width_coeff: bit width of input_b (same as input_a by default).
+    # signed_data, signed_coeff: signedness of input_a and input_b.
+    #
+    # log_exp_w: if not None, input_b are power of two weight codes of
+    # log_code_width(log_exp_w) bits (see cnn.log_quant), and the MAC
+    # uses a barrel shifter instead of a multiplier. width_coeff and
+    # signed_coeff are ignored.
+    #
+    def __init__(self, width_i, shape, output_w=None, width_coeff=None, signed_data=True, signed_coeff=True, log_exp_w=None):
+        if log_exp_w is not None:
+            width_coeff = log_code_width(log_exp_w)
+            signed_coeff = False
+        if width_coeff is None:
+            width_coeff = width_i
         self.input_a = MatrixStream(width=width_i, shape=shape, direction='sink', name='input_a')
-        self.input_b = MatrixStream(width=width_i, shape=shape, direction='sink', name='input_b')
+        self.input_b = MatrixStream(width=width_coeff, shape=shape, direction='sink', name='input_b')
         self.input_w = self.input_a.dataport.width
+        self.coeff_w = self.input_b.dataport.width
+        self.signed_data = signed_data
+        self.signed_coeff = signed_coeff
+        self.log_exp_w = log_exp_w
         self.n_inputs = self.input_a.dataport.n_elements
-        self.output_w = calculate_output_width(self.input_w, self.n_inputs)
+        if output_w is None and log_exp_w is not None:
+            output_w = log_product_width(self.input_w, log_exp_w, signed_data, self.n_inputs)
+        if output_w is None:
+            output_w = calculate_output_width(self.input_w, self.n_inputs, self.coeff_w,
+                                              signed_data, signed_coeff)
+        self.output_w = output_w
         self.output = DataStream(self.output_w, direction='source', name='output')
         self.shape = self.input_a.dataport.shape
 
@@ -42,12 +70,17 @@ class DotProduct(Elaboratable):
         comb = m.d.comb
 
         tmp_input_a = Signal(self.input_w * self.n_inputs)
-        tmp_input_b = Signal(self.input_w * self.n_inputs)
+        tmp_input_b = Signal(self.coeff_w * self.n_inputs)
         counter = Signal(range(self.n_inputs))
         
-        m.submodules['mac'] = mac = MAC(input_w=self.input_w, output_w=self.output_w)
+        m.submodules['mac'] = mac = MAC(input_w=self.input_w,
+                                        output_w=self.output_w,
+                                        input_b_w=self.coeff_w,
+                                        signed_a=self.signed_data,
+                                        signed_b=self.signed_coeff,
+                                        log_exp_w=self.log_exp_w)
         comb += [mac.input_a.eq(tmp_input_a[0:self.input_w]),
-                 mac.input_b.eq(tmp_input_b[0:self.input_w]),]
+                 mac.input_b.eq(tmp_input_b[0:self.coeff_w]),]
         
         # DUMMY input_b interface
         comb += [self.input_b.ready.eq(self.input_a.accepted())]
@@ -75,7 +108,7 @@ class DotProduct(Elaboratable):
                          mac.clr.eq(0),
                          mac.clken.eq(1),]
             
-                sync += [tmp_input_b.eq(tmp_input_b >> self.input_w),
+                sync += [tmp_input_b.eq(tmp_input_b >> self.coeff_w),
                          tmp_input_a.eq(tmp_input_a >> self.input_w),]
             
                 with m.If(mac.valid_o):
@@ -86,3 +119,88 @@ class DotProduct(Elaboratable):
                                  self.output.valid.eq(1),]
 
         return m
+
+
+class DualDotProduct(DotProduct):
+    #
+    # Dot product of input_a with two coefficient matrixes (two filters),
+    # with a DualMAC, so both products share a single multiplier:
+    #   output[0] = input_a . input_b
+    #   output[1] = input_a . input_c
+    #
+    # input_b and input_c are DUMMY interfaces, same as input_b in the
+    # DotProduct.
+    #
+    def __init__(self, width_i, shape, output_w=None, width_coeff=None, signed_data=True, signed_coeff=True):
+        DotProduct.__init__(self, width_i, shape, output_w, width_coeff, signed_data, signed_coeff)
+        self.input_c = MatrixStream(width=self.coeff_w, shape=shape, direction='sink', name='input_c')
+        self.output = MatrixStream(width=self.output_w, shape=(2,), direction='source', name='output')
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input_a[f] for f in self.input_a.fields]
+        ports += [self.input_b[f] for f in self.input_b.fields]
+        ports += [self.input_c[f] for f in self.input_c.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        tmp_input_a = Signal(self.input_w * self.n_inputs)
+        tmp_input_b = Signal(self.coeff_w * self.n_inputs)
+        tmp_input_c = Signal(self.coeff_w * self.n_inputs)
+        counter = Signal(range(self.n_inputs))
+
+        m.submodules['mac'] = mac = DualMAC(input_w=self.input_w,
+                                            output_w=self.output_w,
+                                            input_b_w=self.coeff_w,
+                                            signed_a=self.signed_data,
+                                            signed_b=self.signed_coeff)
+        comb += [mac.input_a.eq(tmp_input_a[0:self.input_w]),
+                 mac.input_b_0.eq(tmp_input_b[0:self.coeff_w]),
+                 mac.input_b_1.eq(tmp_input_c[0:self.coeff_w]),]
+
+        # DUMMY input_b and input_c interfaces
+        comb += [self.input_b.ready.eq(self.input_a.accepted()),
+                 self.input_c.ready.eq(self.input_a.accepted()),]
+
+        with m.FSM() as fsm:
+
+            with m.State("IDLE"):
+
+                comb += [self.input_a.ready.eq(self.output.accepted() | ~self.output.valid),
+                         mac.clr.eq(1),
+                         mac.clken.eq(0),]
+
+                with m.If(self.input_a.accepted()):
+                    m.next = "BUSY"
+                    sync += [tmp_input_a.eq(Cat(*self.input_a.flat)),
+                             tmp_input_b.eq(Cat(*self.input_b.flat)),
+                             tmp_input_c.eq(Cat(*self.input_c.flat)),
+                             counter.eq(0),]
+
+                with m.If(self.output.accepted()):
+                    sync += self.output.valid.eq(0)
+
+            with m.State("BUSY"):
+
+                comb += [self.input_a.ready.eq(0),
+                         mac.clr.eq(0),
+                         mac.clken.eq(1),]
+
+                sync += [tmp_input_c.eq(tmp_input_c >> self.coeff_w),
+                         tmp_input_b.eq(tmp_input_b >> self.coeff_w),
+                         tmp_input_a.eq(tmp_input_a >> self.input_w),]
+
+                with m.If(mac.valid_o):
+                    sync += counter.eq(counter + 1)
+                    with m.If(counter == self.n_inputs - 1):
+                        m.next = "IDLE"
+                        sync += [self.output.dataport.matrix[0].eq(mac.output_0),
+                                 self.output.dataport.matrix[1].eq(mac.output_1),
+                                 self.output.valid.eq(1),]
+
+        return m
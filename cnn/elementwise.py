@@ -0,0 +1,120 @@
+from nmigen import *
+from nmigen.lib.fifo import SyncFIFOBuffered
+from cnn.interfaces import DataStream
+from cnn.stream_utils import min_fifo_depth
+
+
+def skip_fifo_depth(*path, margin=2):
+    """ Depth of the skip path FIFO of a residual connection, so
+    it can hold every sample in flight in the main path. Each
+    element of the path is a core with a latency attribute
+    (StreamWrapper, StreamMacc, TreeOperation, Requantizer, etc)
+    or an int, for the extra samples buffered by a core (as the
+    line buffers of a convolution). The margin covers the output
+    register of the Elementwise Add. The result is never lower
+    than the minimum depth of the FIFO at full rate (3).
+    """
+    depth = margin
+    for core in path:
+        depth += core if isinstance(core, int) else core.latency
+    return max(depth, min_fifo_depth)
+
+
+class ElementwiseAdd(Elaboratable):
+    _doc_ = """
+    Elementwise addition of two streams (as the residual connection
+    of a ResNet), saturated to the output width.
+    A sample is output when both inputs have a valid sample (join
+    handshake). The last of the output is the last of input_a.
+    input_b is usually the skip path, which arrives before the
+    main path (input_a). It can be buffered by an internal FIFO,
+    so the samples in flight in the main path don't stall the
+    source of both paths (and never deadlock the join). See
+    skip_fifo_depth() to size it.
+
+    Interfaces
+    ----------
+    input_a : Data Stream, input
+        Main path (signed).
+
+    input_b : Data Stream, input
+        Skip path (signed).
+
+    output : Data Stream, output
+        Saturated sum.
+
+    Parameters
+    ----------
+    width_a : int
+        Bit width of input_a.
+
+    width_b : int
+        Bit width of input_b. If None, same as width_a.
+
+    width_o : int
+        Bit width of the output. If None, same as width_a.
+
+    skip_depth : int
+        Depth of the FIFO of input_b. 0 for no FIFO, otherwise at
+        least 3.
+    """
+
+    def __init__(self, width_a, width_b=None, width_o=None, skip_depth=0):
+        if width_b is None:
+            width_b = width_a
+        if width_o is None:
+            width_o = width_a
+        assert skip_depth == 0 or skip_depth >= min_fifo_depth, (
+            f'skip_depth must be 0 or at least {min_fifo_depth} (got {skip_depth})')
+        self.width_o = width_o
+        self.skip_depth = skip_depth
+        self.input_a = DataStream(width=width_a, direction='sink', name='input_a')
+        self.input_b = DataStream(width=width_b, direction='sink', name='input_b')
+        self.output = DataStream(width=width_o, direction='source', name='output')
+        self.latency = 1
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input_a[f] for f in self.input_a.fields]
+        ports += [self.input_b[f] for f in self.input_b.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        _min, _max = -2**(self.width_o-1), 2**(self.width_o-1)-1
+
+        # skip path
+        if self.skip_depth > 0:
+            m.submodules.fifo = fifo = SyncFIFOBuffered(width=len(self.input_b.data), depth=self.skip_depth)
+            comb += [fifo.w_data.eq(self.input_b.data),
+                     fifo.w_en.eq(self.input_b.valid),
+                     self.input_b.ready.eq(fifo.w_rdy),
+                    ]
+            b_valid = fifo.r_rdy
+            b_data = fifo.r_data
+            b_ready = fifo.r_en
+        else:
+            b_valid = self.input_b.valid
+            b_data = self.input_b.data
+            b_ready = self.input_b.ready
+
+        clken = Signal()
+        join = Signal()
+        comb += [clken.eq(~self.output.valid | self.output.ready),
+                 join.eq(self.input_a.valid & b_valid),
+                 self.input_a.ready.eq(clken & b_valid),
+                 b_ready.eq(clken & self.input_a.valid),
+                ]
+
+        result = self.input_a.data.as_signed() + b_data.as_signed()
+        with m.If(clken):
+            sync += [self.output.valid.eq(join),
+                     self.output.last.eq(self.input_a.last),
+                     self.output.data.eq(Mux(result > _max, _max, Mux(result < _min, _min, result))),
+                    ]
+
+        return m
@@ -38,19 +38,39 @@ class Farm(Elaboratable):
     Parameters
     ----------
     width : int
-        Bit width of both inputs.
+        Bit width of input_a (data).
 
     shape : tuple
         Input shape (N, M).
 
     n_cores : int
         Number of paralell computations of dot product.
+
+    output_w : int
+        Bit width of the accumulators and the output. If None,
+        the worst case for any coefficients is used. With known
+        coefficients, dot_product_bits() (cnn.utils.bits) gives
+        the tight width.
+
+    width_coeff : int
+        Bit width of input_b (coefficients). If None, same as width.
+
+    signed_data : bool
+        If input_a is signed.
+
+    signed_coeff : bool
+        If input_b is signed.
+
+    log_exp_w : int
+        If not None, input_b are power of two weight codes
+        (see cnn.log_quant), and the dot products are computed
+        with shifts instead of multipliers.
     """
 
-    def __init__(self, width, shape, n_cores):
-        self.cores = [DotProduct(width, shape) for _ in range(n_cores)]
+    def __init__(self, width, shape, n_cores, output_w=None, width_coeff=None, signed_data=True, signed_coeff=True, log_exp_w=None):
+        self.cores = [DotProduct(width, shape, output_w, width_coeff, signed_data, signed_coeff, log_exp_w) for _ in range(n_cores)]
         self.input_a = MatrixStream(width=width, shape=shape, direction='sink', name='input_a')
-        self.input_b = MatrixStream(width=width, shape=shape, direction='sink', name='input_b')
+        self.input_b = MatrixStream(width=self.cores[0].coeff_w, shape=shape, direction='sink', name='input_b')
         self.output_w = self.cores[0].output_w
         self.output = DataStream(self.output_w, direction='source', name='output')
         self.input_w = self.input_a.dataport.width    
@@ -28,8 +28,8 @@ def signal_delay(m, signal, latency, ce=None, domain='sync'):
     if ce is None:
         ce = Const(1)
     shift_reg = Array([Signal.like(signal) for _ in range(latency)])
-    m.d[domain] += shift_reg[0].eq(signal)
     with m.If(ce):
+        m.d[domain] += shift_reg[0].eq(signal)
         for prv, nxt in zip(shift_reg[:-1], shift_reg[1:]):
             m.d[domain] += nxt.eq(prv)
     return shift_reg[-1]
\ No newline at end of file
@@ -41,6 +41,23 @@ class ComplexPort(Record):
         self.direction = direction
 
 
+class SparsePort(Record):
+
+    def __init__(self, width, index_w, direction=None, layout=None, name=None, fields=None):
+        _d = _data_dir[direction]
+        if layout is None:
+            layout = []
+        layout += [
+            ('index', index_w, _d),
+            ('data', width, _d),
+        ]
+        Record.__init__(self, layout, name=name, fields=fields)
+        self.flat = Cat(*[self.index, self.data])
+        self.width = len(self.data)
+        self.index_w = len(self.index)
+        self.direction = direction
+
+
 def flat_idx(idx, shape):
     assert len(idx) == len(shape), f'{len(idx)} != {len(shape)}'
     for i, s in zip(idx, shape):
@@ -156,3 +173,17 @@ def MatrixStream(*args, **kwargs):
     dataport = MatrixPort(*args, **kwargs)
     return Stream(dataport=dataport)
 
+def SparseStream(*args, **kwargs):
+    dataport = SparsePort(*args, **kwargs)
+    return Stream(dataport=dataport)
+
+def clone_stream(stream, direction, name=None):
+    """ New stream with the same data layout as stream. """
+    dataport = stream.dataport
+    if isinstance(dataport, MatrixPort):
+        return MatrixStream(dataport.width, dataport.shape, direction=direction, name=name)
+    if isinstance(dataport, SparsePort):
+        return SparseStream(dataport.width, dataport.index_w, direction=direction, name=name)
+    if isinstance(dataport, ComplexPort):
+        return ComplexStream(dataport.real.shape(), direction=direction, name=name)
+    return DataStream(dataport.width, direction=direction, name=name)
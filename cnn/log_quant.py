@@ -0,0 +1,65 @@
+from nmigen import *
+from cnn.utils.bits import range_required_bits, signed_range
+
+import numpy as np
+
+#
+# Logarithmic (power of two) weights.
+#
+# Each weight is coded in (exp_w + 2) bits:
+#   code[0:exp_w]   exponent
+#   code[exp_w]     sign (1 = negative)
+#   code[exp_w+1]   zero (1 = the weight is 0)
+# so the weight is 0 or (+/-)2**exponent, and the product by the
+# weight is a shift of the data (no multipliers).
+#
+
+
+def log_code_width(exp_w):
+    return exp_w + 2
+
+def log_max_exponent(exp_w):
+    return 2**exp_w - 1
+
+def log_quantize(weights, exp_w):
+    """ Quantizes the weights to the nearest power of two (in the log
+    domain), and returns the codes as a numpy array. The weights below
+    2**-0.5 in absolute value are quantized to zero.
+    """
+    weights = np.array(weights, dtype=float)
+    max_exp = log_max_exponent(exp_w)
+    magnitude = np.abs(weights)
+    zero = magnitude < 2**-0.5
+    exponent = np.round(np.log2(np.where(zero, 1, magnitude)))
+    exponent = np.clip(exponent, 0, max_exp).astype(int)
+    sign = (weights < 0).astype(int)
+    return exponent | (sign << exp_w) | (zero.astype(int) << (exp_w + 1))
+
+def log_decode(codes, exp_w):
+    """ Integer value of each code. """
+    codes = np.array(codes, dtype=int)
+    exponent = codes & log_max_exponent(exp_w)
+    sign = (codes >> exp_w) & 1
+    zero = (codes >> (exp_w + 1)) & 1
+    value = np.left_shift(1, exponent) * (1 - 2 * sign)
+    return np.where(zero == 1, 0, value)
+
+def log_dot(x, codes, exp_w):
+    """ Reference dot product of the data x with the coded weights. """
+    return int(np.sum(np.array(x, dtype=object) * log_decode(codes, exp_w).astype(object)))
+
+def log_product_width(width_x, exp_w, signed_x=True, n_inputs=1):
+    """ Signed bit width of the product of width_x bits data with a
+    coded weight (or of the sum of n_inputs products).
+    """
+    low, high = signed_range(width_x) if signed_x else (0, 2**width_x - 1)
+    w_max = 2**log_max_exponent(exp_w)
+    bound = max(abs(low), abs(high)) * w_max * n_inputs
+    return range_required_bits(-bound, bound)
+
+def log_product(x, code, exp_w):
+    """ x * weight, as a barrel shifter. x must have its signedness
+    (Signal or Value with the right shape).
+    """
+    shifted = x << code[0:exp_w]
+    return Mux(code[exp_w + 1], 0, Mux(code[exp_w], -shifted, shifted))
@@ -1,11 +1,25 @@
 from nmigen import *
+from cnn.log_quant import log_code_width, log_product, log_product_width
 
 class MAC(Elaboratable):
-    def __init__(self, input_w, output_w):
+    # input_b_w: bit width of input_b (same as input_a by default).
+    # signed_a, signed_b: signedness of each input.
+    # log_exp_w: if not None, input_b is a power of two weight code
+    # (see cnn.log_quant), and the multiplier is a barrel shifter.
+    def __init__(self, input_w, output_w, input_b_w=None, signed_a=True, signed_b=True, log_exp_w=None):
+        if log_exp_w is not None:
+            input_b_w = log_code_width(log_exp_w)
+            signed_b = False
+        if input_b_w is None:
+            input_b_w = input_w
         self.input_w = input_w
+        self.input_b_w = input_b_w
         self.output_w = output_w
+        self.signed_a = signed_a
+        self.signed_b = signed_b
+        self.log_exp_w = log_exp_w
         self.input_a = Signal(self.input_w)
-        self.input_b = Signal(self.input_w)
+        self.input_b = Signal(self.input_b_w)
         self.clken = Signal()
         self.clr = Signal()
         self.output = Signal(self.output_w)
@@ -20,14 +34,22 @@ class MAC(Elaboratable):
         comb = m.d.comb
         
         clken_reg = Signal()
-        input_a_reg = Signal(signed(self.input_w))
-        input_b_reg = Signal(signed(self.input_w))
-        mult = Signal(signed(int(2 * self.input_w + 1)))
+        input_a_reg = Signal(Shape(self.input_w, self.signed_a))
+        input_b_reg = Signal(Shape(self.input_b_w, self.signed_b))
+        # the product of two unsigned inputs needs one more bit to be signed
+        mult_w = self.input_w + self.input_b_w + int(not (self.signed_a or self.signed_b))
+        if self.log_exp_w is not None:
+            mult_w = log_product_width(self.input_w, self.log_exp_w, self.signed_a)
+        mult = Signal(signed(mult_w))
         accumulator = Signal(signed(self.output_w))
         valid_o = Signal()
 
+        if self.log_exp_w is None:
+            comb += mult.eq(input_a_reg * input_b_reg)
+        else:
+            comb += mult.eq(log_product(input_a_reg, input_b_reg, self.log_exp_w))
 
-        comb += [mult.eq(input_a_reg * input_b_reg),
+        comb += [
                  self.output.eq(accumulator),
                  self.valid_o.eq(valid_o),
                 ]
@@ -48,3 +70,86 @@ class MAC(Elaboratable):
                     ]
 
         return m
+
+
+class DualMAC(Elaboratable):
+    # Two MACs sharing input_a, with a single multiplier:
+    #   output_0 += input_a * input_b_0
+    #   output_1 += input_a * input_b_1
+    # Both coefficients are packed in one operand, as
+    # (input_b_1 << S) + input_b_0, where S is the width of one
+    # product, so a * packed = (a * b_1 << S) + a * b_0. The lower
+    # S bits are the first product, and the upper bits are the second
+    # one, corrected by the borrow of the first product sign.
+    # With 8 bit inputs, the multiplier is 8 x 25 bits, which fits in
+    # a single DSP slice.
+    def __init__(self, input_w, output_w, input_b_w=None, signed_a=True, signed_b=True):
+        if input_b_w is None:
+            input_b_w = input_w
+        self.input_w = input_w
+        self.input_b_w = input_b_w
+        self.output_w = output_w
+        self.signed_a = signed_a
+        self.signed_b = signed_b
+        self.input_a = Signal(self.input_w)
+        self.input_b_0 = Signal(self.input_b_w)
+        self.input_b_1 = Signal(self.input_b_w)
+        self.clken = Signal()
+        self.clr = Signal()
+        self.output_0 = Signal(self.output_w)
+        self.output_1 = Signal(self.output_w)
+        self.valid_o = Signal()
+        # the product of two unsigned inputs needs one more bit to be signed
+        self.product_w = self.input_w + self.input_b_w + int(not (self.signed_a or self.signed_b))
+
+    def get_ports(self):
+        return [self.input_a, self.input_b_0, self.input_b_1, self.clken, self.clr,
+                self.output_0, self.output_1, self.valid_o]
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        S = self.product_w
+
+        clken_reg = Signal()
+        input_a_reg = Signal(Shape(self.input_w, self.signed_a))
+        input_b_0 = Signal(Shape(self.input_b_w, self.signed_b))
+        input_b_1 = Signal(Shape(self.input_b_w, self.signed_b))
+        packed_b_reg = Signal(signed(S + self.input_b_w + 1))
+        mult = Signal(signed(len(packed_b_reg) + self.input_w + 1))
+        product_0 = Signal(signed(S))
+        product_1 = Signal(signed(S))
+        accumulator_0 = Signal(signed(self.output_w))
+        accumulator_1 = Signal(signed(self.output_w))
+        valid_o = Signal()
+
+        comb += [input_b_0.eq(self.input_b_0),
+                 input_b_1.eq(self.input_b_1),
+                 mult.eq(input_a_reg * packed_b_reg),
+                 product_0.eq(mult[0:S]),
+                 product_1.eq(mult[S:].as_signed() + mult[S-1]),
+                 self.output_0.eq(accumulator_0),
+                 self.output_1.eq(accumulator_1),
+                 self.valid_o.eq(valid_o),
+                ]
+
+        with m.If(self.clr):
+            sync += [input_a_reg.eq(0),
+                     packed_b_reg.eq(0),
+                     clken_reg.eq(0),
+                     accumulator_0.eq(0),
+                     accumulator_1.eq(0),
+                     valid_o.eq(0),
+                    ]
+        with m.Elif(self.clken):
+            sync += [input_a_reg.eq(self.input_a),
+                     packed_b_reg.eq((input_b_1 << S) + input_b_0),
+                     clken_reg.eq(self.clken),
+                     accumulator_0.eq(accumulator_0 + product_0),
+                     accumulator_1.eq(accumulator_1 + product_1),
+                     valid_o.eq(clken_reg),
+                    ]
+
+        return m
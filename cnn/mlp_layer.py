@@ -0,0 +1,165 @@
+from nmigen import *
+from cnn.mlp_node import mlpNode, node_accum_bits
+from cnn.interfaces import DataStream, MatrixStream
+from cnn.stream_utils import SkidBuffer
+from cnn.utils.operations import _incr, _and
+
+
+class MLPLayer(Elaboratable):
+    _doc_ = """
+    MLP Layer instantiates n_nodes MLP Nodes working in
+    paralell. Each input sample is broadcasted to all the
+    nodes, and the outputs of the nodes are merged in a
+    single output stream.
+    Each node computes one neuron of every group of n_nodes
+    neurons, so the input vector has to be sent once for each
+    group ((n_neurons / n_nodes) times), and each group takes
+    n_inputs cycles.
+    The outputs are sorted by neuron ([N0, N1, ...]), and last
+    is asserted with the output of the last neuron.
+    The output of each node is registered in a Skid Buffer, so
+    the nodes can start the next group while the outputs of the
+    current one are merged (n_nodes cycles). The input is not
+    stalled as long as a group takes at least n_nodes cycles.
+
+    Parameters
+    ----------
+    width_i : int
+        Bit width of data in stream interface.
+
+    width_w : int
+        Bit width of the weights.
+
+    n_inputs : int
+        Number of inputs for each neuron.
+
+    n_nodes : int
+        Number of paralell MLP Nodes.
+
+    rom_init : list
+        List with the weights of all the neurons of the layer,
+        with the same form as in the MLP Node:
+        [N0_W0, N0_W1, ..., N0_Wn-1,
+         N1_W0, N1_W1, ..., N1_Wn-1,
+         ...
+        ]
+        The number of neurons must be a multiple of n_nodes.
+
+    bias_init : list
+        List with the bias of each neuron [N0_B, N1_B, ...].
+        If None, all the biases will be zero.
+
+    width_b : int
+        Bit width of the bias. See mlpNode.
+
+    bias_shift : int
+        Fixed point scale of the bias. See mlpNode.
+
+    n_lanes : int
+        Number of inputs processed in paralell by each node.
+        See mlpNode.
+
+    input_range : tuple
+        (min, max) of the input samples. See mlpNode. The
+        accumulator width is computed over all the neurons, so
+        all the nodes have the same output width.
+    """
+
+    def __init__(self, width_i, width_w, n_inputs, n_nodes, rom_init, bias_init=None, width_b=None, bias_shift=None, n_lanes=1, input_range=None):
+        assert len(rom_init) % n_inputs == 0
+        n_neurons = len(rom_init) // n_inputs
+        assert n_neurons % n_nodes == 0, (
+            f'{n_neurons} neurons can not be splitted in {n_nodes} nodes')
+        if bias_init is None:
+            bias_init = [0] * n_neurons
+        assert len(bias_init) == n_neurons, f'{len(bias_init)} != {n_neurons}'
+
+        if width_b is None:
+            width_b = width_i
+        if bias_shift is None:
+            bias_shift = width_w - 1
+        width_acc = node_accum_bits(width_i, width_w, n_inputs, rom_init, bias_init,
+                                    width_b, bias_shift, input_range)
+
+        self.n_inputs = n_inputs
+        self.n_nodes = n_nodes
+        self.n_neurons = n_neurons
+
+        # node 'j' computes the neurons j, j + n_nodes, j + 2*n_nodes, ...
+        self.nodes = []
+        for j in range(n_nodes):
+            neurons = range(j, n_neurons, n_nodes)
+            node_rom = [w for n in neurons for w in rom_init[n*n_inputs:(n+1)*n_inputs]]
+            node_bias = [bias_init[n] for n in neurons]
+            self.nodes.append(mlpNode(width_i=width_i,
+                                      width_w=width_w,
+                                      n_inputs=n_inputs,
+                                      rom_init=node_rom,
+                                      bias_init=node_bias,
+                                      width_b=width_b,
+                                      bias_shift=bias_shift,
+                                      n_lanes=n_lanes,
+                                      width_acc=width_acc))
+
+        output_w = len(self.nodes[0].output.data)
+        if n_lanes == 1:
+            self.input = DataStream(width=width_i, direction='sink', name='input')
+        else:
+            self.input = MatrixStream(width=width_i, shape=(n_lanes,), direction='sink', name='input')
+        self.output = DataStream(width=output_w, direction='source', name='output')
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        current_node = Signal(range(self.n_nodes))
+        current_neuron = Signal(range(self.n_neurons))
+
+        for i, node in enumerate(self.nodes):
+            m.submodules['node_' + str(i)] = node
+
+        # input --> nodes (broadcast)
+        comb += self.input.ready.eq(_and([node.input.ready for node in self.nodes]))
+        for node in self.nodes:
+            comb += [node.input.valid.eq(self.input.valid & self.input.ready),
+                     node.input.last.eq(self.input.last),
+                    ]
+            comb += [node_data.eq(data) for node_data, data in zip(node.input.data_ports, self.input.data_ports)]
+
+        # nodes --> buffers
+        buffers = []
+        for i, node in enumerate(self.nodes):
+            buffer = SkidBuffer(width=len(node.output.data))
+            m.submodules['buffer_' + str(i)] = buffer
+            comb += [buffer.input.valid.eq(node.output.valid),
+                     buffer.input.data.eq(node.output.data),
+                     buffer.input.last.eq(node.output.last),
+                     node.output.ready.eq(buffer.input.ready),
+                    ]
+            buffers.append(buffer)
+
+        # buffers --> output (round robin)
+        for i, buffer in enumerate(buffers):
+            with m.If(current_node == i):
+                comb += [self.output.valid.eq(buffer.output.valid),
+                         self.output.data.eq(buffer.output.data),
+                         buffer.output.ready.eq(self.output.ready),
+                        ]
+            with m.Else():
+                comb += buffer.output.ready.eq(0)
+
+        comb += self.output.last.eq(current_neuron == self.n_neurons - 1)
+
+        with m.If(self.output.accepted()):
+            sync += [current_node.eq(_incr(current_node, self.n_nodes)),
+                     current_neuron.eq(_incr(current_neuron, self.n_neurons)),
+                    ]
+
+        return m
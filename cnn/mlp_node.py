@@ -1,8 +1,10 @@
 from nmigen import *
-from cnn.rom import CircularROM
-from cnn.stream_macc import StreamMacc
-from cnn.interfaces import DataStream
+from cnn.rom import CircularROM, CodebookROM
+from cnn.weight_fetch import WeightFetcher
+from cnn.stream_macc import StreamMacc, ParallelStreamMacc
+from cnn.interfaces import DataStream, MatrixStream
 from cnn.utils.operations import _incr
+from cnn.utils.bits import accumulator_bits
 
 from math import log2, ceil
 
@@ -10,6 +12,33 @@ from math import log2, ceil
 def accum_req_bits(w_a, w_b, n):
     return w_a + w_b + int(ceil(log2(n)))
 
+def node_accum_bits(width_i, width_w, n_inputs, rom_init, bias_init, width_b, bias_shift, input_range=None):
+    if input_range is None:
+        # worst case for any weights and bias
+        return max(accum_req_bits(width_i, width_w, n_inputs),
+                   width_b + bias_shift) + 1 # +1 bias
+    # tight width for the actual weights and bias. At least one
+    # output bit is kept after the (width_w - 1) shift.
+    return max(accumulator_bits(rom_init, n_inputs, input_range, bias_init, bias_shift),
+               width_w)
+
+def weight_words(rom_init, width_w, n_lanes=1):
+    """
+    Packs the weights as the words read by the MLP Node: each
+    word has n_lanes consecutive weights, the first one in the
+    least significant bits (as the banks of the Circular ROM).
+    This is the image of the external memory when the weights
+    are fetched with a Weight Fetcher.
+    """
+    mask = 2**width_w - 1
+    words = []
+    for i in range(0, len(rom_init), n_lanes):
+        word = 0
+        for b, w in enumerate(rom_init[i:i+n_lanes]):
+            word |= (w & mask) << (b * width_w)
+        words.append(word)
+    return words
+
 
 class mlpNode(Elaboratable):
     _doc_ = """
@@ -17,7 +46,10 @@ class mlpNode(Elaboratable):
     to store the corresponding weights. Both input and output
     are Stream interfaces.
     This MLP Node can actually do the job of N neurons serially
-    where each neuron will require (n_inputs + 1) weights stored.
+    where each neuron will require n_inputs weights stored.
+    The bias of each neuron is stored in its own Circular ROM,
+    and it is loaded into the accumulator at the start of each
+    vector, so each neuron costs n_inputs cycles.
 
     Parameters
     ----------
@@ -33,39 +65,142 @@ class mlpNode(Elaboratable):
     rom_init : list
         List with weights to initialize the ROM. It should
         have the form
-        [N0_W0, N0_W1, ..., N0_Wn-1, N0_Wbias,
-         N1_W0, N1_W1, ..., N1_Wn-1, N1_Wbias,
+        [N0_W0, N0_W1, ..., N0_Wn-1,
+         N1_W0, N1_W1, ..., N1_Wn-1,
          ...
         ]
         where Nx_Wy refers to the weight of the sample 'y'
         of neuron 'x'.
+
+    bias_init : list
+        List with the bias of each neuron [N0_B, N1_B, ...].
+        If None, all the biases will be zero.
+
+    width_b : int
+        Bit width of the bias. By default, same as width_i.
+
+    bias_shift : int
+        Fixed point scale of the bias: it is added to the
+        accumulator as (bias * 2**bias_shift). By default, the
+        bias has the same scale as the output, so it is
+        (width_w - 1).
+
+    n_lanes : int
+        Number of inputs processed in paralell (1 by default).
+        If greater than 1, the input is a Matrix Stream with
+        shape (n_lanes,), the weights are read from a banked
+        ROM and a Parallel Stream Macc is used, so each neuron
+        costs (n_inputs / n_lanes) cycles. n_inputs must be a
+        multiple of n_lanes.
+
+    compress : bool
+        If True, the weights are stored compressed with a
+        codebook (see CodebookROM). Useful when the trained
+        weights take only a few different values.
+
+    input_range : tuple
+        (min, max) of the input samples. If given, the accumulator
+        is sized for the actual weights and bias instead of for
+        the worst case of any weights, so the accumulator and the
+        output are narrower. If None, the full range of width_i
+        bits is assumed for any weights.
+
+    width_acc : int
+        Bit width of the accumulator. If given, it overrides the
+        width computed from input_range. The output width is
+        (width_acc - width_w + 1).
+
+    burst : int
+        If given, the weights are not stored on chip: a Weight
+        Fetcher reads them from an external memory in bursts of
+        'burst' words, through the mem_req and mem_resp
+        interfaces (see WeightFetcher). The memory has to hold
+        weight_words(rom_init, width_w, n_lanes) at base_addr.
+        rom_init is still needed to size the accumulator.
+        The node takes one sample per clock if
+        (n_buffers - 2) * burst >= latency + 3.
+
+    n_buffers : int
+        Number of on-chip buffers of the Weight Fetcher.
+
+    base_addr : int
+        Address of the first weight in the external memory.
     """
 
-    def __init__(self, width_i, width_w, n_inputs, rom_init):
-        assert len(rom_init) % (n_inputs+1) == 0
-        accum_w = accum_req_bits(width_i, width_w, n_inputs + 1) # +1 bias
+    def __init__(self, width_i, width_w, n_inputs, rom_init, bias_init=None, width_b=None, bias_shift=None, n_lanes=1, compress=False, input_range=None, width_acc=None, burst=None, n_buffers=3, base_addr=0):
+        assert len(rom_init) % n_inputs == 0
+        assert burst is None or not compress, (
+            'compressed weights can not be fetched from an external memory')
+        assert n_inputs % n_lanes == 0, (
+            f'{n_inputs} inputs can not be splitted in {n_lanes} lanes')
+        n_neurons = len(rom_init) // n_inputs
+        if bias_init is None:
+            bias_init = [0] * n_neurons
+        assert len(bias_init) == n_neurons, f'{len(bias_init)} != {n_neurons}'
+        if width_b is None:
+            width_b = width_i
         shift = width_w - 1 # compensate weights gain
+        if bias_shift is None:
+            bias_shift = shift
+        if width_acc is None:
+            width_acc = node_accum_bits(width_i, width_w, n_inputs, rom_init, bias_init,
+                                        width_b, bias_shift, input_range)
+        accum_w = width_acc
 
         self.n_inputs = n_inputs
+        self.n_neurons = n_neurons
+        self.n_lanes = n_lanes
+        self.burst = burst
         
-        self.rom = CircularROM(width=width_w,
-                               init=rom_init)
+        if burst is None:
+            rom_core = CodebookROM if compress else CircularROM
+            self.rom = rom_core(width=width_w,
+                                init=rom_init,
+                                n_banks=n_lanes)
+        else:
+            self.rom = WeightFetcher(width=width_w * n_lanes,
+                                     depth=len(rom_init) // n_lanes,
+                                     burst=burst,
+                                     n_buffers=n_buffers,
+                                     base_addr=base_addr)
+            self.mem_req = self.rom.mem_req
+            self.mem_resp = self.rom.mem_resp
 
-        self.macc = StreamMacc(width_i=width_i,
-                               width_c=width_w,
-                               width_acc=accum_w,
-                               shift=shift)
+        self.bias_rom = CircularROM(width=width_b,
+                                    init=bias_init)
+
+        if n_lanes == 1:
+            self.macc = StreamMacc(width_i=width_i,
+                                   width_c=width_w,
+                                   width_acc=accum_w,
+                                   shift=shift,
+                                   width_b=width_b,
+                                   bias_shift=bias_shift)
+        else:
+            self.macc = ParallelStreamMacc(width_i=width_i,
+                                           width_c=width_w,
+                                           n_lanes=n_lanes,
+                                           width_acc=accum_w,
+                                           shift=shift,
+                                           width_b=width_b,
+                                           bias_shift=bias_shift)
 
         output_w = len(self.macc.output.data)
         assert output_w == accum_w - shift, (
             f'{output_w} == {accum_w} - {shift}')
-        self.input = DataStream(width=width_i, direction='sink', name='input')
+        if n_lanes == 1:
+            self.input = DataStream(width=width_i, direction='sink', name='input')
+        else:
+            self.input = MatrixStream(width=width_i, shape=(n_lanes,), direction='sink', name='input')
         self.output = DataStream(width=output_w, direction='source', name='output')
 
     def get_ports(self):
         ports = []
         ports += [self.input[f] for f in self.input.fields]
         ports += [self.output[f] for f in self.output.fields]
+        if self.burst is not None:
+            ports += [self.mem_req[f] for f in self.mem_req.fields]
+            ports += [self.mem_resp[f] for f in self.mem_resp.fields]
         return ports
 
     def elaborate(self, platform):
@@ -74,39 +209,34 @@ class mlpNode(Elaboratable):
         comb = m.d.comb
 
         m.submodules.rom = rom = self.rom
+        m.submodules.bias_rom = bias_rom = self.bias_rom
         m.submodules.macc = macc = self.macc
 
-        cnt = Signal(range(self.n_inputs))
+        n_words = self.n_inputs // self.n_lanes
+        cnt = Signal(range(n_words))
         output_data = Signal(signed(len(self.output.data)))
 
         comb += macc.r_data.eq(rom.r_data)
         comb += macc.r_rdy.eq(rom.r_rdy)
         comb += rom.r_en.eq(macc.r_en)
-        comb += rom.restart.eq(0) # should be unnecessary if the
-                                  # inputs are correct.
+        if self.burst is None:
+            comb += rom.restart.eq(0) # should be unnecessary if the
+                                      # inputs are correct.
+
+        comb += macc.b_data.eq(bias_rom.r_data)
+        comb += macc.b_rdy.eq(bias_rom.r_rdy)
+        comb += bias_rom.r_en.eq(macc.b_en)
+        comb += bias_rom.restart.eq(0)
 
         nxt_cnt = Signal.like(cnt)
-        comb += nxt_cnt.eq(_incr(cnt, self.n_inputs))
+        comb += nxt_cnt.eq(_incr(cnt, n_words))
         with m.If(self.input.accepted()):
             sync += cnt.eq(nxt_cnt)
 
-        with m.FSM() as fsm:
-
-            with m.State("INPUT"):
-                comb += self.input.ready.eq(macc.input.ready)
-                comb += macc.input.valid.eq(self.input.valid)
-                comb += macc.input.data.eq(self.input.data)
-                comb += macc.input.last.eq(0)
-                with m.If(macc.input.accepted() & (nxt_cnt == 0)):
-                    m.next = "BIAS"
-
-            with m.State("BIAS"):
-                comb += self.input.ready.eq(0)
-                comb += macc.input.valid.eq(1)
-                comb += macc.input.data.eq(1) # should it be bigger? what granularity should the bias have?
-                comb += macc.input.last.eq(1)
-                with m.If(macc.input.accepted()):
-                    m.next = "INPUT"
+        comb += self.input.ready.eq(macc.input.ready)
+        comb += macc.input.valid.eq(self.input.valid)
+        comb += [macc_data.eq(data) for macc_data, data in zip(macc.input.data_ports, self.input.data_ports)]
+        comb += macc.input.last.eq(nxt_cnt == 0)
 
         comb += output_data.eq(macc.output.data)
         comb += self.output.valid.eq(macc.output.valid)
@@ -115,3 +245,207 @@ class mlpNode(Elaboratable):
         comb += macc.output.ready.eq(self.output.ready)
 
         return m
+
+
+def sparse_rom(rom_init, n_inputs, width_w):
+    """
+    Builds the ROM of the Sparse MLP Node from the (dense)
+    weights. Only the non zero weights are stored, with the
+    index of its input and a flag that marks the last weight
+    of each neuron. A neuron without weights keeps a zero
+    weight, so it still produces an output.
+    Returns the list of packed words: {last, index, weight}.
+    """
+    index_w = max(1, ceil(log2(n_inputs)))
+    words = []
+    for n in range(len(rom_init) // n_inputs):
+        weights = rom_init[n*n_inputs:(n+1)*n_inputs]
+        entries = [(i, w) for i, w in enumerate(weights) if w != 0]
+        if not len(entries):
+            entries = [(0, 0)]
+        for j, (i, w) in enumerate(entries):
+            last = int(j == len(entries) - 1)
+            words.append((w & (2**width_w - 1)) | (i << width_w) | (last << (width_w + index_w)))
+    return words
+
+
+class SparseMlpNode(Elaboratable):
+    _doc_ = """
+    Sparse MLP Node, for pruned networks. Only the non zero
+    weights are stored in the ROM, together with the index of
+    the input they multiply.
+    Each input vector (n_inputs samples) is stored in a buffer,
+    and then all the neurons are computed over it, iterating only
+    over the non zero weights. So each neuron costs as many cycles
+    as non zero weights it has (at least one).
+    Unlike the MLP Node, the input vector is sent only once for
+    all the neurons. The output has one value for each neuron,
+    and last is asserted with the last neuron.
+
+    Parameters
+    ----------
+    width_i : int
+        Bit width of data in stream interface.
+
+    width_w : int
+        Bit width of the weights.
+
+    n_inputs : int
+        Number of inputs for each neuron.
+
+    rom_init : list
+        List with the (dense) weights, with the same form as
+        in the MLP Node.
+
+    bias_init : list
+        List with the bias of each neuron. See mlpNode.
+
+    width_b : int
+        Bit width of the bias. See mlpNode.
+
+    bias_shift : int
+        Fixed point scale of the bias. See mlpNode.
+
+    input_range : tuple
+        (min, max) of the input samples. See mlpNode.
+    """
+
+    def __init__(self, width_i, width_w, n_inputs, rom_init, bias_init=None, width_b=None, bias_shift=None, input_range=None):
+        assert len(rom_init) % n_inputs == 0
+        n_neurons = len(rom_init) // n_inputs
+        if bias_init is None:
+            bias_init = [0] * n_neurons
+        assert len(bias_init) == n_neurons, f'{len(bias_init)} != {n_neurons}'
+        if width_b is None:
+            width_b = width_i
+        shift = width_w - 1 # compensate weights gain
+        if bias_shift is None:
+            bias_shift = shift
+        accum_w = node_accum_bits(width_i, width_w, n_inputs, rom_init, bias_init,
+                                  width_b, bias_shift, input_range)
+
+        self.width_w = width_w
+        self.n_inputs = n_inputs
+        self.n_neurons = n_neurons
+        self.index_w = max(1, ceil(log2(n_inputs)))
+
+        rom_words = sparse_rom(rom_init, n_inputs, width_w)
+        self.n_weights = len(rom_words)
+
+        self.rom = CircularROM(width=width_w + self.index_w + 1,
+                               init=rom_words)
+
+        self.bias_rom = CircularROM(width=width_b,
+                                    init=bias_init)
+
+        self.buffer = Memory(width=width_i, depth=n_inputs)
+
+        self.macc = StreamMacc(width_i=width_i,
+                               width_c=width_w,
+                               width_acc=accum_w,
+                               shift=shift,
+                               width_b=width_b,
+                               bias_shift=bias_shift)
+
+        output_w = len(self.macc.output.data)
+        self.input = DataStream(width=width_i, direction='sink', name='input')
+        self.output = DataStream(width=output_w, direction='source', name='output')
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        m.submodules.rom = rom = self.rom
+        m.submodules.bias_rom = bias_rom = self.bias_rom
+        m.submodules.macc = macc = self.macc
+        m.submodules.wr_port = wr_port = self.buffer.write_port()
+        m.submodules.rd_port = rd_port = self.buffer.read_port(domain='sync', transparent=False)
+
+        in_cnt = Signal(range(self.n_inputs))
+        neuron_cnt = Signal(range(self.n_neurons))
+        out_cnt = Signal(range(self.n_neurons))
+
+        # ROM word: {last, index, weight}
+        rom_weight = rom.r_data[0:self.width_w]
+        rom_index = rom.r_data[self.width_w:self.width_w+self.index_w]
+        rom_last = rom.r_data[-1]
+
+        # stage with the input read from the buffer and its weight
+        weight = Signal(signed(self.width_w))
+        weight_last = Signal()
+        weight_valid = Signal()
+        advance = Signal()
+
+        comb += advance.eq(macc.input.accepted() | ~weight_valid)
+
+        comb += rom.restart.eq(0)
+        comb += bias_rom.restart.eq(0)
+
+        # input --> buffer
+        comb += [wr_port.addr.eq(in_cnt),
+                 wr_port.data.eq(self.input.data),
+                 wr_port.en.eq(self.input.accepted()),
+                ]
+        with m.If(self.input.accepted()):
+            sync += in_cnt.eq(_incr(in_cnt, self.n_inputs))
+
+        comb += rd_port.addr.eq(rom_index)
+        comb += rd_port.en.eq(advance)
+
+        with m.FSM() as fsm:
+
+            with m.State("LOAD"):
+                comb += self.input.ready.eq(1)
+                comb += rom.r_en.eq(0)
+                with m.If(self.input.accepted() & (in_cnt == self.n_inputs - 1)):
+                    m.next = "COMPUTE"
+
+            with m.State("COMPUTE"):
+                comb += self.input.ready.eq(0)
+                comb += rom.r_en.eq(advance)
+                with m.If(rom.r_en & rom.r_rdy & rom_last):
+                    sync += neuron_cnt.eq(_incr(neuron_cnt, self.n_neurons))
+                    with m.If(neuron_cnt == self.n_neurons - 1):
+                        m.next = "DRAIN"
+
+            with m.State("DRAIN"):
+                comb += self.input.ready.eq(0)
+                comb += rom.r_en.eq(0)
+                with m.If(advance):
+                    m.next = "LOAD"
+
+        with m.If(advance):
+            sync += [weight.eq(rom_weight),
+                     weight_last.eq(rom_last),
+                     weight_valid.eq(rom.r_en & rom.r_rdy),
+                    ]
+
+        # buffer --> macc
+        comb += [macc.input.valid.eq(weight_valid),
+                 macc.input.data.eq(rd_port.data),
+                 macc.input.last.eq(weight_last),
+                 macc.r_data.eq(weight),
+                 macc.r_rdy.eq(1),
+                ]
+
+        comb += macc.b_data.eq(bias_rom.r_data)
+        comb += macc.b_rdy.eq(bias_rom.r_rdy)
+        comb += bias_rom.r_en.eq(macc.b_en)
+
+        # macc --> output
+        comb += [self.output.valid.eq(macc.output.valid),
+                 self.output.data.eq(macc.output.data),
+                 self.output.last.eq(out_cnt == self.n_neurons - 1),
+                 macc.output.ready.eq(self.output.ready),
+                ]
+        with m.If(self.output.accepted()):
+            sync += out_cnt.eq(_incr(out_cnt, self.n_neurons))
+
+        return m
@@ -1,5 +1,6 @@
 from nmigen import *
-from cnn.interfaces import DataStream
+from cnn.interfaces import DataStream, MatrixStream
+from cnn.stream_utils import SkidBuffer
 
 
 _lsb = 0
@@ -7,7 +8,7 @@ _msb = -1
 
 
 def _signed_shift_right(signal, shift):
-    return Cat(signal[shift:], Repl(signal[_msb], shift))
+    return signal.as_signed() >> shift
 
 
 def _relu(signal, leak):
@@ -26,10 +27,10 @@ class Relu(Elaboratable):
 
     Interfaces
     ----------
-    input : Stream, input
+    input : Data Stream (n_lanes=1) or Matrix Stream (n_lanes,), input
         Data input.
 
-    output : Stream, output
+    output : Data Stream (n_lanes=1) or Matrix Stream (n_lanes,), output
         Data output.
 
     Parameters
@@ -50,12 +51,28 @@ class Relu(Elaboratable):
         width-1 - all negative values divided by 2
         width - identity (output=input)
 
+    n_lanes : int
+        Number of data in each sample, processed in parallel.
+
+    registered : bool
+        If True, the output goes through a Skid Buffer, so all
+        the output signals (and the input ready) are registered,
+        with one cycle of latency. Otherwise, the operation is
+        combinational.
     """
 
-    def __init__(self, width, leak=0):
+    def __init__(self, width, leak=0, n_lanes=1, registered=False):
         self.leak = leak
-        self.input = DataStream(width=width, direction='sink', name='input')
-        self.output = DataStream(width=width, direction='source', name='output')
+        self.n_lanes = n_lanes
+        self.registered = registered
+        if n_lanes == 1:
+            self.input = DataStream(width=width, direction='sink', name='input')
+            self.output = DataStream(width=width, direction='source', name='output')
+        else:
+            self.input = MatrixStream(width=width, shape=(n_lanes,), direction='sink', name='input')
+            self.output = MatrixStream(width=width, shape=(n_lanes,), direction='source', name='output')
+        self.width = width
+        self.latency = int(registered)
 
     def get_ports(self):
         ports = []
@@ -68,14 +85,26 @@ class Relu(Elaboratable):
         sync = m.d.sync
         comb = m.d.comb
 
-        x = Signal()
-        sync += x.eq(~x) # Lets force the existence of a clock in the design
+        if self.registered:
+            shape = None if self.n_lanes == 1 else (self.n_lanes,)
+            m.submodules.skid_buffer = skid_buffer = SkidBuffer(self.width, shape)
+            output = skid_buffer.input
+            comb += [
+                self.output.valid.eq(skid_buffer.output.valid),
+                self.output.last.eq(skid_buffer.output.last),
+                skid_buffer.output.ready.eq(self.output.ready),
+            ]
+            comb += [o.eq(d) for o, d in zip(self.output.data_ports, skid_buffer.output.data_ports)]
+        else:
+            output = self.output
+            x = Signal()
+            sync += x.eq(~x) # Lets force the existence of a clock in the design
 
         comb += [
-            self.output.valid.eq(self.input.valid),
-            self.output.data.eq(_relu(self.input.data, self.leak)),
-            self.output.last.eq(self.input.last),
-            self.input.ready.eq(self.output.ready),
+            output.valid.eq(self.input.valid),
+            output.last.eq(self.input.last),
+            self.input.ready.eq(output.ready),
         ]
+        comb += [o.eq(_relu(d, self.leak)) for o, d in zip(output.data_ports, self.input.data_ports)]
 
         return m
\ No newline at end of file
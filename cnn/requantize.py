@@ -0,0 +1,146 @@
+from nmigen import *
+from cnn.interfaces import DataStream
+from cnn.hdl_utils import Pipeline, signal_delay
+from cnn.utils.bits import range_required_bits
+from cnn.utils.operations import _incr
+
+from math import frexp
+
+
+def quantize_scale(scale, width_m):
+    """ Returns (multiplier, shift) so that multiplier / 2**shift
+    approximates the real scale, with a signed multiplier of
+    width_m bits.
+    """
+    assert scale > 0
+    mantissa, exponent = frexp(scale) # scale = mantissa * 2**exponent, 0.5 <= mantissa < 1
+    multiplier = int(round(mantissa * 2**(width_m - 1)))
+    shift = width_m - 1 - exponent
+    if multiplier == 2**(width_m - 1):
+        multiplier //= 2
+        shift -= 1
+    assert shift >= 0, f'scale {scale} is too big for {width_m} bits'
+    return multiplier, shift
+
+def requantize(x, multiplier, shift, width_o, zero_point=0):
+    """ Reference model of the Requantizer. """
+    half = 2**(shift - 1) if shift > 0 else 0
+    _min, _max = -2**(width_o-1), 2**(width_o-1)-1
+    r = ((x * multiplier + half) >> shift) + zero_point
+    return min(max(r, _min), _max)
+
+def requantize_stages(pipeline, x, multiplier, shift, width_o, zero_point=0):
+    """ Adds the requantization of x (signed) to the pipeline, in
+    three stages (product, rounding shift with the zero point, and
+    saturation), and returns the result. The multiplier can be an
+    int or a signed Value (as the multiplier of each channel).
+    """
+    if isinstance(multiplier, int):
+        multiplier = Const(multiplier, signed(range_required_bits(multiplier, multiplier)))
+    half = 2**(shift - 1) if shift > 0 else 0
+    _min, _max = -2**(width_o-1), 2**(width_o-1)-1
+    p, = pipeline.add_stage( [x * multiplier] )
+    r, = pipeline.add_stage( [((p + half) >> shift) + zero_point] )
+    s, = pipeline.add_stage( [Mux(r > _max, _max, Mux(r < _min, _min, r))] )
+    return s
+
+
+class Requantizer(Elaboratable):
+    _doc_ = """
+    Requantizer scales down the output of a layer to the input
+    width of the next one:
+        output = saturate(round(input * multiplier / 2**shift) + zero_point)
+    The rounding is to the nearest integer (halves rounded up),
+    and the result is clamped to the range of a signed number of
+    width_o bits.
+    The multiplier can be the same for the whole layer, or one
+    for each channel. In the second case, the samples are expected
+    to be sorted by channel (as the output of the MLP Node), and
+    the channel counter is restarted with each last.
+
+    Interfaces
+    ----------
+    input : Data Stream, input
+        Signed input data.
+
+    output : Data Stream, output
+        Signed requantized data.
+
+    Parameters
+    ----------
+    width_i : int
+        Bit width of the input data.
+
+    width_o : int
+        Bit width of the output data.
+
+    multiplier : int or list
+        Multiplier of the layer, or list with the multiplier of
+        each channel. See quantize_scale() to get it from a real
+        scale.
+
+    shift : int
+        The product will be shifted to the right by this number.
+
+    zero_point : int
+        Offset added after the scaling.
+
+    width_m : int
+        Bit width of the multiplier. If None, the minimum width
+        to represent the multipliers is used.
+    """
+
+    def __init__(self, width_i, width_o, multiplier, shift, zero_point=0, width_m=None):
+        if not isinstance(multiplier, (list, tuple)):
+            multiplier = [multiplier]
+        if width_m is None:
+            width_m = range_required_bits(min(multiplier), max(multiplier))
+        self.width_o = width_o
+        self.multiplier = list(multiplier)
+        self.shift = shift
+        self.zero_point = zero_point
+        self.width_m = width_m
+        self.input = DataStream(width=width_i, direction='sink', name='input')
+        self.output = DataStream(width=width_o, direction='source', name='output')
+        self.latency = 4
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        n_channels = len(self.multiplier)
+
+        clken = Signal()
+        comb += clken.eq(~self.output.valid | self.output.ready)
+        comb += self.input.ready.eq(clken)
+
+        if n_channels == 1:
+            multiplier = Const(self.multiplier[0], signed(self.width_m))
+        else:
+            channel = Signal(range(n_channels))
+            with m.If(self.input.accepted()):
+                with m.If(self.input.last):
+                    sync += channel.eq(0)
+                with m.Else():
+                    sync += channel.eq(_incr(channel, n_channels))
+            multipliers = Array([Const(x, signed(self.width_m)) for x in self.multiplier])
+            multiplier = multipliers[channel]
+
+        pipeline = Pipeline()
+        x0, m0 = pipeline.add_stage( [self.input.data.as_signed(), multiplier] )
+        s3 = requantize_stages(pipeline, x0, m0, self.shift, self.width_o, self.zero_point)
+        pipeline.generate(m=m, ce=clken, domain='sync')
+
+        comb += [self.output.valid.eq(signal_delay(m, self.input.accepted(), self.latency, ce=clken)),
+                 self.output.last.eq(signal_delay(m, self.input.accepted() & self.input.last, self.latency, ce=clken)),
+                 self.output.data.eq(s3),
+                ]
+
+        return m
@@ -1,11 +1,20 @@
 from nmigen import *
 from cnn.utils.operations import _incr
 
+from math import ceil, log2
+
 
 class CircularROM(Elaboratable):
     _doc_ = """
     Circular ROM is what it's name says.
 
+    The ROM can be splitted in n_banks memories sharing the
+    same circular address, to read n_banks words per cycle.
+    The bank 'b' stores init[b::n_banks], and r_data has all
+    the banks packed, where the word of the bank 'b' is
+    r_data[b*width:(b+1)*width]. So each read returns the next
+    n_banks words of init, in order.
+
     Parameters
     ----------
     width : int
@@ -14,17 +23,26 @@ class CircularROM(Elaboratable):
     init : list
         ROM initialization data. Implicitily determinates
         the memory depth.
+
+    n_banks : int
+        Number of memory banks (1 by default). If the length
+        of init is not a multiple of n_banks, it will be
+        completed with zeros.
     """
 
-    def __init__(self, width, init):
+    def __init__(self, width, init, n_banks=1):
+        init = list(init)
+        init += [0] * ((n_banks - len(init) % n_banks) % n_banks)
         self.width = width
-        self.depth = len(init)
-        self.memory = Memory(width=width,
-                             depth=self.depth,
-                             init=init)
+        self.n_banks = n_banks
+        self.depth = len(init) // n_banks
+        self.memories = [Memory(width=width,
+                                depth=self.depth,
+                                init=init[b::n_banks]) for b in range(n_banks)]
+        self.memory = self.memories[0]
         self.r_en = Signal()
         self.r_rdy = Signal()
-        self.r_data = Signal(width)
+        self.r_data = Signal(width * n_banks)
         self.restart = Signal()
 
     def get_ports(self):
@@ -35,22 +53,28 @@ class CircularROM(Elaboratable):
         comb = m.d.comb
         sync = m.d.sync
 
-        rd_port = self.memory.read_port(domain="sync")
-        m.submodules.rd_port = rd_port
+        rd_ports = [memory.read_port(domain="sync") for memory in self.memories]
+        if len(rd_ports) == 1:
+            m.submodules.rd_port = rd_ports[0]
+        else:
+            for b, rd_port in enumerate(rd_ports):
+                m.submodules['rd_port_' + str(b)] = rd_port
 
         delay_rdy = Signal() # delays r_rdy after reset
-        prev_addr = Signal.like(rd_port.addr)
+        addr = Signal.like(rd_ports[0].addr)
+        prev_addr = Signal.like(rd_ports[0].addr)
 
         do_read = self.r_en & self.r_rdy
         next_addr = _incr(prev_addr, self.depth)
 
-        comb += self.r_data.eq(rd_port.data)
-        sync += prev_addr.eq(rd_port.addr)
+        comb += self.r_data.eq(Cat(*[rd_port.data for rd_port in rd_ports]))
+        comb += [rd_port.addr.eq(addr) for rd_port in rd_ports]
+        sync += prev_addr.eq(addr)
 
         with m.If(do_read):
-            comb += rd_port.addr.eq(next_addr)
+            comb += addr.eq(next_addr)
         with m.Else():
-            comb += rd_port.addr.eq(prev_addr)
+            comb += addr.eq(prev_addr)
 
         with m.If(self.restart):
             sync += prev_addr.eq(0)
@@ -61,4 +85,88 @@ class CircularROM(Elaboratable):
         with m.Else():
             sync += self.r_rdy.eq(1)
 
-        return m
\ No newline at end of file
+        return m
+
+def codebook_compress(init):
+    """
+    Splits the data of a ROM in a codebook with the different
+    values and the list of indexes to the codebook.
+    Returns (codebook, indexes).
+    """
+    codebook = sorted(set(init))
+    indexes = [codebook.index(x) for x in init]
+    return codebook, indexes
+
+
+class CodebookROM(Elaboratable):
+    _doc_ = """
+    Circular ROM with the data compressed with a codebook.
+    A narrow Circular ROM stores the indexes to the codebook,
+    and each index read is decoded with the codebook (a small
+    lookup table) into a register, so r_data is registered and
+    the lookup doesn't lengthen the path from the memory to the
+    consumer. The inner ROM runs one word ahead of r_data: when
+    r_en is asserted, the next word is decoded from its output
+    while it advances. It has the same interface as the Circular
+    ROM, with r_rdy asserted one cycle later after a reset or a
+    restart.
+
+    Parameters
+    ----------
+    width : int
+        Bit width of the decoded data.
+
+    init : list
+        ROM initialization data (decoded). The codebook will
+        have one entry for each different value.
+
+    n_banks : int
+        Number of memory banks (see Circular ROM).
+    """
+
+    def __init__(self, width, init, n_banks=1):
+        init = list(init)
+        init += [0] * ((n_banks - len(init) % n_banks) % n_banks)
+        self.width = width
+        self.n_banks = n_banks
+        self.codebook, indexes = codebook_compress(init)
+        self.index_w = max(1, ceil(log2(len(self.codebook))))
+        self.rom = CircularROM(width=self.index_w,
+                               init=indexes,
+                               n_banks=n_banks)
+        self.depth = self.rom.depth
+        self.r_en = Signal()
+        self.r_rdy = Signal()
+        self.r_data = Signal(width * n_banks)
+        self.restart = Signal()
+
+    def get_ports(self):
+        return [self.r_en, self.r_rdy, self.r_data, self.restart]
+
+    def elaborate(self, platform):
+        m = Module()
+        comb = m.d.comb
+        sync = m.d.sync
+
+        m.submodules.rom = rom = self.rom
+
+        codebook = Array([Const(c, self.width) for c in self.codebook])
+
+        # decode the next word when r_data is empty or consumed
+        load = Signal()
+        comb += [load.eq(rom.r_rdy & ~self.restart & (~self.r_rdy | self.r_en)),
+                 rom.r_en.eq(load),
+                 rom.restart.eq(self.restart),
+                ]
+
+        with m.If(self.restart):
+            sync += self.r_rdy.eq(0)
+        with m.Elif(load):
+            sync += self.r_rdy.eq(1)
+            for b in range(self.n_banks):
+                index = rom.r_data[b*self.index_w:(b+1)*self.index_w]
+                sync += self.r_data[b*self.width:(b+1)*self.width].eq(codebook[index])
+        with m.Elif(self.r_en):
+            sync += self.r_rdy.eq(0)
+
+        return m
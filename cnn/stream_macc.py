@@ -1,6 +1,10 @@
 from nmigen import *
-from cnn.interfaces import DataStream
+from cnn.interfaces import DataStream, MatrixStream
 from cnn.hdl_utils import Pipeline, signal_delay
+from cnn.tree_operations import TreeAdderSigned
+from cnn.log_quant import log_code_width, log_product, log_product_width
+
+from math import ceil, log2
 
 
 class StreamMacc(Elaboratable):
@@ -23,18 +27,28 @@ class StreamMacc(Elaboratable):
     input : Data Stream, input
         Input data.
         Each product between the input data and the coeff data
-        will be accumulated, until a last is asserted. A last
-        will flush the pipeline and output the valid result,
-        clearing the accumulator afterwards.
+        will be accumulated, until a last is asserted. The sample
+        with last closes the current accumulation: its result is
+        moved to the output register and the accumulator is
+        cleared, while the next vector keeps entering the pipeline
+        (there is no drain between consecutive vectors).
 
     coeff : {r_data, r_en, r_rdy}, input
         Input coefficients.
         TO DO: Implement ReadportInterface
 
+    bias : {b_data, b_en, b_rdy}, input
+        Only present if width_b is specified. One bias is read
+        at the first sample of each vector, and it is loaded into
+        the accumulator together with the first product, as
+        (b_data * 2**bias_shift). It doesn't require an extra
+        input cycle.
+
     output : Data Stream, output
         Output data. Will output valid data after a last is
         asserted in the input interface. Otherwise, it will
-        keep accumulating.
+        keep accumulating. The whole pipeline only stalls when
+        the output register is full and not being accepted.
 
     Parameters
     ----------
@@ -50,25 +64,56 @@ class StreamMacc(Elaboratable):
     shift : int
         The accumulator result will be shifted to the right by
         this number, so the output will be (accumulator / 2**shift).
+
+    width_b : int
+        Bit width of the bias. If None, there is no bias interface.
+
+    bias_shift : int
+        Fixed point scale of the bias in the accumulator: the
+        bias will be shifted to the left by this number.
+
+    log_exp_w : int
+        If given, the coefficients are logarithmic (power of two)
+        codes with an exponent of log_exp_w bits (see log_quant),
+        and the multiplier is replaced by a barrel shifter. width_c
+        must be the code width, log_code_width(log_exp_w).
     """
 
-    def __init__(self, width_i, width_c, width_acc=None, shift=None):
+    def __init__(self, width_i, width_c, width_acc=None, shift=None, width_b=None, bias_shift=None, log_exp_w=None):
+        if log_exp_w is not None:
+            assert width_c == log_code_width(log_exp_w), (
+                f'{width_c} != {log_code_width(log_exp_w)}')
         if width_acc is None:
             width_acc = 48
         if shift is None:
             shift = 0
+        if bias_shift is None:
+            bias_shift = 0
         output_w = width_acc - shift
         self.shift = shift
+        self.bias_shift = bias_shift
+        self.width_b = width_b
+        self.log_exp_w = log_exp_w
+        if log_exp_w is None:
+            self.product_w = width_i + width_c
+        else:
+            self.product_w = log_product_width(width_i, log_exp_w)
         self.accumulator = Signal(signed(width_acc))
         self.input = DataStream(width=width_i, direction='sink', name='input')
         self.output = DataStream(width=output_w, direction='source', name='output')
         self.r_data = Signal(signed(width_c))
         self.r_en = Signal()
         self.r_rdy = Signal()
+        if width_b is not None:
+            self.b_data = Signal(signed(width_b))
+            self.b_en = Signal()
+            self.b_rdy = Signal()
         self.latency = 5
 
     def get_ports(self):
         ports = [self.r_data, self.r_en, self.r_rdy]
+        if self.width_b is not None:
+            ports += [self.b_data, self.b_en, self.b_rdy]
         ports += [self.input[f] for f in self.input.fields]
         ports += [self.output[f] for f in self.output.fields]
         return ports
@@ -80,44 +125,162 @@ class StreamMacc(Elaboratable):
 
         clken = Signal()
         accepted_last = self.input.accepted() & self.input.last
-        last_delayed = signal_delay(m, accepted_last, self.latency, ce=clken)
-        
-        accum_shifted = Signal(signed(self.output.dataport.width))
-
-        with m.FSM() as fsm:
-
-            with m.State("ACCUM"):
-                comb += self.input.ready.eq(self.r_rdy)
-                comb += self.output.valid.eq(0)
-                comb += self.r_en.eq(self.input.accepted())
-                comb += clken.eq(self.input.accepted())
-                with m.If(self.input.accepted() & self.input.last):
-                    m.next = "LAST"
-            with m.State("LAST"):
-                comb += self.input.ready.eq(0)
-                comb += self.output.valid.eq(last_delayed)
-                comb += self.r_en.eq(0)
-                comb += clken.eq(~self.output.valid | self.output.accepted())
+        product = self._product(m, clken)
+        product_last = signal_delay(m, accepted_last, self.latency - 1, ce=clken)
+
+        accum_next = Signal(signed(len(self.accumulator) + 1))
+
+        comb += clken.eq(~self.output.valid | self.output.ready)
+        comb += self.r_en.eq(self.input.accepted())
+
+        if self.width_b is None:
+            comb += self.input.ready.eq(self.r_rdy & clken)
+            bias = 0
+        else:
+            first = Signal(reset=1) # next sample is the first of a vector
+            with m.If(self.input.accepted()):
+                sync += first.eq(self.input.last)
+            comb += self.input.ready.eq(self.r_rdy & clken & (self.b_rdy | ~first))
+            comb += self.b_en.eq(self.input.accepted() & first)
+            bias_first = Signal(signed(self.width_b + self.bias_shift))
+            comb += bias_first.eq(Mux(self.b_en, self.b_data, 0) << self.bias_shift)
+            bias = signal_delay(m, bias_first, self.latency - 1, ce=clken)
+
+        # Double buffered accumulator: the sample with last moves the
+        # result to the output register, while the accumulator is
+        # cleared to keep accumulating the next vector.
+        comb += accum_next.eq(self.accumulator + product + bias)
+
+        with m.If(clken):
+            with m.If(product_last):
+                sync += [self.accumulator.eq(0),
+                         self.output.data.eq(accum_next[self.shift:len(self.accumulator)]),
+                         self.output.valid.eq(1),
+                        ]
+            with m.Else():
+                sync += self.accumulator.eq(accum_next)
                 with m.If(self.output.accepted()):
-                    m.next = "ACCUM"
+                    sync += self.output.valid.eq(0)
 
+        comb += self.output.last.eq(self.output.valid)
+
+        return m
+
+    def _product(self, m, clken):
         _get_input = lambda x: Mux(self.input.accepted(), x, 0)
-        _get_accum = lambda x: Mux(self.output.accepted(), 0, x)
 
         pipeline = Pipeline()
         a0, b0 = pipeline.add_stage( [_get_input(self.input.data.as_signed()),
                                       _get_input(self.r_data.as_signed())] )
         a1, b1 = pipeline.add_stage( [a0, b0] )
-        m2, = pipeline.add_stage( [a1 * b1] )
+        m2, = pipeline.add_stage( [self._mult(a1, b1)] )
         m3, = pipeline.add_stage( [m2] )
-        out, = pipeline.add_stage( [_get_accum(self.accumulator) + m3] )
         pipeline.generate(m=m, ce=clken, domain='sync')
 
-        comb += self.accumulator.eq(out)
+        return m3
 
-        comb += accum_shifted.eq(out[self.shift:].as_signed())
+    def _mult(self, data, coeff):
+        if self.log_exp_w is None:
+            return data * coeff
+        return log_product(data, coeff, self.log_exp_w)
 
-        comb += self.output.data.eq(accum_shifted)
-        comb += self.output.last.eq(self.output.valid)
 
-        return m
\ No newline at end of file
+class ParallelStreamMacc(StreamMacc):
+    _doc_ = """
+    Lane parallel version of the Stream Macc. Each clock, the
+    n_lanes samples of the input are multiplied by the n_lanes
+    coefficients of the current memory word, and the products
+    are summed by an adder tree before being accumulated.
+    The control logic is the same as in the Stream Macc.
+
+    Interfaces
+    ----------
+    input : Matrix Stream, input
+        Input data, with shape (n_lanes,).
+
+    coeff : {r_data, r_en, r_rdy}, input
+        Input coefficients. Each memory word has the n_lanes
+        coefficients packed, where the coefficient of lane 'i'
+        is r_data[i*width_c:(i+1)*width_c].
+
+    output : Data Stream, output
+        Output data. Will output valid data after a last is
+        asserted in the input interface.
+
+    Parameters
+    ----------
+    width_i : int
+        Bit width of each lane of the input stream interface.
+
+    width_c : int
+        Bit width of each coefficient.
+
+    n_lanes : int
+        Number of samples processed in parallel.
+
+    width_acc : int
+        Bit width of the accumulator.
+
+    shift : int
+        The accumulator result will be shifted to the right by
+        this number, so the output will be (accumulator / 2**shift).
+
+    width_b : int
+        Bit width of the bias. If None, there is no bias interface.
+
+    bias_shift : int
+        Fixed point scale of the bias in the accumulator.
+
+    log_exp_w : int
+        Logarithmic coefficients. See Stream Macc.
+    """
+
+    def __init__(self, width_i, width_c, n_lanes, width_acc=None, shift=None, width_b=None, bias_shift=None, log_exp_w=None):
+        StreamMacc.__init__(self, width_i=width_i, width_c=width_c,
+                            width_acc=width_acc, shift=shift,
+                            width_b=width_b, bias_shift=bias_shift,
+                            log_exp_w=log_exp_w)
+        self.n_lanes = n_lanes
+        self.width_c = width_c
+        self.input = MatrixStream(width=width_i, shape=(n_lanes,), direction='sink', name='input')
+        self.r_data = Signal(n_lanes * width_c)
+        n_stages = int(ceil(log2(n_lanes)))
+        if n_stages > 0:
+            self.tree = TreeAdderSigned(width_i=self.product_w,
+                                        n_stages=n_stages,
+                                        reg_in=False,
+                                        reg_out=False,
+                                        width_o=len(self.accumulator))
+            self.latency += self.tree.latency
+        else:
+            self.tree = None
+
+    def _product(self, m, clken):
+        comb = m.d.comb
+
+        _get_input = lambda x: Mux(self.input.accepted(), x, 0)
+
+        coeffs = [self.r_data[i*self.width_c:(i+1)*self.width_c] for i in range(self.n_lanes)]
+
+        pipeline = Pipeline()
+        stage_ops = []
+        for data, coeff in zip(self.input.data_ports, coeffs):
+            stage_ops += [_get_input(data.as_signed()), _get_input(coeff.as_signed())]
+        s0 = pipeline.add_stage(stage_ops)
+        s1 = pipeline.add_stage(s0)
+        m2 = pipeline.add_stage([self._mult(a, b) for a, b in zip(s1[0::2], s1[1::2])])
+        m3 = pipeline.add_stage(m2)
+        pipeline.generate(m=m, ce=clken, domain='sync')
+
+        if self.tree is None:
+            return m3[0]
+
+        m.submodules.tree = tree = self.tree
+        comb += tree.clken.eq(clken)
+        for i, tree_input in enumerate(tree.inputs):
+            if i < self.n_lanes:
+                comb += tree_input.eq(m3[i])
+            else:
+                comb += tree_input.eq(0)
+
+        return tree.output
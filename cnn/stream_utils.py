@@ -0,0 +1,501 @@
+from nmigen import *
+from nmigen.lib.fifo import SyncFIFOBuffered
+from cnn.interfaces import DataStream, MatrixStream, clone_stream
+from cnn.utils.operations import _incr
+
+
+# SyncFIFOBuffered needs 3 entries to be read and written in the same
+# clock (it never accepts data with depth=1, and runs at half rate with 2)
+min_fifo_depth = 3
+
+
+def _stream(width, shape, direction, name):
+    if shape is None:
+        return DataStream(width=width, direction=direction, name=name)
+    return MatrixStream(width=width, shape=shape, direction=direction, name=name)
+
+
+class SkidBuffer(Elaboratable):
+    _doc_ = """
+    Registered stage of a stream, with registered valid, data,
+    last AND ready, so it breaks every combinational path between
+    its input and its output, keeping one sample per clock.
+    When the output is stalled, the sample accepted in that cycle
+    (the input ready is registered, so it can't be stopped) is
+    kept in a second register (the skid register), and the input
+    is not ready until the skid register is emptied.
+
+    Interfaces
+    ----------
+    input : Data Stream or Matrix Stream, input
+        Data input.
+
+    output : Data Stream or Matrix Stream, output
+        Registered data output.
+
+    Parameters
+    ----------
+    width : int
+        Bit width of the data.
+
+    shape : tuple
+        Shape of the Matrix Stream. If None, the interfaces are
+        Data Streams.
+    """
+
+    def __init__(self, width, shape=None):
+        self.input = _stream(width, shape, 'sink', 'input')
+        self.output = _stream(width, shape, 'source', 'output')
+        self.latency = 1
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        skid_valid = Signal()
+        skid_last = Signal()
+        skid_data = [Signal.like(d, name='skid_' + d.name) for d in self.input.data_ports]
+
+        comb += self.input.ready.eq(~skid_valid)
+
+        with m.If(self.output.ready | ~self.output.valid):
+            with m.If(skid_valid):
+                sync += [self.output.valid.eq(1),
+                         self.output.last.eq(skid_last),
+                         skid_valid.eq(0),
+                        ]
+                sync += [o.eq(s) for o, s in zip(self.output.data_ports, skid_data)]
+            with m.Else():
+                sync += [self.output.valid.eq(self.input.valid),
+                         self.output.last.eq(self.input.last),
+                        ]
+                sync += [o.eq(i) for o, i in zip(self.output.data_ports, self.input.data_ports)]
+        with m.Elif(self.input.accepted()):
+            sync += [skid_valid.eq(1),
+                     skid_last.eq(self.input.last),
+                    ]
+            sync += [s.eq(i) for s, i in zip(skid_data, self.input.data_ports)]
+
+        return m
+
+
+class Broadcast(Elaboratable):
+    _doc_ = """
+    Copies each sample of the input to every output (fork), so one
+    stream can feed several consumers.
+    Without buffering (depth=0), each output takes the sample when
+    it is ready, and the input is accepted once every output has
+    taken it (an output that already took the sample waits for the
+    others), so the outputs don't need to be ready in the same
+    cycle. With buffering, each output has its own FIFO, and the
+    input is accepted while every FIFO has space, so a branch can
+    fall up to depth samples behind the others (as the shorter
+    branches of an inception block) without stalling them.
+
+    Interfaces
+    ----------
+    input : Stream, input
+        Data input.
+
+    outputs : list of Stream, output
+        Copies of the input.
+
+    Parameters
+    ----------
+    layout : Stream
+        Stream with the layout of the data (Data, Matrix, Sparse
+        or Complex Stream). Only its dataport is used.
+
+    n_outputs : int
+        Number of outputs.
+
+    depth : int
+        Depth of the FIFO of each output. 0 for no FIFO, otherwise
+        at least 3 (min_fifo_depth), the shortest FIFO that is read
+        and written in the same clock.
+    """
+
+    def __init__(self, layout, n_outputs, depth=0):
+        assert depth == 0 or depth >= min_fifo_depth, (
+            f'depth must be 0 or at least {min_fifo_depth} (got {depth})')
+        self.n_outputs = n_outputs
+        self.depth = depth
+        self.input = clone_stream(layout, 'sink', 'input')
+        self.outputs = [clone_stream(layout, 'source', 'output_' + str(i)) for i in range(n_outputs)]
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        for output in self.outputs:
+            ports += [output[f] for f in output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        if self.depth > 0:
+            w_rdy = []
+            for i, output in enumerate(self.outputs):
+                fifo = SyncFIFOBuffered(width=len(self.input.dataport.flat) + 1, depth=self.depth)
+                m.submodules['fifo_' + str(i)] = fifo
+                comb += [fifo.w_data.eq(Cat(self.input.dataport.flat, self.input.last)),
+                         fifo.w_en.eq(self.input.accepted()),
+                         output.valid.eq(fifo.r_rdy),
+                         Cat(output.dataport.flat, output.last).eq(fifo.r_data),
+                         fifo.r_en.eq(output.ready),
+                        ]
+                w_rdy.append(fifo.w_rdy)
+            comb += self.input.ready.eq(Cat(*w_rdy).all())
+
+        else:
+            # outputs that already took the current sample
+            done = Signal(self.n_outputs)
+            taken = Signal(self.n_outputs)
+            for i, output in enumerate(self.outputs):
+                comb += [output.valid.eq(self.input.valid & ~done[i]),
+                         output.dataport.eq(self.input.dataport),
+                         output.last.eq(self.input.last),
+                         taken[i].eq(done[i] | output.accepted()),
+                        ]
+            comb += self.input.ready.eq(taken.all())
+
+            with m.If(self.input.accepted()):
+                sync += done.eq(0)
+            with m.Else():
+                sync += done.eq(taken)
+
+        return m
+
+
+class Arbiter(Elaboratable):
+    _doc_ = """
+    Merges several streams into one. The output carries the
+    samples of the granted input, and the grant moves after each
+    accepted sample (or after each packet, delimited by the last,
+    if packet=True, so packets are not interleaved). It also moves
+    when the granted input has no valid sample, with one cycle to
+    switch. The next input is the first valid one after the
+    current one (round robin), or the lowest valid one if
+    priority=True (fixed priority).
+    The granted input is in the grant attribute.
+
+    Interfaces
+    ----------
+    inputs : list of Stream, input
+        Data inputs.
+
+    output : Stream, output
+        Merged stream.
+
+    Parameters
+    ----------
+    layout : Stream
+        Stream with the layout of the data (Data, Matrix, Sparse
+        or Complex Stream). Only its dataport is used.
+
+    n_inputs : int
+        Number of inputs.
+
+    packet : bool
+        Keep the grant until the last of the packet.
+
+    priority : bool
+        Fixed priority (input_0 first) instead of round robin.
+    """
+
+    def __init__(self, layout, n_inputs, packet=False, priority=False):
+        self.n_inputs = n_inputs
+        self.packet = packet
+        self.priority = priority
+        self.inputs = [clone_stream(layout, 'sink', 'input_' + str(i)) for i in range(n_inputs)]
+        self.output = clone_stream(layout, 'source', 'output')
+        self.grant = Signal(range(n_inputs))
+
+    def get_ports(self):
+        ports = []
+        for input_ in self.inputs:
+            ports += [input_[f] for f in input_.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        grant = self.grant
+        locked = Signal()
+
+        for i, input_ in enumerate(self.inputs):
+            with m.If(grant == i):
+                comb += [self.output.valid.eq(input_.valid),
+                         self.output.dataport.eq(input_.dataport),
+                         self.output.last.eq(input_.last),
+                         input_.ready.eq(self.output.ready),
+                        ]
+            with m.Else():
+                comb += input_.ready.eq(0)
+
+        # the last If with a valid input wins
+        next_grant = Signal.like(grant)
+        comb += next_grant.eq(grant)
+        if self.priority:
+            for j in reversed(range(self.n_inputs)):
+                with m.If(self.inputs[j].valid):
+                    comb += next_grant.eq(j)
+        else:
+            for g in range(self.n_inputs):
+                with m.If(grant == g):
+                    for k in reversed(range(1, self.n_inputs + 1)):
+                        j = (g + k) % self.n_inputs
+                        with m.If(self.inputs[j].valid):
+                            comb += next_grant.eq(j)
+
+        # the grant moves after each accepted sample (or packet), or
+        # when the granted input has nothing to send
+        current_valid = Array([input_.valid for input_ in self.inputs])[grant]
+        with m.If(self.output.accepted()):
+            if self.packet:
+                sync += locked.eq(~self.output.last)
+                with m.If(self.output.last):
+                    sync += grant.eq(next_grant)
+            else:
+                sync += grant.eq(next_grant)
+        with m.Elif(~current_valid & ~locked):
+            sync += grant.eq(next_grant)
+
+        return m
+
+
+class Join(Elaboratable):
+    _doc_ = """
+    Merges several streams into one in a fixed order: a sample
+    (or a packet, delimited by the last, if packet=True) of
+    input_0, then one of input_1, ..., input_{n_inputs-1}, and
+    again from input_0. It is the in order counterpart of the
+    Arbiter, to collect the results of parallel branches (as the
+    heads of a multi-head layer, or the cores of a Farm) in the
+    order they were issued. There is no bubble between inputs.
+
+    Interfaces
+    ----------
+    inputs : list of Stream, input
+        Data inputs.
+
+    output : Stream, output
+        Merged stream.
+
+    Parameters
+    ----------
+    layout : Stream
+        Stream with the layout of the data (Data, Matrix, Sparse
+        or Complex Stream). Only its dataport is used.
+
+    n_inputs : int
+        Number of inputs.
+
+    packet : bool
+        Take whole packets from each input.
+    """
+
+    def __init__(self, layout, n_inputs, packet=False):
+        self.n_inputs = n_inputs
+        self.packet = packet
+        self.inputs = [clone_stream(layout, 'sink', 'input_' + str(i)) for i in range(n_inputs)]
+        self.output = clone_stream(layout, 'source', 'output')
+
+    def get_ports(self):
+        ports = []
+        for input_ in self.inputs:
+            ports += [input_[f] for f in input_.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        current = Signal(range(self.n_inputs))
+
+        for i, input_ in enumerate(self.inputs):
+            with m.If(current == i):
+                comb += [self.output.valid.eq(input_.valid),
+                         self.output.dataport.eq(input_.dataport),
+                         self.output.last.eq(input_.last),
+                         input_.ready.eq(self.output.ready),
+                        ]
+            with m.Else():
+                comb += input_.ready.eq(0)
+
+        with m.If(self.output.accepted()):
+            if self.packet:
+                with m.If(self.output.last):
+                    sync += current.eq(_incr(current, self.n_inputs))
+            else:
+                sync += current.eq(_incr(current, self.n_inputs))
+
+        return m
+
+
+class Upsizer(Elaboratable):
+    _doc_ = """
+    Packs n_lanes consecutive samples of a Data Stream into one
+    sample of a Matrix Stream of shape (n_lanes,), the first one
+    in lane 0 (as cnn.tests.utils.pack). When the last of the
+    input comes before the word is complete, the word is output
+    with the remaining lanes set to zero, and the count restarts,
+    so each packet starts in lane 0. The last of the output is
+    asserted with the word of the last sample.
+    It takes one input per clock.
+
+    Interfaces
+    ----------
+    input : Data Stream, input
+        Data input.
+
+    output : Matrix Stream, output
+        Packed data.
+
+    Parameters
+    ----------
+    width : int
+        Bit width of the data.
+
+    n_lanes : int
+        Number of samples in each output word.
+    """
+
+    def __init__(self, width, n_lanes):
+        self.width = width
+        self.n_lanes = n_lanes
+        self.input = DataStream(width=width, direction='sink', name='input')
+        self.output = MatrixStream(width=width, shape=(n_lanes,), direction='source', name='output')
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        clken = Signal()
+        comb += clken.eq(~self.output.valid | self.output.ready)
+        comb += self.input.ready.eq(clken)
+
+        lane = Signal(range(self.n_lanes))
+        buffer = Array([Signal(self.width, name='buffer_' + str(i)) for i in range(self.n_lanes)])
+        complete = Signal()
+        comb += complete.eq((lane == self.n_lanes - 1) | self.input.last)
+
+        with m.If(self.input.accepted()):
+            sync += buffer[lane].eq(self.input.data)
+            with m.If(complete):
+                sync += lane.eq(0)
+            with m.Else():
+                sync += lane.eq(lane + 1)
+
+        with m.If(clken):
+            sync += [self.output.valid.eq(self.input.accepted() & complete),
+                     self.output.last.eq(self.input.last),
+                    ]
+            for i, o in enumerate(self.output.data_ports):
+                sync += o.eq(Mux(i < lane, buffer[i], Mux(i == lane, self.input.data, 0)))
+
+        return m
+
+
+class Downsizer(Elaboratable):
+    _doc_ = """
+    Unpacks each sample of a Matrix Stream of shape (n_lanes,)
+    into n_lanes consecutive samples of a Data Stream, starting by
+    lane 0 (as cnn.tests.utils.unpack). The last of the output is
+    asserted with the last lane of the last word. If the length of
+    the packets is given, the zero padding of the last word (see
+    Upsizer) is dropped.
+    The next word is accepted in the cycle the last lane of the
+    current one is output, so there are no bubbles between words.
+
+    Interfaces
+    ----------
+    input : Matrix Stream, input
+        Packed data.
+
+    output : Data Stream, output
+        Data output.
+
+    Parameters
+    ----------
+    width : int
+        Bit width of the data.
+
+    n_lanes : int
+        Number of samples in each input word.
+
+    length : int
+        Number of samples in each packet (delimited by the last).
+        If None, every lane of the last word is output.
+    """
+
+    def __init__(self, width, n_lanes, length=None):
+        self.width = width
+        self.n_lanes = n_lanes
+        self.length = length
+        self.input = MatrixStream(width=width, shape=(n_lanes,), direction='sink', name='input')
+        self.output = DataStream(width=width, direction='source', name='output')
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        # lanes of the last word of a packet
+        last_lanes = self.n_lanes
+        if self.length is not None and self.length % self.n_lanes:
+            last_lanes = self.length % self.n_lanes
+
+        word = Array([Signal(self.width, name='word_' + str(i)) for i in range(self.n_lanes)])
+        word_last = Signal()
+        lane = Signal(range(self.n_lanes))
+        end_lane = Signal(range(self.n_lanes))
+        end = Signal()
+
+        comb += [end.eq(lane == end_lane),
+                 self.input.ready.eq(~self.output.valid | (self.output.ready & end)),
+                 self.output.data.eq(word[lane]),
+                 self.output.last.eq(word_last & end),
+                ]
+
+        with m.If(self.input.accepted()):
+            sync += [self.output.valid.eq(1),
+                     word_last.eq(self.input.last),
+                     end_lane.eq(Mux(self.input.last, last_lanes - 1, self.n_lanes - 1)),
+                     lane.eq(0),
+                    ]
+            sync += [w.eq(i) for w, i in zip(word, self.input.data_ports)]
+        with m.Elif(self.output.accepted()):
+            with m.If(end):
+                sync += self.output.valid.eq(0)
+            with m.Else():
+                sync += lane.eq(lane + 1)
+
+        return m
@@ -152,3 +152,25 @@ class SignedMatrixStreamDriver(MatrixStreamDriver):
 
     def _get_random_data(self):
         return [random.randint(*_signed_limits(self.width)) for _ in range(self.n_elements)]
+
+
+class SparseStreamDriver(MetaStreamDriver):
+
+    def __init__(self, entity, name, clock):
+        self._signals = ['index', 'data']
+        MetaStreamDriver.__init__(self, entity, name, clock)
+
+    def write(self, data):
+        index, value = data
+        self.bus.index <= index
+        self.bus.data <= value
+
+    def read(self):
+        return (self.bus.index.value.integer, self.bus.data.value.integer)
+
+    def init_master(self):
+        MetaStreamDriver.init_master(self)
+        self.write((0, 0))
+
+    def _get_random_data(self):
+        return (random.getrandbits(len(self.bus.index)), random.getrandbits(len(self.bus.data)))
@@ -0,0 +1,59 @@
+import cocotb
+from cocotb.triggers import RisingEdge
+from cnn.tests.interfaces import StreamDriver
+import random
+
+
+class ExternalMemory():
+    """
+        Simulated external memory (DDR like) with a burst read
+        interface made of two Stream interfaces:
+        * requests: the data is the address of the first word
+          of the burst.
+        * responses: 'burst' words for each request, in order,
+          at least 'latency' clocks after the request.
+        Several requests can be outstanding.
+    """
+
+    def __init__(self, dut, req_name, resp_name, clock, data, burst, latency, base_addr=0):
+        self.clk = clock
+        self.req = StreamDriver(dut, name=req_name, clock=clock)
+        self.resp = StreamDriver(dut, name=resp_name, clock=clock)
+        self.data = data
+        self.burst = burst
+        self.latency = latency
+        self.base_addr = base_addr
+        self.requests = []
+
+    def init(self):
+        self.req.init_slave()
+        self.resp.init_master()
+
+    @cocotb.coroutine
+    def run(self, burps=False):
+        pending = []
+        t = 0
+        while True:
+            self.req.bus.ready <= (random.randint(0, 1) if burps else 1)
+            valid = random.randint(0, 1) if burps else 1
+            if valid and len(pending) and pending[0][0] <= t:
+                self.resp.bus.valid <= 1
+                self.resp.write(pending[0][1])
+                self.resp.bus.last <= pending[0][2]
+            else:
+                self.resp.bus.valid <= 0
+                self.resp.bus.last <= 0
+            yield RisingEdge(self.clk)
+            t += 1
+            if self.resp.accepted():
+                pending.pop(0)
+            if self.req.accepted():
+                addr = self.req.read()
+                self.requests.append(addr)
+                start = t + self.latency
+                if len(pending):
+                    start = max(start, pending[-1][0] + 1)
+                offset = addr - self.base_addr
+                for i in range(self.burst):
+                    last = 1 if i == self.burst - 1 else 0
+                    pending.append((start + i, self.data[offset + i], last))
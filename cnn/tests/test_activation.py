@@ -0,0 +1,83 @@
+from nmigen_cocotb import run
+from cnn.activation import Sigmoid, Tanh, pwl_interpolate
+from cnn.tests.interfaces import SignedStreamDriver as Driver
+from cnn.tests.utils import vcd_only_if_env
+import pytest
+import os
+import random
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+
+    m_axis = Driver(dut, name='input_', clock=dut.clk)
+    s_axis = Driver(dut, name='output_', clock=dut.clk)
+    width_i = len(dut.input__data)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    for i in range(3):
+        test_size = 100
+        wr_data = [random.randint(-2**(width_i-1), 2**(width_i-1)-1) for _ in range(test_size)]
+        cocotb.fork(m_axis.send(wr_data, burps=burps_in))
+        rd_data = yield s_axis.recv(burps=burps_out)
+
+        expected = [pwl_interpolate(x, base, delta, width_i, seg_bits) for x in wr_data]
+        assert rd_data == expected, f'\n{rd_data}\n!=\n{expected}'
+
+
+try:
+    running_cocotb = True
+    base = [int(x) for x in os.environ['coco_param_base'].split(',')]
+    delta = [int(x) for x in os.environ['coco_param_delta'].split(',')]
+    seg_bits = int(os.environ['coco_param_seg_bits'], 10)
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('dummy', [0] * 3)
+    tf_test_data.generate_tests()
+
+
+@pytest.mark.parametrize("function, width_i, frac_i, width_o, frac_o, seg_bits", [
+    ('sigmoid', 12, 8, 8, 7, 6),
+    ('sigmoid', 10, 6, 9, 8, 4),
+    ('tanh', 16, 12, 12, 10, 5),
+    ('tanh', 8, 5, 8, 6, 8),
+])
+def test_activation(function, width_i, frac_i, width_o, frac_o, seg_bits):
+    cls = {'sigmoid': Sigmoid, 'tanh': Tanh}[function]
+    core = cls(width_i=width_i,
+               frac_i=frac_i,
+               width_o=width_o,
+               frac_o=frac_o,
+               seg_bits=seg_bits)
+    os.environ['coco_param_base'] = ','.join([str(x) for x in core.base])
+    os.environ['coco_param_delta'] = ','.join([str(x) for x in core.delta])
+    os.environ['coco_param_seg_bits'] = str(seg_bits)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_activation_{function}_i{width_i}_o{width_o}_s{seg_bits}.vcd')
+    run(core, 'cnn.tests.test_activation', ports=ports, vcd_file=vcd_file)
@@ -0,0 +1,111 @@
+from nmigen_cocotb import run
+from cnn.stream_utils import Arbiter, Join
+from cnn.interfaces import SparseStream
+from cnn.tests.interfaces import SparseStreamDriver
+from cnn.tests.utils import vcd_only_if_env
+import pytest
+import os
+import random
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+
+@cocotb.coroutine
+def send_packets(driver, packets, burps):
+    for packet in packets:
+        yield driver.send(packet, burps=burps)
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+
+    # the index of each sample is the number of its input
+    m_axis = [SparseStreamDriver(dut, name=f'input_{i}_', clock=dut.clk) for i in range(n_inputs)]
+    s_axis = SparseStreamDriver(dut, name='output_', clock=dut.clk)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    for m in m_axis:
+        m.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    n_packets, packet_size = 4, 5
+    sent = []
+    for i, m in enumerate(m_axis):
+        data = [(i, random.getrandbits(8)) for _ in range(n_packets * packet_size)]
+        sent.append(data)
+        packets = [data[j:j+packet_size] for j in range(0, len(data), packet_size)]
+        cocotb.fork(send_packets(m, packets, burps_in))
+
+    rd_data, packets = [], []
+    while len(rd_data) < n_inputs * n_packets * packet_size:
+        rd = yield s_axis.recv(burps=burps_out)
+        rd_data += rd
+        packets.append(rd)
+
+    for i in range(n_inputs):
+        received = [x for x in rd_data if x[0] == i]
+        assert received == sent[i], f'input_{i}:\n{received}\n!=\n{sent[i]}'
+
+    if packet:
+        for p in packets:
+            assert len(set(x[0] for x in p)) == 1, f'interleaved packet: {p}'
+
+    if arbiter == 'join':
+        unit = packet_size if packet else 1
+        order = [x[0] for x in rd_data[::unit]]
+        assert order == [j % n_inputs for j in range(len(order))], f'{order}'
+
+
+try:
+    running_cocotb = True
+    arbiter = os.environ['coco_param_arbiter']
+    n_inputs = int(os.environ['coco_param_n_inputs'], 10)
+    packet = int(os.environ['coco_param_packet'], 10)
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.generate_tests()
+
+
+_arbiters = {
+    'round_robin': lambda **kwargs: Arbiter(priority=False, **kwargs),
+    'priority': lambda **kwargs: Arbiter(priority=True, **kwargs),
+    'join': Join,
+}
+
+@pytest.mark.parametrize("arbiter", list(_arbiters))
+@pytest.mark.parametrize("n_inputs, packet", [
+    (2, 0),
+    (3, 0),
+    (3, 1),
+])
+def test_arbiter(arbiter, n_inputs, packet):
+    os.environ['coco_param_arbiter'] = arbiter
+    os.environ['coco_param_n_inputs'] = f'{n_inputs}'
+    os.environ['coco_param_packet'] = f'{packet}'
+    core = _arbiters[arbiter](layout=SparseStream(8, 2, direction='sink'),
+                              n_inputs=n_inputs,
+                              packet=bool(packet))
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_{arbiter}_n{n_inputs}_p{packet}.vcd')
+    run(core, 'cnn.tests.test_arbiter', ports=ports, vcd_file=vcd_file)
@@ -0,0 +1,95 @@
+from nmigen_cocotb import run
+from cnn.classifier import Argmax
+from cnn.tests.utils import vcd_only_if_env
+from cnn.tests.interfaces import SignedStreamDriver, SignedMatrixStreamDriver, SparseStreamDriver
+
+import os
+import pytest
+import random
+import numpy as np
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+CLK_PERIOD_BASE = 100
+random.seed()
+
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+def to_signed(value, width):
+    return value - 2**width if value >= 2**(width-1) else value
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+
+    if n_lanes == 1:
+        m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
+    else:
+        m_axis = SignedMatrixStreamDriver(dut, name='input_', clock=dut.clk, shape=(n_lanes,))
+    s_axis = SparseStreamDriver(dut, name='output_', clock=dut.clk)
+    width = len(dut.output__data)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    for i in range(5):
+        # small range, to have repeated highest values
+        limit = 2**(width-1) if i % 2 else 4
+        data_in = [random.randint(-limit, limit-1) for _ in range(n_inputs)]
+        if n_lanes == 1:
+            words = data_in
+        else:
+            words = [data_in[j:j+n_lanes] for j in range(0, n_inputs, n_lanes)]
+        cocotb.fork(m_axis.send(words, burps_in))
+        rd = yield s_axis.recv(burps=burps_out)
+        assert len(rd) == 1, f'{rd}'
+        index, value = rd[0]
+        expected = (int(np.argmax(data_in)), max(data_in))
+        assert (index, to_signed(value, width)) == expected, f'{rd[0]} != {expected}'
+
+
+try:
+    running_cocotb = True
+    n_inputs = int(os.environ['coco_param_n_inputs'], 10)
+    n_lanes = int(os.environ['coco_param_n_lanes'], 10)
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('dummy', [0] * 3)
+    tf_test_data.generate_tests()
+
+
+@pytest.mark.parametrize("width, n_inputs, n_lanes", [
+    (8, 10, 1),
+    (8, 12, 4),
+    (16, 9, 3),
+    (8, 16, 8),
+])
+def test_argmax(width, n_inputs, n_lanes):
+    core = Argmax(width=width,
+                  n_inputs=n_inputs,
+                  n_lanes=n_lanes)
+    os.environ['coco_param_n_inputs'] = str(n_inputs)
+    os.environ['coco_param_n_lanes'] = str(n_lanes)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_argmax_w{width}_n{n_inputs}_l{n_lanes}.vcd')
+    run(core, 'cnn.tests.test_argmax', ports=ports, vcd_file=vcd_file)
@@ -0,0 +1,108 @@
+from nmigen_cocotb import run
+from cnn.binary_dot_product import BinaryDotProduct, TernaryDotProduct
+from cnn.tests.utils import vcd_only_if_env
+from cnn.tests.interfaces import MatrixStreamDriver, SignedMatrixStreamDriver
+from cnn.tests.interfaces import SignedStreamDriver as Driver
+import pytest
+import random
+import numpy as np
+import os
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+CLK_PERIOD_BASE = 100
+random.seed()
+
+
+class TernaryMatrixStreamDriver(SignedMatrixStreamDriver):
+    def _get_random_data(self):
+        return [random.choice([-1, 0, 1]) for _ in range(self.n_elements)]
+
+
+@cocotb.coroutine
+def init_test(dut):
+    dut.rst <= 1
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+def binary_value(x):
+    return 1 if x else -1
+
+def check_monitors_data(input_a, input_b, output, ternary):
+    value = (lambda x: x) if ternary else binary_value
+    for a, b, o in zip(input_a, input_b, output):
+        expected_o = sum([value(x) * value(y) for x, y in zip(a, b)])
+        assert o == expected_o, f'{o} == {expected_o}'
+
+@cocotb.coroutine
+def check_data(dut, shape, ternary, burps_in, burps_out, dummy=0):
+
+    test_size = 20
+    yield init_test(dut)
+
+    MatrixDriver = TernaryMatrixStreamDriver if ternary else MatrixStreamDriver
+    m_axis_a = MatrixDriver(dut, name='input_a_', clock=dut.clk, shape=shape)
+    m_axis_b = MatrixDriver(dut, name='input_b_', clock=dut.clk, shape=shape)
+    s_axis = Driver(dut, name='output_', clock=dut.clk)
+    m_axis_a.init_master()
+    m_axis_b.init_master()
+    s_axis.init_slave()
+    yield RisingEdge(dut.clk)
+
+    wr_a = [m_axis_a._get_random_data() for _ in range(test_size)]
+    wr_b = [m_axis_b._get_random_data() for _ in range(test_size)]
+
+    cocotb.fork(m_axis_a.monitor())
+    cocotb.fork(m_axis_b.monitor())
+
+    cocotb.fork(m_axis_a.send(wr_a, burps_in))
+    cocotb.fork(m_axis_b.send(wr_b, burps=False)) # Dummy interface!
+
+    rd = yield s_axis.recv(test_size, burps_out)
+
+    assert len(rd) == test_size, f'{len(rd)} == {test_size}'
+    check_monitors_data(m_axis_a.buffer, m_axis_b.buffer, rd, ternary)
+
+
+try:
+    string_to_tuple = lambda string: tuple([int(i) for i in string.replace('(', '').replace(')', '').split(',')])
+    running_cocotb = True
+    shape = string_to_tuple(os.environ['coco_param_shape'])
+    ternary = bool(int(os.environ['coco_param_ternary']))
+except KeyError as e:
+    running_cocotb = False
+
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('shape', [shape])
+    tf_test_data.add_option('ternary', [ternary])
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('dummy', [0] * 5) # repeat 5 times
+    tf_test_data.generate_tests()
+
+@pytest.mark.parametrize("shape, ternary", [
+    ((3,3), False),
+    ((4,2), False),
+    ((1,1), False),
+    ((3,3), True),
+    ((5,5), True),
+])
+def test_binary_dot_product(shape, ternary):
+    os.environ['coco_param_shape'] = str(shape)
+    os.environ['coco_param_ternary'] = str(int(ternary))
+    core_class = TernaryDotProduct if ternary else BinaryDotProduct
+    core = core_class(shape=shape)
+    ports = core.get_ports()
+    printable_shape = '_'.join([str(i) for i in shape])
+    vcd_file = vcd_only_if_env(f'./test_binary_dot_product_t{int(ternary)}_shape{printable_shape}.vcd')
+    run(core, 'cnn.tests.test_binary_dot_product', ports=ports, vcd_file=vcd_file)
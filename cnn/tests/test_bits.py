@@ -0,0 +1,78 @@
+from cnn.utils.bits import range_required_bits, dot_product_range, dot_product_bits, accumulator_bits
+import itertools
+import pytest
+
+
+@pytest.mark.parametrize("low, high, expected", [
+    (0, 0, 1),
+    (-1, 0, 1),
+    (0, 1, 2),
+    (-128, 127, 8),
+    (-129, 127, 9),
+    (-128, 128, 9),
+    (0, 127, 8),
+    (0, 128, 9),
+    (-128, 0, 8),
+    (-3, 100, 8),
+    (-1000, 5, 11),
+    (7, 7, 4),
+    (-8, -8, 4),
+])
+def test_range_required_bits(low, high, expected):
+    assert range_required_bits(low, high) == expected
+    n = expected
+    assert -2**(n-1) <= low and high <= 2**(n-1)-1
+    assert low < -2**(n-2) or high > 2**(n-2)-1
+
+
+@pytest.mark.parametrize("coeffs, input_range, expected", [
+    ([0, 0, 0], (-128, 127), (0, 0)),
+    ([1, 2, 3], (0, 0), (0, 0)),
+    ([1, 2, 3], (0, 127), (0, 6*127)),
+    ([-1, -2, -3], (0, 127), (-6*127, 0)),
+    ([3, -2], (-128, 127), (3*-128 + -2*127, 3*127 + -2*-128)),
+    ([5, -7], (-4, 10), (5*-4 + -7*10, 5*10 + -7*-4)),
+    ([-128], (-128, 127), (-128*127, 128*128)),
+])
+def test_dot_product_range(coeffs, input_range, expected):
+    assert dot_product_range(coeffs, input_range) == expected
+
+
+@pytest.mark.parametrize("coeffs, input_range", [
+    ([0, 0], (-8, 7)),
+    ([1, -1], (0, 0)),
+    ([3, -5, 2], (-8, 7)),
+    ([-8, -8, -8], (0, 15)),
+    ([7, 1], (-3, 12)),
+    ([-1], (-128, 127)),
+])
+def test_dot_product_bits(coeffs, input_range):
+    # compare against every combination of extreme inputs
+    sums = [sum(c * x for c, x in zip(coeffs, xs))
+            for xs in itertools.product(input_range, repeat=len(coeffs))]
+    assert dot_product_range(coeffs, input_range) == (min(sums), max(sums))
+    assert dot_product_bits(coeffs, input_range) == range_required_bits(min(sums), max(sums))
+
+
+@pytest.mark.parametrize("coeffs, n_inputs, input_range, bias, bias_shift, expected", [
+    ([0, 0, 0, 0], 2, (-128, 127), None, 0, 1),
+    ([0, 0], 2, (-128, 127), [1], 7, 9),
+    ([1, 1], 2, (0, 0), None, 0, 1),
+    # widest vector wins
+    ([1, 1, 100, -100], 2, (0, 127), None, 0, 15),
+    # bias moves the range
+    ([64, 63], 2, (0, 1), [0], 0, 8),
+    ([64, 63], 2, (0, 1), [1], 0, 9),
+    ([64, 64], 2, (0, 1), [-1], 7, 8),
+    ([-64, -64], 2, (0, 1), [-1], 0, 9),
+    ([-64, -64], 2, (0, 1), [1], 6, 8),
+])
+def test_accumulator_bits(coeffs, n_inputs, input_range, bias, bias_shift, expected):
+    assert accumulator_bits(coeffs, n_inputs, input_range, bias, bias_shift) == expected
+    n_vectors = len(coeffs) // n_inputs
+    if bias is None:
+        bias = [0] * n_vectors
+    for i in range(n_vectors):
+        low, high = dot_product_range(coeffs[i*n_inputs:(i+1)*n_inputs], input_range)
+        b = bias[i] << bias_shift
+        assert range_required_bits(low + b, high + b) <= expected
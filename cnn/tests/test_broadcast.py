@@ -0,0 +1,83 @@
+from nmigen_cocotb import run
+from cnn.stream_utils import Broadcast
+from cnn.interfaces import DataStream
+from cnn.tests.interfaces import StreamDriver
+from cnn.tests.utils import vcd_only_if_env
+import pytest
+import os
+import random
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge, Join
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+
+    m_axis = StreamDriver(dut, name='input_', clock=dut.clk)
+    s_axis = [StreamDriver(dut, name=f'output_{i}_', clock=dut.clk) for i in range(n_outputs)]
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    for s in s_axis:
+        s.init_slave()
+    yield reset(dut)
+
+    for i in range(3):
+        test_size = 50
+        wr_data = [m_axis._get_random_data() for _ in range(test_size)]
+        receivers = [cocotb.fork(s.recv(burps=burps_out)) for s in s_axis]
+        yield m_axis.send(wr_data, burps=burps_in)
+        for j, r in enumerate(receivers):
+            rd_data = yield Join(r)
+            assert rd_data == wr_data, f'output_{j}:\n{rd_data}\n!=\n{wr_data}'
+
+
+try:
+    running_cocotb = True
+    n_outputs = int(os.environ['coco_param_n_outputs'], 10)
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.generate_tests()
+
+
+@pytest.mark.parametrize("width, n_outputs, depth", [
+    (8, 2, 0),
+    (8, 3, 0),
+    (8, 2, 3),
+    (16, 3, 4),
+])
+def test_broadcast(width, n_outputs, depth):
+    os.environ['coco_param_n_outputs'] = f'{n_outputs}'
+    core = Broadcast(layout=DataStream(width, direction='sink'),
+                     n_outputs=n_outputs,
+                     depth=depth)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_broadcast_w{width}_n{n_outputs}_d{depth}.vcd')
+    run(core, 'cnn.tests.test_broadcast', ports=ports, vcd_file=vcd_file)
+
+
+@pytest.mark.parametrize("depth", [1, 2])
+def test_broadcast_short_fifo(depth):
+    # shorter FIFOs don't run at full rate
+    with pytest.raises(AssertionError):
+        Broadcast(layout=DataStream(8, direction='sink'), n_outputs=2, depth=depth)
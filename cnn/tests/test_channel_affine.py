@@ -0,0 +1,119 @@
+from nmigen_cocotb import run
+from cnn.channel_affine import ChannelAffine, channel_affine, batchnorm_affine, fold_batchnorm
+from cnn.tests.interfaces import SignedStreamDriver as Driver
+from cnn.tests.utils import vcd_only_if_env
+import pytest
+import numpy as np
+import os
+import random
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+
+def calc_expected(wr_data, scale, offset, shift, width_o):
+    expected = []
+    for i, val in enumerate(wr_data):
+        c = i % len(scale)
+        expected.append(channel_affine(val, scale[c], offset[c], shift, width_o))
+    return expected
+
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+
+    m_axis = Driver(dut, name='input_', clock=dut.clk)
+    s_axis = Driver(dut, name='output_', clock=dut.clk)
+    width_i = len(dut.input__data)
+    width_o = len(dut.output__data)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    for i in range(3):
+        # a whole number of pixels, so the channels stay aligned
+        test_size = 10 * len(scale)
+        wr_data = [random.randint(-2**(width_i-1), 2**(width_i-1)-1) for _ in range(test_size)]
+        cocotb.fork(m_axis.send(wr_data, burps=burps_in))
+        rd_data = yield s_axis.recv(burps=burps_out)
+
+        expected = calc_expected(wr_data, scale, offset, shift, width_o)
+        assert rd_data == expected, f'\n{rd_data}\n!=\n{expected}'
+
+
+try:
+    running_cocotb = True
+    scale = [int(x) for x in os.environ['coco_param_scale'].split(',')]
+    offset = [int(x) for x in os.environ['coco_param_offset'].split(',')]
+    shift = int(os.environ['coco_param_shift'], 10)
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('dummy', [0] * 3)
+    tf_test_data.generate_tests()
+
+
+@pytest.mark.parametrize("width_i, width_o, n_channels, shift, zeros", [
+    (8, 8, 1, 8, False),
+    (16, 8, 3, 10, False),
+    (12, 6, 8, 6, False),
+    (8, 8, 1, 8, True),
+    (12, 8, 4, 8, True),
+])
+def test_channel_affine(width_i, width_o, n_channels, shift, zeros):
+    gamma = np.random.uniform(0.5, 2, n_channels)
+    beta = np.random.uniform(-10, 10, n_channels)
+    mean = np.random.uniform(-20, 20, n_channels)
+    var = np.random.uniform(0.5, 4, n_channels)
+    if zeros:
+        # pruned channel (zero scale) and channel with zero offset
+        gamma[0] = 0
+        beta[-1] = mean[-1] * gamma[-1] / np.sqrt(var[-1] + 1e-3)
+    scale, offset = batchnorm_affine(gamma, beta, mean, var, shift)
+    os.environ['coco_param_scale'] = ','.join([str(x) for x in scale])
+    os.environ['coco_param_offset'] = ','.join([str(x) for x in offset])
+    os.environ['coco_param_shift'] = str(shift)
+    core = ChannelAffine(width_i=width_i,
+                         width_o=width_o,
+                         scale=scale,
+                         offset=offset,
+                         shift=shift)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_channel_affine_i{width_i}_o{width_o}_c{n_channels}_z{int(zeros)}.vcd')
+    run(core, 'cnn.tests.test_channel_affine', ports=ports, vcd_file=vcd_file)
+
+
+@pytest.mark.parametrize("n_channels", [None, 4])
+def test_fold_batchnorm(n_channels):
+    shape = (3, 3) if n_channels is None else (n_channels, 3, 3)
+    n = 1 if n_channels is None else n_channels
+    kernel = np.random.uniform(-1, 1, shape)
+    bias, gamma, beta, mean, var = [np.random.uniform(0.5, 2, n) for _ in range(5)]
+    if n_channels is None:
+        bias, gamma, beta, mean, var = bias[0], gamma[0], beta[0], mean[0], var[0]
+    folded_kernel, folded_bias = fold_batchnorm(kernel, bias, gamma, beta, mean, var)
+    x = np.random.uniform(-1, 1, (3, 3))
+    conv = np.sum(kernel * x, axis=(-2, -1)) + bias
+    expected = gamma * (conv - mean) / np.sqrt(var + 1e-3) + beta
+    result = np.sum(folded_kernel * x, axis=(-2, -1)) + folded_bias
+    assert np.allclose(result, expected), f'{result} != {expected}'
@@ -0,0 +1,98 @@
+from nmigen_cocotb import run
+from cnn.constant_dot_product import ConstantDotProduct, csd
+from cnn.tests.utils import vcd_only_if_env
+from cnn.tests.interfaces import SignedMatrixStreamDriver as MatrixDriver
+from cnn.tests.interfaces import SignedStreamDriver as Driver
+import pytest
+import random
+import numpy as np
+import os
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+CLK_PERIOD_BASE = 100
+random.seed()
+
+
+@cocotb.coroutine
+def init_test(dut):
+    dut.rst <= 1
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+def check_monitors_data(input_a, kernel, output):
+    assert len(input_a) == len(output), f'{len(input_a)} == {len(output)}'
+    for a, o in zip(input_a, output):
+        expected_o = sum(np.multiply(a, kernel))
+        assert o == expected_o, f'{o} == {expected_o}'
+
+@cocotb.coroutine
+def check_data(dut, burps_in, burps_out, dummy=0):
+
+    test_size = 20
+    yield init_test(dut)
+
+    m_axis = MatrixDriver(dut, name='input_', clock=dut.clk, shape=shape)
+    s_axis = Driver(dut, name='output_', clock=dut.clk)
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield RisingEdge(dut.clk)
+
+    wr_data = [m_axis._get_random_data() for _ in range(test_size)]
+
+    cocotb.fork(m_axis.monitor())
+    cocotb.fork(m_axis.send(wr_data, burps_in))
+    rd_data = yield s_axis.recv(test_size, burps_out)
+
+    check_monitors_data(m_axis.buffer, kernel, rd_data)
+
+
+try:
+    running_cocotb = True
+    shape = tuple([int(x) for x in os.environ['coco_param_shape'].split(',')])
+    kernel = [int(x) for x in os.environ['coco_param_kernel'].split(',')]
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('dummy', [0] * 5) # repeat 5 times
+    tf_test_data.generate_tests()
+
+
+@pytest.mark.parametrize("value", range(-300, 300))
+def test_csd(value):
+    digits = csd(value)
+    assert sum([sign * 2**shift for shift, sign in digits]) == value
+    shifts = [shift for shift, _ in digits]
+    assert all([b - a > 1 for a, b in zip(shifts[:-1], shifts[1:])]), f'{digits}'
+
+
+@pytest.mark.parametrize("width_i, kernel", [
+    (8, [[1, 2, 1], [2, 4, 2], [1, 2, 1]]),
+    (8, [[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]]),
+    (8, [[0, 0], [0, 0]]),
+    (8, [[0, 5], [0, 0]]),
+    (8, np.random.randint(-128, 128, (3, 3))),
+    (8, np.random.randint(-128, 128, (5, 5))),
+])
+def test_constant_dot_product(width_i, kernel):
+    kernel = np.array(kernel)
+    os.environ['coco_param_shape'] = ','.join([str(x) for x in kernel.shape])
+    os.environ['coco_param_kernel'] = ','.join([str(x) for x in kernel.flatten()])
+    core = ConstantDotProduct(width_i=width_i,
+                              kernel=kernel)
+    ports = core.get_ports()
+    printable_shape = '_'.join([str(i) for i in kernel.shape])
+    vcd_file = vcd_only_if_env(f'./test_constant_dot_product_i{width_i}_shape{printable_shape}.vcd')
+    run(core, 'cnn.tests.test_constant_dot_product', ports=ports, vcd_file=vcd_file)
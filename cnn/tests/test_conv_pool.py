@@ -0,0 +1,177 @@
+from nmigen_cocotb import run
+from cnn.conv_pool import ConvPool
+from cnn.tests.interfaces import SignedStreamDriver, SignedMatrixStreamDriver
+from cnn.tests.utils import vcd_only_if_env, fused_output
+import pytest
+import numpy as np
+import os
+from scipy import signal
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+
+def get_expected_data(wr_data, kernel, img_height, img_width, N, pool_size, fused=None):
+    input_image = np.reshape(wr_data, (img_height, img_width))
+    conv = signal.convolve2d(input_image, np.reshape(kernel, (N, N))[::-1,::-1], mode='valid')
+    if fused is not None:
+        conv = np.vectorize(lambda x: fused_output(int(x), **fused))(conv)
+    P = pool_size
+    return [int(conv[r:r+P, c:c+P].max()) for r in range(0, conv.shape[0], P)
+                                          for c in range(0, conv.shape[1], P)]
+
+
+@cocotb.coroutine
+def init_test(dut):
+    dut.rst <= 1
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+
+    yield init_test(dut)
+
+    m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
+    s_axis = SignedStreamDriver(dut, name='output_', clock=dut.clk)
+
+    m_axis.init_master()
+    s_axis.init_slave()
+    if kernel is None:
+        m_axis_coeff = SignedMatrixStreamDriver(dut, name='coeff_', clock=dut.clk, shape=(N,N))
+        m_axis_coeff.init_master()
+    yield RisingEdge(dut.clk)
+
+    if kernel is None:
+        # the kernel is held constant in the coeff stream
+        coeff = m_axis_coeff._get_random_data()
+        m_axis_coeff.write(coeff)
+        m_axis_coeff.bus.valid <= 1
+    else:
+        coeff = kernel
+
+    wr_data = [m_axis._get_random_data() for _ in range(img_height * img_width)]
+    expected = get_expected_data(wr_data, coeff, img_height, img_width, N, pool_size, fused)
+
+    cocotb.fork(m_axis.send(wr_data, burps_in))
+    rd_data = yield s_axis.recv(burps=burps_out)
+
+    assert rd_data == expected, f'\n{rd_data}\n!=\n{expected}'
+
+
+try:
+    running_cocotb = True
+    N = int(os.environ['coco_param_N'], 10)
+    img_width = int(os.environ['coco_param_img_width'], 10)
+    img_height = int(os.environ['coco_param_img_height'], 10)
+    pool_size = int(os.environ['coco_param_pool_size'], 10)
+    kernel = os.environ.get('coco_param_kernel', None)
+    if kernel is not None:
+        kernel = [int(x) for x in kernel.split(',')]
+    fused = os.environ.get('coco_param_fused', None)
+    if fused is not None:
+        _int = lambda x: None if x == 'None' else int(x)
+        fused = dict(zip(['acc_w', 'bias', 'bias_shift', 'relu_leak', 'multiplier', 'shift', 'zero_point', 'width_act'],
+                         [_int(x) for x in fused.split(',')]))
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.generate_tests()
+
+
+@pytest.mark.timeout(10)
+@pytest.mark.parametrize("width, img_height, img_width, N, pool_size", [
+    (8, 6, 6, 3, 2),
+    (8, 8, 11, 3, 3),
+    (8, 9, 5, 2, 2),
+])
+def test_conv_pool(width, img_height, img_width, N, pool_size):
+    kernel = np.random.randint(-8, 8, (N, N))
+    os.environ['coco_param_N'] = str(N)
+    os.environ['coco_param_img_height'] = str(img_height)
+    os.environ['coco_param_img_width'] = str(img_width)
+    os.environ['coco_param_pool_size'] = str(pool_size)
+    os.environ['coco_param_kernel'] = ','.join([str(x) for x in kernel.flatten()])
+    os.environ.pop('coco_param_fused', None)
+    core = ConvPool(width=width,
+                    input_shape=(img_height, img_width),
+                    N=N,
+                    n_cores=1,
+                    pool_size=pool_size,
+                    kernel=kernel)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_conv_pool_i{width}_h{img_height}_w{img_width}_N{N}_P{pool_size}.vcd')
+    run(core, 'cnn.tests.test_conv_pool', ports=ports, vcd_file=vcd_file)
+
+
+@pytest.mark.timeout(10)
+@pytest.mark.parametrize("width, img_height, img_width, N, n_cores, pool_size", [
+    (8, 6, 6, 3, 1, 2),
+    (8, 8, 11, 3, 9, 3),
+    (8, 9, 5, 2, 4, 2),
+])
+def test_conv_pool_coeff(width, img_height, img_width, N, n_cores, pool_size):
+    os.environ['coco_param_N'] = str(N)
+    os.environ['coco_param_img_height'] = str(img_height)
+    os.environ['coco_param_img_width'] = str(img_width)
+    os.environ['coco_param_pool_size'] = str(pool_size)
+    os.environ.pop('coco_param_kernel', None)
+    os.environ.pop('coco_param_fused', None)
+    core = ConvPool(width=width,
+                    input_shape=(img_height, img_width),
+                    N=N,
+                    n_cores=n_cores,
+                    pool_size=pool_size)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_conv_pool_coeff_i{width}_h{img_height}_w{img_width}_N{N}_n{n_cores}_P{pool_size}.vcd')
+    run(core, 'cnn.tests.test_conv_pool', ports=ports, vcd_file=vcd_file)
+
+
+@pytest.mark.timeout(10)
+@pytest.mark.parametrize("constant, bias, bias_shift, relu_leak, multiplier, shift, zero_point, width_act", [
+    (True, 100, 2, 0, 77, 10, 0, 8),
+    (True, None, 0, 3, 3, 6, -3, 6),
+    (False, -300, 0, 16, 100, 9, 0, 8),
+    (False, None, 0, 0, None, 0, 0, None),
+])
+def test_conv_pool_fused(constant, bias, bias_shift, relu_leak, multiplier, shift, zero_point, width_act):
+    width, img_height, img_width, N, pool_size = 8, 8, 8, 3, 2
+    kernel = np.random.randint(-128, 128, (N, N)) if constant else None
+    core = ConvPool(width=width,
+                    input_shape=(img_height, img_width),
+                    N=N,
+                    n_cores=1 if constant else 9,
+                    pool_size=pool_size,
+                    kernel=kernel,
+                    bias=bias,
+                    bias_shift=bias_shift,
+                    relu_leak=relu_leak,
+                    multiplier=multiplier,
+                    shift=shift,
+                    zero_point=zero_point,
+                    width_act=width_act)
+    fused = [core.convolution.acc_w, bias, bias_shift, relu_leak, multiplier, shift, zero_point, width_act]
+    os.environ['coco_param_N'] = str(N)
+    os.environ['coco_param_img_height'] = str(img_height)
+    os.environ['coco_param_img_width'] = str(img_width)
+    os.environ['coco_param_pool_size'] = str(pool_size)
+    if constant:
+        os.environ['coco_param_kernel'] = ','.join([str(x) for x in kernel.flatten()])
+    else:
+        os.environ.pop('coco_param_kernel', None)
+    os.environ['coco_param_fused'] = ','.join([str(x) for x in fused])
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_conv_pool_fused_k{int(constant)}_b{bias}_l{relu_leak}_m{multiplier}.vcd')
+    run(core, 'cnn.tests.test_conv_pool', ports=ports, vcd_file=vcd_file)
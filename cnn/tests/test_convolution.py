@@ -1,7 +1,8 @@
 from nmigen_cocotb import run
 from cnn.convolution import Convolution
+from cnn.log_quant import log_decode
 from cnn.tests.interfaces import SignedMatrixStreamDriver, SignedStreamDriver
-from cnn.tests.utils import vcd_only_if_env
+from cnn.tests.utils import vcd_only_if_env, fused_output
 import pytest
 import numpy as np
 import os
@@ -18,11 +19,13 @@ except:
 CLK_PERIOD_BASE = 100
 
 
-def check_monitors_data(coeff, buff_in, buff_out, img_width, img_height, N):
+def check_monitors_data(coeff, buff_in, buff_out, img_width, img_height, N, fused=None):
     input_image = np.reshape(buff_in, (img_height, img_width))
     input_coeff = np.reshape(coeff, (N, N))
     output_image = np.reshape(buff_out, (img_height + 1 - N, img_width + 1 - N))
     expected_output = signal.convolve2d(input_image, input_coeff[::-1,::-1], mode='valid')
+    if fused is not None:
+        expected_output = np.vectorize(lambda x: fused_output(int(x), **fused))(expected_output)
     assert (output_image == expected_output).all(), (
         f'\n{output_image}\n!=\n{expected_output}\n')
 
@@ -41,7 +44,7 @@ def check_data(dut, N, img_width, img_height=5, n_cores=1, burps_in=False, burps
 
     yield init_test(dut)
 
-    m_axis_coeff = SignedMatrixStreamDriver(dut, name='coeff_', clock=dut.clk, shape=(N,N), signed=True)
+    m_axis_coeff = SignedMatrixStreamDriver(dut, name='coeff_', clock=dut.clk, shape=(N,N))
     m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
     s_axis = SignedStreamDriver(dut, name='output_', clock=dut.clk)
     width = len(dut.input__data)
@@ -55,10 +58,15 @@ def check_data(dut, N, img_width, img_height=5, n_cores=1, burps_in=False, burps
     wr_data = wr_b = [int(x % (2**width-1)) for x in range(image_size)]
     expected_output_length = (img_width + 1 - N) * (img_height + 1 - N)
 
+    # the kernel is held constant in the coeff stream
     coeff = m_axis_coeff._get_random_data()
     m_axis_coeff.write(coeff)
+    m_axis_coeff.bus.valid <= 1
 
     dut._log.debug(f'coeff={coeff}')
+    if log_exp_w is not None:
+        # every code is a valid power of two weight
+        coeff = list(log_decode([c % 2**m_axis_coeff.width for c in coeff], log_exp_w))
 
     cocotb.fork(m_axis.monitor())
     cocotb.fork(s_axis.monitor())
@@ -75,18 +83,70 @@ def check_data(dut, N, img_width, img_height=5, n_cores=1, burps_in=False, burps
     assert len(s_axis.buffer) == expected_output_length, f'{len(s_axis.buffer)} != {expected_output_length}'
     
     check_monitors_data(coeff=coeff, buff_in=m_axis.buffer, buff_out=s_axis.buffer,
-                        img_width=img_width, img_height=img_height, N=N)
+                        img_width=img_width, img_height=img_height, N=N, fused=fused)
+
+
+@cocotb.coroutine
+def check_data_constant(dut, N, img_width, img_height=5, burps_in=False, burps_out=False, dummy=0):
+
+    yield init_test(dut)
+
+    m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
+    s_axis = SignedStreamDriver(dut, name='output_', clock=dut.clk)
+    width = len(dut.input__data)
+
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield RisingEdge(dut.clk)
+
+    image_size = img_width * img_height
+    wr_data = [m_axis._get_random_data() for _ in range(image_size)]
+    expected_output_length = (img_width + 1 - N) * (img_height + 1 - N)
+
+    cocotb.fork(m_axis.monitor())
+    cocotb.fork(s_axis.monitor())
+    cocotb.fork(s_axis.recv(expected_output_length, burps_out))
+
+    yield m_axis.send(wr_data, burps_in)
+
+    while len(s_axis.buffer) < expected_output_length:
+        yield RisingEdge(dut.clk)
+
+    assert len(s_axis.buffer) == expected_output_length, f'{len(s_axis.buffer)} != {expected_output_length}'
+    
+    check_monitors_data(coeff=kernel, buff_in=m_axis.buffer, buff_out=s_axis.buffer,
+                        img_width=img_width, img_height=img_height, N=N, fused=fused)
 
 
 try:
     running_cocotb = True
     N = int(os.environ['coco_param_N'], 10)
-    img_width = int(os.environ['coco_param_image_w'], 10)
+    img_width = int(os.environ['coco_param_img_width'], 10)
+    img_height = int(os.environ['coco_param_img_height'], 10)
     n_cores = int(os.environ['coco_param_n_cores'], 10)
+    kernel = os.environ.get('coco_param_kernel', None)
+    if kernel is not None:
+        kernel = [int(x) for x in kernel.split(',')]
+    log_exp_w = os.environ.get('coco_param_log_exp_w', None)
+    if log_exp_w is not None:
+        log_exp_w = int(log_exp_w, 10)
+    fused = os.environ.get('coco_param_fused', None)
+    if fused is not None:
+        _int = lambda x: None if x == 'None' else int(x)
+        fused = dict(zip(['acc_w', 'bias', 'bias_shift', 'relu_leak', 'multiplier', 'shift', 'zero_point', 'width_act'],
+                         [_int(x) for x in fused.split(',')]))
 except KeyError as e:
     running_cocotb = False
 
-if running_cocotb:
+if running_cocotb and kernel is not None:
+    tf_test_data = TF(check_data_constant)
+    tf_test_data.add_option('N', [N])
+    tf_test_data.add_option('img_width', [img_width])
+    tf_test_data.add_option('img_height', [img_height])
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.generate_tests()
+elif running_cocotb:
     tf_test_data = TF(check_data)
     tf_test_data.add_option('N', [N])
     tf_test_data.add_option('img_width', [img_width])
@@ -109,6 +169,9 @@ def test_convolution(width, img_height, img_width, N, n_cores):
     os.environ['coco_param_img_height'] = str(img_height)
     os.environ['coco_param_img_width'] = str(img_width)
     os.environ['coco_param_n_cores'] = str(int(n_cores))
+    os.environ.pop('coco_param_kernel', None)
+    os.environ.pop('coco_param_fused', None)
+    os.environ.pop('coco_param_log_exp_w', None)
     core = Convolution(width=width,
                        input_shape=(img_height, img_width),
                        N=N,
@@ -116,3 +179,119 @@ def test_convolution(width, img_height, img_width, N, n_cores):
     ports = core.get_ports()
     vcd_file = vcd_only_if_env(f'./test_convolution_i{width}_h{img_height}_w{img_width}_N{N}_n{n_cores}.vcd')
     run(core, 'cnn.tests.test_convolution', ports=ports, vcd_file=vcd_file)
+
+
+@pytest.mark.timeout(10)
+@pytest.mark.parametrize("width, img_height, img_width, N, n_cores, exp_w", [
+    (8, 5, 5, 3, 9, 2),
+    (8, 5, 5, 3, 1, 3),
+    (8, 25, 5, 3, 9, 3),
+])
+def test_convolution_log(width, img_height, img_width, N, n_cores, exp_w):
+    os.environ['coco_param_N'] = str(N)
+    os.environ['coco_param_img_height'] = str(img_height)
+    os.environ['coco_param_img_width'] = str(img_width)
+    os.environ['coco_param_n_cores'] = str(int(n_cores))
+    os.environ['coco_param_log_exp_w'] = str(exp_w)
+    os.environ.pop('coco_param_kernel', None)
+    os.environ.pop('coco_param_fused', None)
+    core = Convolution(width=width,
+                       input_shape=(img_height, img_width),
+                       N=N,
+                       n_cores=n_cores,
+                       log_exp_w=exp_w)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_convolution_log_i{width}_h{img_height}_w{img_width}_N{N}_n{n_cores}_e{exp_w}.vcd')
+    run(core, 'cnn.tests.test_convolution', ports=ports, vcd_file=vcd_file)
+
+
+@pytest.mark.timeout(10)
+@pytest.mark.parametrize("width, img_height, img_width, N", [
+    (8, 5, 5, 3),
+    (8, 25, 5, 3),
+    (8, 7, 7, 5),
+])
+def test_convolution_constant(width, img_height, img_width, N):
+    kernel = np.random.randint(-8, 8, (N, N))
+    os.environ['coco_param_N'] = str(N)
+    os.environ['coco_param_img_height'] = str(img_height)
+    os.environ['coco_param_img_width'] = str(img_width)
+    os.environ['coco_param_n_cores'] = str(1)
+    os.environ['coco_param_kernel'] = ','.join([str(x) for x in kernel.flatten()])
+    os.environ.pop('coco_param_fused', None)
+    core = Convolution(width=width,
+                       input_shape=(img_height, img_width),
+                       N=N,
+                       n_cores=1,
+                       kernel=kernel)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_convolution_constant_i{width}_h{img_height}_w{img_width}_N{N}.vcd')
+    run(core, 'cnn.tests.test_convolution', ports=ports, vcd_file=vcd_file)
+
+
+@pytest.mark.timeout(10)
+@pytest.mark.parametrize("bias, bias_shift, relu_leak, multiplier, shift, zero_point, width_act", [
+    (100, 2, 0, 77, 10, 0, 8),
+    (-5, 0, None, None, 0, 0, None),
+    (None, 0, 3, None, 0, 0, None),
+    (None, 0, None, 3, 2, -3, 6),
+    (-300, 0, 16, 100, 9, 0, 8),
+])
+def test_convolution_fused(bias, bias_shift, relu_leak, multiplier, shift, zero_point, width_act):
+    width, img_height, img_width, N = 8, 7, 6, 3
+    kernel = np.random.randint(-128, 128, (N, N))
+    core = Convolution(width=width,
+                       input_shape=(img_height, img_width),
+                       N=N,
+                       n_cores=1,
+                       kernel=kernel,
+                       bias=bias,
+                       bias_shift=bias_shift,
+                       relu_leak=relu_leak,
+                       multiplier=multiplier,
+                       shift=shift,
+                       zero_point=zero_point,
+                       width_act=width_act)
+    fused = [core.acc_w, bias, bias_shift, relu_leak, multiplier, shift, zero_point, width_act]
+    os.environ['coco_param_N'] = str(N)
+    os.environ['coco_param_img_height'] = str(img_height)
+    os.environ['coco_param_img_width'] = str(img_width)
+    os.environ['coco_param_n_cores'] = str(1)
+    os.environ['coco_param_kernel'] = ','.join([str(x) for x in kernel.flatten()])
+    os.environ['coco_param_fused'] = ','.join([str(x) for x in fused])
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_convolution_fused_b{bias}_l{relu_leak}_m{multiplier}.vcd')
+    run(core, 'cnn.tests.test_convolution', ports=ports, vcd_file=vcd_file)
+
+
+@pytest.mark.timeout(10)
+@pytest.mark.parametrize("n_cores, bias, bias_shift, relu_leak, multiplier, shift, zero_point, width_act", [
+    (9, 100, 2, 0, 77, 10, 0, 8),
+    (9, -300, 0, 16, 100, 9, 0, 8),
+    (1, -5, 0, None, None, 0, 0, None),
+    (3, None, 0, 3, 3, 2, -3, 6),
+])
+def test_convolution_fused_farm(n_cores, bias, bias_shift, relu_leak, multiplier, shift, zero_point, width_act):
+    width, img_height, img_width, N = 8, 5, 5, 3
+    core = Convolution(width=width,
+                       input_shape=(img_height, img_width),
+                       N=N,
+                       n_cores=n_cores,
+                       bias=bias,
+                       bias_shift=bias_shift,
+                       relu_leak=relu_leak,
+                       multiplier=multiplier,
+                       shift=shift,
+                       zero_point=zero_point,
+                       width_act=width_act)
+    fused = [core.acc_w, bias, bias_shift, relu_leak, multiplier, shift, zero_point, width_act]
+    os.environ['coco_param_N'] = str(N)
+    os.environ['coco_param_img_height'] = str(img_height)
+    os.environ['coco_param_img_width'] = str(img_width)
+    os.environ['coco_param_n_cores'] = str(n_cores)
+    os.environ['coco_param_fused'] = ','.join([str(x) for x in fused])
+    os.environ.pop('coco_param_kernel', None)
+    os.environ.pop('coco_param_log_exp_w', None)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_convolution_fused_farm_n{n_cores}_b{bias}_l{relu_leak}_m{multiplier}.vcd')
+    run(core, 'cnn.tests.test_convolution', ports=ports, vcd_file=vcd_file)
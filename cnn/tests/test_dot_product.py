@@ -2,6 +2,7 @@ from nmigen_cocotb import run
 from cnn.dot_product import DotProduct
 from cnn.tests.utils import vcd_only_if_env, incremental_matrix
 from cnn.tests.interfaces import SignedMatrixStreamDriver as MatrixDriver
+from cnn.tests.interfaces import MatrixStreamDriver as UnsignedMatrixDriver
 from cnn.tests.interfaces import SignedStreamDriver as Driver
 import pytest
 import random
@@ -34,23 +35,25 @@ def check_monitors_data(input_a, input_b, output):
         assert o == expected_o, f'{o} == {expected_o}'
 
 @cocotb.coroutine
-def check_data(dut, shape, burps_in, burps_out, dummy=0):
+def check_data(dut, shape, burps_in, burps_out, signed_data=True, signed_coeff=True, dummy=0):
 
     test_size = 20
     yield init_test(dut)
 
-    m_axis_a = MatrixDriver(dut, name='input_a_', clock=dut.clk, shape=shape)
-    m_axis_b = MatrixDriver(dut, name='input_b_', clock=dut.clk, shape=shape)
+    driver_a = MatrixDriver if signed_data else UnsignedMatrixDriver
+    driver_b = MatrixDriver if signed_coeff else UnsignedMatrixDriver
+    m_axis_a = driver_a(dut, name='input_a_', clock=dut.clk, shape=shape)
+    m_axis_b = driver_b(dut, name='input_b_', clock=dut.clk, shape=shape)
     s_axis = Driver(dut, name='output_', clock=dut.clk)
     m_axis_a.init_master()
     m_axis_b.init_master()
     s_axis.init_slave()
     yield RisingEdge(dut.clk)
 
-    width_i = m_axis_a.width
+    width_b = m_axis_b.width
     
     wr_a = [m_axis_a._get_random_data() for _ in range(test_size)]
-    wr_b = incremental_matrix(shape, test_size, 2**width_i - 1)
+    wr_b = incremental_matrix(shape, test_size, 2**width_b - 1)
 
     cocotb.fork(m_axis_a.monitor())
     cocotb.fork(m_axis_b.monitor())
@@ -73,6 +76,8 @@ try:
     string_to_tuple = lambda string: tuple([int(i) for i in string.replace('(', '').replace(')', '').split(',')])
     running_cocotb = True
     shape = string_to_tuple(os.environ['coco_param_shape'])
+    signed_data = bool(int(os.environ.get('coco_param_signed_data', '1')))
+    signed_coeff = bool(int(os.environ.get('coco_param_signed_coeff', '1')))
 except KeyError as e:
     running_cocotb = False
 
@@ -82,15 +87,27 @@ if running_cocotb:
     tf_test_data.add_option('shape', [shape])
     tf_test_data.add_option('burps_in', [False, True])
     tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('signed_data', [signed_data])
+    tf_test_data.add_option('signed_coeff', [signed_coeff])
     tf_test_data.add_option('dummy', [0] * 5) # repeat 5 times
     tf_test_data.generate_tests()
 
-@pytest.mark.parametrize("width_i, shape", [(8, (4,2))])
-def test_dot_product(width_i, shape):
+@pytest.mark.parametrize("width_i, shape, width_coeff, signed_data, signed_coeff", [
+    (8, (4,2), 8, True, True),
+    (8, (3,3), 4, True, True),
+    (8, (3,3), 2, False, True),
+    (8, (3,3), 4, False, False),
+])
+def test_dot_product(width_i, shape, width_coeff, signed_data, signed_coeff):
     os.environ['coco_param_shape'] = str(shape)
+    os.environ['coco_param_signed_data'] = str(int(signed_data))
+    os.environ['coco_param_signed_coeff'] = str(int(signed_coeff))
     core = DotProduct(width_i=width_i,
-                      shape=shape)
+                      shape=shape,
+                      width_coeff=width_coeff,
+                      signed_data=signed_data,
+                      signed_coeff=signed_coeff)
     ports = core.get_ports()
     printable_shape = '_'.join([str(i) for i in shape])
-    vcd_file = vcd_only_if_env(f'./test_dot_product_i{width_i}_shape{printable_shape}.vcd')
+    vcd_file = vcd_only_if_env(f'./test_dot_product_i{width_i}_c{width_coeff}_shape{printable_shape}_s{int(signed_data)}{int(signed_coeff)}.vcd')
     run(core, 'cnn.tests.test_dot_product', ports=ports, vcd_file=vcd_file)
@@ -0,0 +1,79 @@
+from nmigen_cocotb import run
+from cnn.stream_utils import Downsizer
+from cnn.tests.interfaces import StreamDriver, MatrixStreamDriver
+from cnn.tests.utils import vcd_only_if_env
+import pytest
+import os
+import random
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+
+    m_axis = MatrixStreamDriver(dut, name='input_', clock=dut.clk, shape=(n_lanes,))
+    s_axis = StreamDriver(dut, name='output_', clock=dut.clk)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    for i in range(3):
+        # zero padded words, as the Upsizer output
+        data = [random.getrandbits(m_axis.width) for _ in range(length)]
+        padded = data + [0] * (-length % n_lanes)
+        wr_data = [padded[j:j+n_lanes] for j in range(0, len(padded), n_lanes)]
+        cocotb.fork(m_axis.send(wr_data, burps=burps_in))
+        rd_data = yield s_axis.recv(burps=burps_out)
+
+        expected = data if trim else padded
+        assert rd_data == expected, f'\n{rd_data}\n!=\n{expected}'
+
+
+try:
+    running_cocotb = True
+    n_lanes = int(os.environ['coco_param_n_lanes'], 10)
+    length = int(os.environ['coco_param_length'], 10)
+    trim = int(os.environ['coco_param_trim'], 10)
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.generate_tests()
+
+
+@pytest.mark.parametrize("width, n_lanes, length, trim", [
+    (8, 1, 10, 0),
+    (8, 4, 16, 0),
+    (8, 4, 10, 0),
+    (8, 4, 10, 1),
+    (16, 3, 7, 1),
+])
+def test_downsizer(width, n_lanes, length, trim):
+    os.environ['coco_param_n_lanes'] = f'{n_lanes}'
+    os.environ['coco_param_length'] = f'{length}'
+    os.environ['coco_param_trim'] = f'{trim}'
+    core = Downsizer(width=width, n_lanes=n_lanes, length=length if trim else None)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_downsizer_w{width}_n{n_lanes}_l{length}_t{trim}.vcd')
+    run(core, 'cnn.tests.test_downsizer', ports=ports, vcd_file=vcd_file)
@@ -0,0 +1,113 @@
+from nmigen_cocotb import run
+from cnn.dot_product import DualDotProduct
+from cnn.tests.utils import vcd_only_if_env, incremental_matrix
+from cnn.tests.interfaces import SignedMatrixStreamDriver as MatrixDriver
+from cnn.tests.interfaces import MatrixStreamDriver as UnsignedMatrixDriver
+import pytest
+import random
+import numpy as np
+import os
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+CLK_PERIOD_BASE = 100
+random.seed()
+
+
+@cocotb.coroutine
+def init_test(dut):
+    dut.rst <= 1
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+def check_monitors_data(input_a, input_b, input_c, output):
+    for a, b, c, o in zip(input_a, input_b, input_c, output):
+        expected_o = [sum(np.multiply(a, b)), sum(np.multiply(a, c))]
+        assert o == expected_o, f'{o} == {expected_o}'
+
+@cocotb.coroutine
+def check_data(dut, shape, burps_in, burps_out, signed_data=True, signed_coeff=True, dummy=0):
+
+    test_size = 20
+    yield init_test(dut)
+
+    driver_a = MatrixDriver if signed_data else UnsignedMatrixDriver
+    driver_b = MatrixDriver if signed_coeff else UnsignedMatrixDriver
+    m_axis_a = driver_a(dut, name='input_a_', clock=dut.clk, shape=shape)
+    m_axis_b = driver_b(dut, name='input_b_', clock=dut.clk, shape=shape)
+    m_axis_c = driver_b(dut, name='input_c_', clock=dut.clk, shape=shape)
+    s_axis = MatrixDriver(dut, name='output_', clock=dut.clk, shape=(2,))
+    m_axis_a.init_master()
+    m_axis_b.init_master()
+    m_axis_c.init_master()
+    s_axis.init_slave()
+    yield RisingEdge(dut.clk)
+
+    width_b = m_axis_b.width
+
+    wr_a = [m_axis_a._get_random_data() for _ in range(test_size)]
+    wr_b = incremental_matrix(shape, test_size, 2**width_b - 1)
+    wr_c = [m_axis_c._get_random_data() for _ in range(test_size)]
+
+    cocotb.fork(m_axis_a.monitor())
+    cocotb.fork(m_axis_b.monitor())
+    cocotb.fork(m_axis_c.monitor())
+    cocotb.fork(s_axis.monitor())
+
+    cocotb.fork(m_axis_a.send(wr_a, burps_in))
+    cocotb.fork(m_axis_b.send(wr_b, burps=False)) # Dummy interface!
+    cocotb.fork(m_axis_c.send(wr_c, burps=False)) # Dummy interface!
+
+    yield s_axis.recv(test_size, burps_out)
+
+    assert len(s_axis.buffer) == test_size, f'{len(s_axis.buffer)} == {test_size}'
+
+    check_monitors_data(m_axis_a.buffer, m_axis_b.buffer, m_axis_c.buffer, s_axis.buffer)
+
+
+try:
+    string_to_tuple = lambda string: tuple([int(i) for i in string.replace('(', '').replace(')', '').split(',')])
+    running_cocotb = True
+    shape = string_to_tuple(os.environ['coco_param_shape'])
+    signed_data = bool(int(os.environ.get('coco_param_signed_data', '1')))
+    signed_coeff = bool(int(os.environ.get('coco_param_signed_coeff', '1')))
+except KeyError as e:
+    running_cocotb = False
+
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('shape', [shape])
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('signed_data', [signed_data])
+    tf_test_data.add_option('signed_coeff', [signed_coeff])
+    tf_test_data.add_option('dummy', [0] * 5) # repeat 5 times
+    tf_test_data.generate_tests()
+
+@pytest.mark.parametrize("width_i, shape, width_coeff, signed_data, signed_coeff", [
+    (8, (4,2), 8, True, True),
+    (8, (3,3), 4, True, True),
+    (8, (3,3), 2, False, True),
+])
+def test_dual_dot_product(width_i, shape, width_coeff, signed_data, signed_coeff):
+    os.environ['coco_param_shape'] = str(shape)
+    os.environ['coco_param_signed_data'] = str(int(signed_data))
+    os.environ['coco_param_signed_coeff'] = str(int(signed_coeff))
+    core = DualDotProduct(width_i=width_i,
+                          shape=shape,
+                          width_coeff=width_coeff,
+                          signed_data=signed_data,
+                          signed_coeff=signed_coeff)
+    ports = core.get_ports()
+    printable_shape = '_'.join([str(i) for i in shape])
+    vcd_file = vcd_only_if_env(f'./test_dual_dot_product_i{width_i}_c{width_coeff}_shape{printable_shape}_s{int(signed_data)}{int(signed_coeff)}.vcd')
+    run(core, 'cnn.tests.test_dual_dot_product', ports=ports, vcd_file=vcd_file)
@@ -0,0 +1,110 @@
+from nmigen_cocotb import run
+from cnn.mac import DualMAC
+from cnn.tests.utils import vcd_only_if_env
+import pytest
+import random
+import os
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+    from .interfaces import *
+except:
+    pass
+
+CLK_PERIOD_BASE = 100
+random.seed()
+
+signed_a = bool(int(os.environ.get('coco_param_signed_a', '1')))
+signed_b = bool(int(os.environ.get('coco_param_signed_b', '1')))
+
+def read_input(signal, is_signed):
+    return signal.value.signed_integer if is_signed else signal.value.integer
+
+@cocotb.coroutine
+def input_monitor(dut, buff_in):
+    while True:
+        yield RisingEdge(dut.clk)
+        if dut.clken.value.integer:
+            buff_in.append((read_input(dut.input_a, signed_a),
+                            read_input(dut.input_b_0, signed_b),
+                            read_input(dut.input_b_1, signed_b)))
+
+@cocotb.coroutine
+def output_monitor(dut, buff_out):
+    while True:
+        yield RisingEdge(dut.clk)
+        if dut.valid_o.value.integer:
+            buff_out.append((dut.output_0.value.signed_integer,
+                             dut.output_1.value.signed_integer))
+
+def check_output(buff_in, buff_out):
+    last_0, last_1 = 0, 0
+    for (a, b0, b1), (o0, o1) in zip(buff_in, buff_out):
+        assert o0 == last_0 + a * b0, f'{o0} == {last_0} + {a} * {b0}'
+        assert o1 == last_1 + a * b1, f'{o1} == {last_1} + {a} * {b1}'
+        last_0 += a * b0
+        last_1 += a * b1
+
+
+@cocotb.coroutine
+def init_test(dut):
+    dut.input_a <= 0
+    dut.input_b_0 <= 0
+    dut.input_b_1 <= 0
+    dut.clr <= 0
+    dut.clken <= 0
+    dut.rst <= 1
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+
+@cocotb.coroutine
+def check_data(dut):
+
+    width_a = len(dut.input_a)
+    width_b = len(dut.input_b_0)
+
+    yield init_test(dut)
+
+    buff_in = []
+    buff_out = []
+    cocotb.fork(input_monitor(dut, buff_in))
+    cocotb.fork(output_monitor(dut, buff_out))
+
+    dut.clken <= 1
+    for  _ in range(100):
+        dut.input_a <= random.getrandbits(width_a)
+        dut.input_b_0 <= random.getrandbits(width_b)
+        dut.input_b_1 <= random.getrandbits(width_b)
+        yield RisingEdge(dut.clk)
+
+    yield RisingEdge(dut.clk)
+
+    check_output(buff_in, buff_out)
+
+
+tf_test_data = TF(check_data)
+tf_test_data.generate_tests()
+
+@pytest.mark.parametrize("input_w, output_w, input_b_w, signed_a, signed_b", [
+    (8, 24, 8, True, True),
+    (8, 24, 4, True, True),
+    (8, 24, 8, False, True),
+    (8, 24, 8, False, False),
+])
+def test_dual_mac(input_w, output_w, input_b_w, signed_a, signed_b):
+    os.environ['coco_param_signed_a'] = str(int(signed_a))
+    os.environ['coco_param_signed_b'] = str(int(signed_b))
+    core = DualMAC(input_w=input_w,
+                   output_w=output_w,
+                   input_b_w=input_b_w,
+                   signed_a=signed_a,
+                   signed_b=signed_b)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_dual_mac_i{input_w}_o{output_w}_b{input_b_w}_s{int(signed_a)}{int(signed_b)}.vcd')
+    run(core, 'cnn.tests.test_dual_mac', ports=ports, vcd_file=vcd_file)
@@ -0,0 +1,203 @@
+from nmigen_cocotb import run
+from nmigen import *
+from cnn.elementwise import ElementwiseAdd, skip_fifo_depth
+from cnn.requantize import Requantizer, requantize
+from cnn.stream_utils import Broadcast
+from cnn.interfaces import DataStream
+from cnn.tests.interfaces import SignedStreamDriver as Driver
+from cnn.tests.utils import vcd_only_if_env
+import pytest
+import os
+import random
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+
+def saturate(value, width):
+    return min(max(value, -2**(width-1)), 2**(width-1)-1)
+
+
+def connect(sink, source):
+    return [sink.valid.eq(source.valid),
+            sink.last.eq(source.last),
+            sink.dataport.eq(source.dataport),
+            source.ready.eq(sink.ready),
+           ]
+
+
+class Residual(Elaboratable):
+    """ output = input + requantize(input), with the input broadcast
+    to the main path (Requantizer) and to the skip path, buffered in
+    a FIFO sized by skip_fifo_depth().
+    """
+
+    def __init__(self, width, multiplier, shift):
+        self.broadcast = Broadcast(DataStream(width, direction='sink'), n_outputs=2)
+        self.main = Requantizer(width_i=width, width_o=width, multiplier=multiplier, shift=shift)
+        self.add = ElementwiseAdd(width_a=width, skip_depth=skip_fifo_depth(self.main))
+        self.input = DataStream(width, direction='sink', name='input')
+        self.output = DataStream(width, direction='source', name='output')
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        comb = m.d.comb
+
+        m.submodules.broadcast = broadcast = self.broadcast
+        m.submodules.main = main = self.main
+        m.submodules.add = add = self.add
+
+        comb += connect(broadcast.input, self.input)
+        comb += connect(main.input, broadcast.outputs[0])
+        comb += connect(add.input_a, main.output)
+        comb += connect(add.input_b, broadcast.outputs[1])
+        comb += connect(self.output, add.output)
+
+        return m
+
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+
+@cocotb.coroutine
+def check_data(dut, burps_a=False, burps_b=False, burps_out=False, dummy=0):
+
+    m_axis_a = Driver(dut, name='input_a_', clock=dut.clk)
+    m_axis_b = Driver(dut, name='input_b_', clock=dut.clk)
+    s_axis = Driver(dut, name='output_', clock=dut.clk)
+    width_o = len(dut.output__data)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis_a.init_master()
+    m_axis_b.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    for i in range(3):
+        test_size = 50
+        wr_a = [m_axis_a._get_random_data() for _ in range(test_size)]
+        wr_b = [m_axis_b._get_random_data() for _ in range(test_size)]
+        cocotb.fork(m_axis_a.send(wr_a, burps=burps_a))
+        cocotb.fork(m_axis_b.send(wr_b, burps=burps_b))
+        rd_data = yield s_axis.recv(burps=burps_out)
+
+        expected = [saturate(a + b, width_o) for a, b in zip(wr_a, wr_b)]
+        assert rd_data == expected, f'\n{rd_data}\n!=\n{expected}'
+
+
+@cocotb.coroutine
+def count_stalls(dut, stalls):
+    while True:
+        yield RisingEdge(dut.clk)
+        if dut.input__valid.value.integer == 1 and dut.input__ready.value.integer == 0:
+            stalls.append(1)
+
+
+@cocotb.coroutine
+def check_residual(dut, burps_in=False, burps_out=False, dummy=0):
+
+    m_axis = Driver(dut, name='input_', clock=dut.clk)
+    s_axis = Driver(dut, name='output_', clock=dut.clk)
+    width = len(dut.output__data)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    for i in range(3):
+        test_size = 60
+        wr_data = [m_axis._get_random_data() for _ in range(test_size)]
+        stalls = []
+        monitor = cocotb.fork(count_stalls(dut, stalls))
+        cocotb.fork(m_axis.send(wr_data, burps=burps_in))
+        rd_data = yield s_axis.recv(burps=burps_out)
+        monitor.kill()
+
+        expected = [saturate(x + requantize(x, multiplier, shift, width), width) for x in wr_data]
+        assert rd_data == expected, f'\n{rd_data}\n!=\n{expected}'
+        if not burps_out:
+            # the skip FIFO holds the samples in flight in the main path
+            assert len(stalls) == 0, f'input stalled {len(stalls)} cycles'
+
+
+try:
+    running_cocotb = True
+    testbench = os.environ['coco_param_elementwise_add']
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb and testbench == 'add':
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_a', [False, True])
+    tf_test_data.add_option('burps_b', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.generate_tests()
+
+if running_cocotb and testbench == 'residual':
+    multiplier = int(os.environ['coco_param_multiplier'], 10)
+    shift = int(os.environ['coco_param_shift'], 10)
+    tf_test_residual = TF(check_residual)
+    tf_test_residual.add_option('burps_in', [False, True])
+    tf_test_residual.add_option('burps_out', [False, True])
+    tf_test_residual.generate_tests()
+
+
+@pytest.mark.parametrize("width_a, width_b, width_o, skip_depth", [
+    (8, 8, 8, 0),
+    (16, 8, 10, 0),
+    (8, 8, 8, 3),
+    (8, 8, 8, 4),
+    (12, 12, 8, 16),
+])
+def test_elementwise_add(width_a, width_b, width_o, skip_depth):
+    os.environ['coco_param_elementwise_add'] = 'add'
+    core = ElementwiseAdd(width_a=width_a,
+                          width_b=width_b,
+                          width_o=width_o,
+                          skip_depth=skip_depth)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_elementwise_add_a{width_a}_b{width_b}_o{width_o}_d{skip_depth}.vcd')
+    run(core, 'cnn.tests.test_elementwise_add', ports=ports, vcd_file=vcd_file)
+
+
+@pytest.mark.parametrize("width, multiplier, shift", [
+    (8, 3, 2),
+    (12, 1, 0),
+])
+def test_residual(width, multiplier, shift):
+    os.environ['coco_param_elementwise_add'] = 'residual'
+    os.environ['coco_param_multiplier'] = f'{multiplier}'
+    os.environ['coco_param_shift'] = f'{shift}'
+    core = Residual(width=width, multiplier=multiplier, shift=shift)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_residual_w{width}_m{multiplier}_s{shift}.vcd')
+    run(core, 'cnn.tests.test_elementwise_add', ports=ports, vcd_file=vcd_file)
+
+
+def test_skip_fifo_depth():
+    requantizer = Requantizer(width_i=16, width_o=8, multiplier=1, shift=0)
+    assert skip_fifo_depth(requantizer) == requantizer.latency + 2
+    assert skip_fifo_depth(requantizer, 10, margin=0) == requantizer.latency + 10
+    # shorter FIFOs don't run at full rate
+    assert skip_fifo_depth(1, margin=0) == 3
+    for skip_depth in [1, 2]:
+        with pytest.raises(AssertionError):
+            ElementwiseAdd(width_a=8, skip_depth=skip_depth)
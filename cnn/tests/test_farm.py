@@ -21,6 +21,8 @@ try:
     string_to_tuple = lambda string: tuple([int(i) for i in string.replace('(', '').replace(')', '').split(',')])
     running_cocotb = True
     shape = string_to_tuple(os.environ['coco_param_shape'])
+    signed_data = bool(int(os.environ.get('coco_param_signed_data', '1')))
+    signed_coeff = bool(int(os.environ.get('coco_param_signed_coeff', '1')))
 except KeyError as e:
     running_cocotb = False
 
@@ -31,17 +33,28 @@ if running_cocotb:
     tf_test_data.add_option('shape', [shape])
     tf_test_data.add_option('burps_in', [False, True])
     tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('signed_data', [signed_data])
+    tf_test_data.add_option('signed_coeff', [signed_coeff])
     tf_test_data.add_option('dummy', [0] * 5) # repeat 5 times
     tf_test_data.generate_tests()
 
 
-@pytest.mark.parametrize("width, shape, n_cores", [(8, (4,2), 3)])
-def test_farm(width, shape, n_cores):
+@pytest.mark.parametrize("width, shape, n_cores, width_coeff, signed_data, signed_coeff", [
+    (8, (4,2), 3, 8, True, True),
+    (8, (3,3), 3, 4, True, True),
+    (8, (3,3), 3, 2, False, True),
+])
+def test_farm(width, shape, n_cores, width_coeff, signed_data, signed_coeff):
     os.environ['coco_param_shape'] = str(shape)
+    os.environ['coco_param_signed_data'] = str(int(signed_data))
+    os.environ['coco_param_signed_coeff'] = str(int(signed_coeff))
     core = Farm(width=width,
                 shape=shape,
-                n_cores=n_cores)
+                n_cores=n_cores,
+                width_coeff=width_coeff,
+                signed_data=signed_data,
+                signed_coeff=signed_coeff)
     ports = core.get_ports()
     printable_shape = '_'.join([str(i) for i in shape])
-    vcd_file = vcd_only_if_env(f'./test_farm_i{width}_shape{printable_shape}.vcd')
+    vcd_file = vcd_only_if_env(f'./test_farm_i{width}_c{width_coeff}_shape{printable_shape}_s{int(signed_data)}{int(signed_coeff)}.vcd')
     run(core, 'cnn.tests.test_farm', ports=ports, vcd_file=vcd_file)
@@ -0,0 +1,125 @@
+from nmigen_cocotb import run
+from cnn.dot_product import DotProduct
+from cnn.log_quant import log_quantize, log_decode, log_dot, log_code_width
+from cnn.tests.utils import vcd_only_if_env
+from cnn.tests.interfaces import SignedMatrixStreamDriver as MatrixDriver
+from cnn.tests.interfaces import MatrixStreamDriver as UnsignedMatrixDriver
+from cnn.tests.interfaces import SignedStreamDriver as Driver
+import pytest
+import random
+import numpy as np
+import os
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+CLK_PERIOD_BASE = 100
+random.seed()
+
+
+@cocotb.coroutine
+def init_test(dut):
+    dut.rst <= 1
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+def check_monitors_data(input_a, input_b, output, exp_w):
+    for a, b, o in zip(input_a, input_b, output):
+        expected_o = log_dot(np.array(a).flatten(), np.array(b).flatten(), exp_w)
+        assert o == expected_o, f'{o} == {expected_o}'
+
+@cocotb.coroutine
+def check_data(dut, shape, exp_w, burps_in, burps_out, signed_data=True, dummy=0):
+
+    test_size = 20
+    yield init_test(dut)
+
+    driver_a = MatrixDriver if signed_data else UnsignedMatrixDriver
+    m_axis_a = driver_a(dut, name='input_a_', clock=dut.clk, shape=shape)
+    m_axis_b = UnsignedMatrixDriver(dut, name='input_b_', clock=dut.clk, shape=shape)
+    s_axis = Driver(dut, name='output_', clock=dut.clk)
+    m_axis_a.init_master()
+    m_axis_b.init_master()
+    s_axis.init_slave()
+    yield RisingEdge(dut.clk)
+
+    # every code is a valid weight, so random codes can be used
+    wr_a = [m_axis_a._get_random_data() for _ in range(test_size)]
+    wr_b = [m_axis_b._get_random_data() for _ in range(test_size)]
+
+    cocotb.fork(m_axis_a.monitor())
+    cocotb.fork(m_axis_b.monitor())
+    cocotb.fork(s_axis.monitor())
+
+    cocotb.fork(m_axis_a.send(wr_a, burps_in))
+    cocotb.fork(m_axis_b.send(wr_b, burps=False)) # Dummy interface!
+
+    yield s_axis.recv(test_size, burps_out)
+
+    assert len(m_axis_a.buffer) == test_size, f'{len(m_axis_a.buffer)} == {test_size}'
+    assert len(m_axis_b.buffer) == test_size, f'{len(m_axis_b.buffer)} == {test_size}'
+    assert len(s_axis.buffer) == test_size, f'{len(s_axis.buffer)} == {test_size}'
+
+    check_monitors_data(m_axis_a.buffer, m_axis_b.buffer, s_axis.buffer, exp_w)
+
+
+try:
+    string_to_tuple = lambda string: tuple([int(i) for i in string.replace('(', '').replace(')', '').split(',')])
+    running_cocotb = True
+    shape = string_to_tuple(os.environ['coco_param_shape'])
+    exp_w = int(os.environ['coco_param_exp_w'])
+    signed_data = bool(int(os.environ.get('coco_param_signed_data', '1')))
+except KeyError as e:
+    running_cocotb = False
+
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('shape', [shape])
+    tf_test_data.add_option('exp_w', [exp_w])
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('signed_data', [signed_data])
+    tf_test_data.add_option('dummy', [0] * 5) # repeat 5 times
+    tf_test_data.generate_tests()
+
+
+@pytest.mark.parametrize("exp_w", [2, 3])
+def test_log_quantize(exp_w):
+    weights = np.random.uniform(-2**(2**exp_w), 2**(2**exp_w), 100)
+    codes = log_quantize(weights, exp_w)
+    assert np.all(codes < 2**log_code_width(exp_w))
+    values = log_decode(codes, exp_w)
+    for w, v in zip(weights, values):
+        if abs(w) < 2**-0.5:
+            assert v == 0, f'{v} == 0'
+        else:
+            assert np.sign(v) == np.sign(w), f'{v}, {w}'
+            # nearest power of two in the log domain (or saturated)
+            expected = min(max(0, int(np.round(np.log2(abs(w))))), 2**exp_w - 1)
+            assert abs(v) == 2**expected, f'{abs(v)} == {2**expected}'
+
+@pytest.mark.parametrize("width_i, shape, exp_w, signed_data", [
+    (8, (4,2), 2, True),
+    (8, (3,3), 3, True),
+    (8, (3,3), 3, False),
+])
+def test_log_dot_product(width_i, shape, exp_w, signed_data):
+    os.environ['coco_param_shape'] = str(shape)
+    os.environ['coco_param_exp_w'] = str(exp_w)
+    os.environ['coco_param_signed_data'] = str(int(signed_data))
+    core = DotProduct(width_i=width_i,
+                      shape=shape,
+                      signed_data=signed_data,
+                      log_exp_w=exp_w)
+    ports = core.get_ports()
+    printable_shape = '_'.join([str(i) for i in shape])
+    vcd_file = vcd_only_if_env(f'./test_log_dot_product_i{width_i}_e{exp_w}_shape{printable_shape}_s{int(signed_data)}.vcd')
+    run(core, 'cnn.tests.test_log_quant', ports=ports, vcd_file=vcd_file)
@@ -5,6 +5,7 @@ import pytest
 import random
 from math import ceil
 import numpy as np
+import os
 
 try:
     import cocotb
@@ -18,13 +19,19 @@ except:
 CLK_PERIOD_BASE = 100
 random.seed()
 
+signed_a = bool(int(os.environ.get('coco_param_signed_a', '1')))
+signed_b = bool(int(os.environ.get('coco_param_signed_b', '1')))
+
+def read_input(signal, is_signed):
+    return signal.value.signed_integer if is_signed else signal.value.integer
+
 @cocotb.coroutine
 def input_monitor(dut, buff_in):
     while True:
         yield RisingEdge(dut.clk)
         if dut.clken.value.integer:
-            buff_in.append((dut.input_a.value.signed_integer,
-                            dut.input_b.value.signed_integer))
+            buff_in.append((read_input(dut.input_a, signed_a),
+                            read_input(dut.input_b, signed_b)))
 
 @cocotb.coroutine
 def output_monitor(dut, buff_out):
@@ -56,7 +63,8 @@ def init_test(dut):
 @cocotb.coroutine
 def check_data(dut):
 
-    width_in = len(dut.input_a)
+    width_a = len(dut.input_a)
+    width_b = len(dut.input_b)
     width_out = len(dut.output)
 
     yield init_test(dut)
@@ -68,8 +76,8 @@ def check_data(dut):
     
     dut.clken <= 1
     for  _ in range(100):
-        dut.input_a <= random.getrandbits(width_in)
-        dut.input_b <= random.getrandbits(width_in)
+        dut.input_a <= random.getrandbits(width_a)
+        dut.input_b <= random.getrandbits(width_b)
         yield RisingEdge(dut.clk)
 
     yield RisingEdge(dut.clk)
@@ -80,10 +88,20 @@ def check_data(dut):
 tf_test_data = TF(check_data)
 tf_test_data.generate_tests()
 
-@pytest.mark.parametrize("input_w, output_w", [(8, 24),])
-def test_mac(input_w, output_w):
+@pytest.mark.parametrize("input_w, output_w, input_b_w, signed_a, signed_b", [
+    (8, 24, 8, True, True),
+    (8, 24, 4, True, True),
+    (8, 24, 2, False, True),
+    (8, 24, 4, False, False),
+])
+def test_mac(input_w, output_w, input_b_w, signed_a, signed_b):
+    os.environ['coco_param_signed_a'] = str(int(signed_a))
+    os.environ['coco_param_signed_b'] = str(int(signed_b))
     core = MAC(input_w=input_w,
-               output_w=output_w)
+               output_w=output_w,
+               input_b_w=input_b_w,
+               signed_a=signed_a,
+               signed_b=signed_b)
     ports = core.get_ports()
-    vcd_file = vcd_only_if_env(f'./test_mac_i{input_w}_o{output_w}.vcd')
+    vcd_file = vcd_only_if_env(f'./test_mac_i{input_w}_o{output_w}_b{input_b_w}_s{int(signed_a)}{int(signed_b)}.vcd')
     run(core, 'cnn.tests.test_mac', ports=ports, vcd_file=vcd_file)
\ No newline at end of file
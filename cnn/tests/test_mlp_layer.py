@@ -0,0 +1,124 @@
+from nmigen_cocotb import run
+from cnn.mlp_layer import MLPLayer
+from cnn.tests.utils import vcd_only_if_env
+from cnn.tests.interfaces import SignedStreamDriver
+
+import os
+import pytest
+import random
+import numpy as np
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+CLK_PERIOD_BASE = 100
+random.seed()
+
+def get_rom(width, depth, seed=None):
+    random.seed(seed)
+    _min, _max = -2**(width-1), +2**(width-1)-1
+    rom = [random.randint(_min, _max) for _ in range(depth)]
+    return rom
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+def check_output(buff_in, coeff, bias, buff_out, shift=0, bias_shift=0):
+    n_neurons = len(bias)
+    assert len(buff_out) == n_neurons, (
+        f'{len(buff_out)} != {n_neurons}')
+    for i in range(n_neurons):
+        co = coeff[i*n_inputs:(i+1)*n_inputs]
+        acc = sum([a * b for a, b in zip(buff_in, co)])
+        acc += bias[i] << bias_shift
+        assert (acc >> shift) == buff_out[i], f'{acc} != {buff_out[i]}'
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+
+    width_i = len(dut.input__data)
+    width_w = len(dut.node_0.rom.r_data)
+    width_b = len(dut.node_0.bias_rom.r_data)
+    output_w = len(dut.output__data)
+    acc_w = len(dut.node_0.macc.accumulator)
+    shift = acc_w - output_w
+    n_neurons = n_nodes * n_groups
+    rom_init = get_rom(width_w, n_inputs*n_neurons, seed=seed)
+    bias_init = get_rom(width_b, n_neurons, seed=seed+1)
+
+    m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
+    s_axis = SignedStreamDriver(dut, name='output_', clock=dut.clk)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    data_in = [random.getrandbits(width_i) for _ in range(n_inputs)]
+    for i in range(n_groups):
+        cocotb.fork(m_axis.send(data_in, burps_in))
+        rd = yield s_axis.recv(n_nodes, burps_out)
+        s_axis.buffer += rd
+
+    data_in = [x - 2**width_i if x >> (width_i - 1) else x for x in data_in]
+    check_output(buff_in=data_in,
+                 coeff=rom_init,
+                 bias=bias_init,
+                 buff_out=s_axis.buffer,
+                 shift=shift,
+                 bias_shift=shift)
+
+
+try:
+    running_cocotb = True
+    n_inputs = int(os.environ['coco_param_n_inputs'], 10)
+    n_nodes = int(os.environ['coco_param_n_nodes'], 10)
+    n_groups = int(os.environ['coco_param_n_groups'], 10)
+    seed = int(os.environ['coco_param_seed'], 10)
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('dummy', [0] * 5)
+    tf_test_data.generate_tests()
+
+
+@pytest.mark.parametrize("width_i, width_w, n_inputs, n_nodes, n_groups",
+[
+    (8, 8, 8, 1, 2),
+    (8, 8, 8, 4, 1),
+    (8, 8, 8, 4, 3),
+    (8, 8, 3, 4, 2),
+])
+def test_mlp_layer(width_i, width_w, n_inputs, n_nodes, n_groups):
+    seed = random.randint(0, 99999)
+    n_neurons = n_nodes * n_groups
+    os.environ['coco_param_n_inputs'] = str(n_inputs)
+    os.environ['coco_param_n_nodes'] = str(n_nodes)
+    os.environ['coco_param_n_groups'] = str(n_groups)
+    os.environ['coco_param_seed'] = str(seed) # so from cocotb can generate same random data
+    rom_init = get_rom(width_w, n_inputs*n_neurons, seed=seed)
+    bias_init = get_rom(width_i, n_neurons, seed=seed+1)
+    core = MLPLayer(width_i=width_i,
+                    width_w=width_w,
+                    n_inputs=n_inputs,
+                    n_nodes=n_nodes,
+                    rom_init=rom_init,
+                    bias_init=bias_init)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_mlp_layer_d{width_i}_w{width_w}_n{n_inputs}_m{n_nodes}_k{n_groups}.vcd')
+    run(core, 'cnn.tests.test_mlp_layer', ports=ports, vcd_file=vcd_file)
@@ -1,7 +1,8 @@
 from nmigen_cocotb import run
-from cnn.mlp_node import mlpNode
+from cnn.mlp_node import mlpNode, weight_words
+from cnn.tests.memory_model import ExternalMemory
 from cnn.tests.utils import vcd_only_if_env
-from cnn.tests.interfaces import StreamDriver
+from cnn.tests.interfaces import StreamDriver, SignedMatrixStreamDriver
 
 import os
 import pytest
@@ -37,19 +38,20 @@ def reset(dut):
     dut.rst <= 0
     yield RisingEdge(dut.clk)
 
-def check_output(buff_in, coeff, buff_out, shift=0):
+def check_output(buff_in, coeff, bias, buff_out, shift=0, bias_shift=0):
     assert n_neurons == len(buff_in) / n_inputs, (
         f'{n_neurons} != {len(buff_in)} / {n_inputs}')
-    assert len(buff_in) + n_neurons == len(coeff), (
-        f'{len(buff_in)} + {n_neurons} != {len(coeff)}')
+    assert len(buff_in) == len(coeff), (
+        f'{len(buff_in)} != {len(coeff)}')
+    assert len(bias) == n_neurons, (
+        f'{len(bias)} != {n_neurons}')
     assert len(buff_out) == n_neurons, (
         f'{len(buff_out)} != {n_neurons}')
-    n_rom = n_inputs + 1
     for i in range(n_neurons):
         di = buff_in[i*n_inputs:(i+1)*n_inputs]
-        co = coeff[i*n_rom:(i+1)*n_rom]
+        co = coeff[i*n_inputs:(i+1)*n_inputs]
         acc = sum([a * b for a, b in zip(di, co)])
-        acc += co[-1]
+        acc += bias[i] << bias_shift
         assert (acc >> shift) == buff_out[i], f'{acc} != {buff_out[i]}'
 
 
@@ -57,40 +59,117 @@ def check_output(buff_in, coeff, buff_out, shift=0):
 def check_data(dut, burps_in=False, burps_out=False, dummy=0):
 
     width_i = len(dut.input__data)
-    width_w = len(dut.rom.r_data)
+    width_w = int(len(dut.rom.r_data) / n_lanes)
+    width_b = len(dut.bias_rom.r_data)
     output_w = len(dut.output__data)
     acc_w = len(dut.macc.accumulator)
     shift = acc_w - output_w
-    rom_init = get_rom(width_w, (n_inputs+1)*n_neurons, seed=seed)
+    rom_init = get_rom(width_w, n_inputs*n_neurons, seed=seed)
+    bias_init = get_rom(width_b, n_neurons, seed=seed+1)
     
-    test_size = n_inputs
-    m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
+    test_size = int(n_inputs / n_lanes)
+    if n_lanes == 1:
+        m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
+    else:
+        m_axis = SignedMatrixStreamDriver(dut, name='input_', clock=dut.clk, shape=(n_lanes,))
     s_axis = SignedStreamDriver(dut, name='output_', clock=dut.clk)
 
     cocotb.fork(Clock(dut.clk, 10, 'ns').start())
     m_axis.init_master()
     s_axis.init_slave()
+    if burst is not None:
+        memory = ExternalMemory(dut, req_name='mem_req_', resp_name='mem_resp_', clock=dut.clk,
+                                data=weight_words(rom_init, width_w, n_lanes),
+                                burst=burst, latency=latency)
+        memory.init()
     yield reset(dut)
+    if burst is not None:
+        cocotb.fork(memory.run(burps=burps_in))
     
     cocotb.fork(m_axis.monitor())
     cocotb.fork(s_axis.monitor())
 
+    if input_range is None:
+        _min, _max = -2**(width_i-1), 2**(width_i-1)-1
+    else:
+        _min, _max = input_range
+    get_data = lambda: random.randint(_min, _max) % 2**width_i
+
     for i in range(n_neurons):
-        data_in = [random.getrandbits(width_i) for _ in range(test_size)]
+        if n_lanes == 1:
+            data_in = [get_data() for _ in range(test_size)]
+        else:
+            data_in = [[get_data() for _ in range(n_lanes)] for _ in range(test_size)]
         cocotb.fork(m_axis.send(data_in, burps_in))
         yield s_axis.recv(1, burps_out)
-    
+
+    if n_lanes > 1:
+        m_axis.buffer = [x for sample in m_axis.buffer for x in sample]
+
     check_output(buff_in=m_axis.buffer,
-                 coeff=rom_init[:(n_inputs+1)*n_neurons],
+                 coeff=rom_init,
+                 bias=bias_init,
                  buff_out=s_axis.buffer,
-                 shift=shift)
+                 shift=shift,
+                 bias_shift=shift)
+
+
+@cocotb.coroutine
+def check_throughput(dut, dummy=0):
+
+    width_i = len(dut.input__data)
+    width_w = int(len(dut.rom.r_data) / n_lanes)
+    rom_init = get_rom(width_w, n_inputs*n_neurons, seed=seed)
+    memory = ExternalMemory(dut, req_name='mem_req_', resp_name='mem_resp_', clock=dut.clk,
+                            data=weight_words(rom_init, width_w, n_lanes),
+                            burst=burst, latency=latency)
+
+    test_size = int(n_inputs / n_lanes) * n_neurons * 3
+    if n_lanes == 1:
+        m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
+        data_in = [random.getrandbits(width_i) for _ in range(test_size)]
+    else:
+        m_axis = SignedMatrixStreamDriver(dut, name='input_', clock=dut.clk, shape=(n_lanes,))
+        data_in = [[random.getrandbits(width_i) for _ in range(n_lanes)] for _ in range(test_size)]
+    s_axis = SignedStreamDriver(dut, name='output_', clock=dut.clk)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    memory.init()
+    yield reset(dut)
+
+    cocotb.fork(memory.run())
+    cocotb.fork(s_axis.recv(n_neurons * 3))
+    cocotb.fork(m_axis.send(data_in))
+
+    # after the first weights arrive, one sample per clock
+    cycles = 0
+    reads = 0
+    while reads < test_size:
+        yield RisingEdge(dut.clk)
+        if m_axis.accepted():
+            reads += 1
+        if reads:
+            cycles += 1
+
+    assert cycles == test_size, f'{cycles} != {test_size}'
 
 
 try:
     running_cocotb = True
     n_inputs = int(os.environ['coco_param_n_inputs'], 10)
     n_neurons = int(os.environ['coco_param_n_neurons'], 10)
+    n_lanes = int(os.environ['coco_param_n_lanes'], 10)
     seed = int(os.environ['coco_param_seed'], 10)
+    input_range = os.environ.get('coco_param_input_range', None)
+    if input_range is not None:
+        input_range = tuple(int(x) for x in input_range.split(','))
+    burst = os.environ.get('coco_param_burst', None)
+    if burst is not None:
+        burst = int(burst, 10)
+        latency = int(os.environ['coco_param_latency'], 10)
+        full_rate = int(os.environ['coco_param_full_rate'], 10)
 except KeyError as e:
     running_cocotb = False
 
@@ -101,23 +180,108 @@ if running_cocotb:
     tf_test_data.add_option('dummy', [0] * 5)
     tf_test_data.generate_tests()
 
+    if burst is not None and full_rate:
+        tf_throughput = TF(check_throughput)
+        tf_throughput.generate_tests()
+
 
-@pytest.mark.parametrize("width_i, width_w, n_inputs, n_neurons",
+@pytest.mark.parametrize("width_i, width_w, n_inputs, n_neurons, n_lanes",
 [
-    (8, 8, 8, 1),
-    (8, 8, 8, 2),
-    (8, 8, 1000, 2),
+    (8, 8, 8, 1, 1),
+    (8, 8, 8, 2, 1),
+    (8, 8, 1000, 2, 1),
+    (8, 8, 8, 2, 4),
+    (8, 8, 1000, 2, 8),
+])
+def test_mlp_node(width_i, width_w, n_inputs, n_neurons, n_lanes):
+    seed = random.randint(0, 99999)
+    os.environ['coco_param_n_inputs'] = str(n_inputs)
+    os.environ['coco_param_n_neurons'] = str(n_neurons)
+    os.environ['coco_param_n_lanes'] = str(n_lanes)
+    os.environ['coco_param_seed'] = str(seed) # so from cocotb can generate same random data
+    os.environ.pop('coco_param_input_range', None)
+    os.environ.pop('coco_param_burst', None)
+    rom_init = get_rom(width_w, n_inputs*n_neurons, seed=seed)
+    bias_init = get_rom(width_i, n_neurons, seed=seed+1)
+    core = mlpNode(width_i=width_i,
+                   width_w=width_w,
+                   n_inputs=n_inputs,
+                   rom_init=rom_init,
+                   bias_init=bias_init,
+                   n_lanes=n_lanes)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_mlp_node_d{width_i}_w{width_w}_n{n_inputs}_m{n_neurons}_l{n_lanes}.vcd')
+    run(core, 'cnn.tests.test_mlp_node', ports=ports, vcd_file=vcd_file)
+
+@pytest.mark.parametrize("width_i, width_w, n_inputs, n_neurons, n_lanes, input_range", [
+    (8, 8, 8, 2, 1, None),
+    (8, 8, 1000, 2, 8, None),
+    (8, 8, 8, 2, 1, (0, 127)),
+    (8, 8, 1000, 2, 8, (0, 127)),
+    (8, 8, 64, 2, 4, (-16, 15)),
+])
+def test_mlp_node_input_range(width_i, width_w, n_inputs, n_neurons, n_lanes, input_range):
+    seed = random.randint(0, 99999)
+    full_range = (-2**(width_i-1), 2**(width_i-1)-1)
+    os.environ['coco_param_n_inputs'] = str(n_inputs)
+    os.environ['coco_param_n_neurons'] = str(n_neurons)
+    os.environ['coco_param_n_lanes'] = str(n_lanes)
+    os.environ['coco_param_seed'] = str(seed) # so from cocotb can generate same random data
+    if input_range is None:
+        input_range = full_range
+    os.environ['coco_param_input_range'] = ','.join([str(x) for x in input_range])
+    os.environ.pop('coco_param_burst', None)
+    rom_init = get_rom(width_w, n_inputs*n_neurons, seed=seed)
+    bias_init = get_rom(width_i, n_neurons, seed=seed+1)
+    core = mlpNode(width_i=width_i,
+                   width_w=width_w,
+                   n_inputs=n_inputs,
+                   rom_init=rom_init,
+                   bias_init=bias_init,
+                   n_lanes=n_lanes,
+                   input_range=input_range)
+    worst_case = mlpNode(width_i=width_i,
+                         width_w=width_w,
+                         n_inputs=n_inputs,
+                         rom_init=rom_init,
+                         bias_init=bias_init,
+                         n_lanes=n_lanes)
+    if input_range == full_range:
+        assert len(core.output.data) <= len(worst_case.output.data)
+    else:
+        assert len(core.output.data) < len(worst_case.output.data)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_mlp_node_range_d{width_i}_w{width_w}_n{n_inputs}_m{n_neurons}_l{n_lanes}_r{input_range[0]}_{input_range[1]}.vcd')
+    run(core, 'cnn.tests.test_mlp_node', ports=ports, vcd_file=vcd_file)
+
+
+@pytest.mark.parametrize("width_i, width_w, n_inputs, n_neurons, n_lanes, burst, n_buffers, latency", [
+    (8, 8, 8, 2, 1, 4, 3, 1),
+    (8, 8, 16, 3, 1, 8, 3, 5),
+    (8, 8, 64, 2, 8, 8, 3, 5),
+    (8, 8, 16, 2, 1, 4, 2, 8),
 ])
-def test_mlp_node(width_i, width_w, n_inputs, n_neurons):
+def test_mlp_node_weight_fetch(width_i, width_w, n_inputs, n_neurons, n_lanes, burst, n_buffers, latency):
     seed = random.randint(0, 99999)
+    full_rate = (n_buffers - 2) * burst >= latency + 3
     os.environ['coco_param_n_inputs'] = str(n_inputs)
     os.environ['coco_param_n_neurons'] = str(n_neurons)
+    os.environ['coco_param_n_lanes'] = str(n_lanes)
     os.environ['coco_param_seed'] = str(seed) # so from cocotb can generate same random data
-    rom_init = get_rom(width_w, (n_inputs+1)*n_neurons, seed=seed)
+    os.environ['coco_param_burst'] = str(burst)
+    os.environ['coco_param_latency'] = str(latency)
+    os.environ['coco_param_full_rate'] = str(int(full_rate))
+    os.environ.pop('coco_param_input_range', None)
+    rom_init = get_rom(width_w, n_inputs*n_neurons, seed=seed)
+    bias_init = get_rom(width_i, n_neurons, seed=seed+1)
     core = mlpNode(width_i=width_i,
                    width_w=width_w,
                    n_inputs=n_inputs,
-                   rom_init=rom_init)
+                   rom_init=rom_init,
+                   bias_init=bias_init,
+                   n_lanes=n_lanes,
+                   burst=burst,
+                   n_buffers=n_buffers)
     ports = core.get_ports()
-    vcd_file = vcd_only_if_env(f'./test_mlp_node_d{width_i}_w{width_w}_n{n_inputs}_m{n_neurons}.vcd')
-    run(core, 'cnn.tests.test_mlp_node', ports=ports, vcd_file=vcd_file)
\ No newline at end of file
+    vcd_file = vcd_only_if_env(f'./test_mlp_node_fetch_d{width_i}_w{width_w}_n{n_inputs}_m{n_neurons}_l{n_lanes}_b{burst}_n{n_buffers}_t{latency}.vcd')
+    run(core, 'cnn.tests.test_mlp_node', ports=ports, vcd_file=vcd_file)
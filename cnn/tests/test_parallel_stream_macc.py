@@ -0,0 +1,157 @@
+from nmigen_cocotb import run
+from cnn.stream_macc import ParallelStreamMacc
+from cnn.log_quant import log_decode, log_code_width
+from cnn.tests.utils import vcd_only_if_env, pack
+from cnn.tests.interfaces import SignedStreamDriver, SignedMatrixStreamDriver
+
+import os
+import pytest
+import random
+import numpy as np
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+CLK_PERIOD_BASE = 100
+random.seed()
+
+
+class ROM():
+
+    def __init__(self, dut, width, n_lanes, depth):
+        self.dut = dut
+        self.width = width
+        _min, _max = -2**(width-1), 2**(width-1)-1
+        self.memory = [[random.randint(_min, _max) for _ in range(n_lanes)] for _ in range(depth)]
+        self.buffer = []
+
+    def init(self):
+        self.dut.r_rdy <= 0
+        self.dut.r_data <= 0
+
+    @cocotb.coroutine
+    def run(self):
+        while self.dut.rst.value.integer:
+            yield RisingEdge(self.dut.clk)
+        yield RisingEdge(self.dut.clk)
+        self.dut.r_rdy <= 1
+        i = 0
+        mask = 2**self.width - 1
+        while True:
+            word = [w & mask for w in self.memory[i]]
+            self.dut.r_data <= next(pack(word, len(word), self.width))
+            yield RisingEdge(self.dut.clk)
+            if self.dut.r_rdy.value.integer and self.dut.r_en.value.integer:
+                self.buffer += self.memory[i]
+                i += 1
+                i %= len(self.memory)
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+def check_output(buff_in, coeff, buff_out, shift=0):
+    buff_in = [x for sample in buff_in for x in sample]
+    assert len(buff_in) == len(coeff), (
+        f'{len(buff_in)} != {len(coeff)}')
+    assert len(buff_out) == 1, f'{len(buff_out)} != 1'
+    acc = sum([a * b for a, b in zip(buff_in, coeff)])
+    assert (acc >> shift) == buff_out[0], f'{acc} != {buff_out[0]}'
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+    width_out = len(dut.output__data)
+    width_acc = len(dut.accumulator)
+    width_c = int(len(dut.r_data) / n_lanes)
+    shift = width_acc - width_out
+
+    test_size = 32
+    rom = ROM(dut, width=width_c, n_lanes=n_lanes, depth=test_size)
+    m_axis = SignedMatrixStreamDriver(dut, name='input_', clock=dut.clk, shape=(n_lanes,))
+    s_axis = SignedStreamDriver(dut, name='output_', clock=dut.clk)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    rom.init()
+    yield reset(dut)
+
+    cocotb.fork(m_axis.monitor())
+    cocotb.fork(s_axis.monitor())
+    cocotb.fork(rom.run())
+
+    width_i = m_axis.width
+    data_in = [[random.getrandbits(width_i) for _ in range(n_lanes)] for _ in range(test_size)]
+
+    cocotb.fork(m_axis.send(data_in, burps_in))
+    yield s_axis.recv(1, burps_out)
+
+    coeff = rom.buffer
+    if log_exp_w is not None:
+        # every code is a valid power of two weight
+        coeff = list(log_decode([c % 2**width_c for c in coeff], log_exp_w))
+    check_output(m_axis.buffer, coeff, s_axis.buffer, shift=shift)
+
+
+try:
+    running_cocotb = True
+    n_lanes = int(os.environ['coco_param_n_lanes'], 10)
+    log_exp_w = os.environ.get('coco_param_log_exp_w', '')
+    log_exp_w = int(log_exp_w, 10) if log_exp_w else None
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('dummy', [0] * 5)
+    tf_test_data.generate_tests()
+
+
+@pytest.mark.parametrize("width_i, width_c, n_lanes, width_acc, shift", [
+    (8, 8, 1, 24, 0),
+    (8, 8, 3, 24, 0),
+    (8, 8, 4, 24, 3),
+    (8, 4, 8, 24, 0),
+])
+def test_parallel_stream_macc(width_i, width_c, n_lanes, width_acc, shift):
+    core = ParallelStreamMacc(width_i=width_i,
+                              width_c=width_c,
+                              n_lanes=n_lanes,
+                              width_acc=width_acc,
+                              shift=shift)
+    os.environ['coco_param_n_lanes'] = str(n_lanes)
+    os.environ['coco_param_log_exp_w'] = ''
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_parallel_stream_macc_i{width_i}_c{width_c}_n{n_lanes}.vcd')
+    run(core, 'cnn.tests.test_parallel_stream_macc', ports=ports, vcd_file=vcd_file)
+
+
+@pytest.mark.parametrize("width_i, n_lanes, exp_w", [
+    (8, 1, 2),
+    (8, 4, 2),
+    (8, 3, 3),
+])
+def test_parallel_stream_macc_log(width_i, n_lanes, exp_w):
+    core = ParallelStreamMacc(width_i=width_i,
+                              width_c=log_code_width(exp_w),
+                              n_lanes=n_lanes,
+                              width_acc=32,
+                              shift=0,
+                              log_exp_w=exp_w)
+    os.environ['coco_param_n_lanes'] = str(n_lanes)
+    os.environ['coco_param_log_exp_w'] = str(exp_w)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_parallel_stream_macc_log_i{width_i}_n{n_lanes}_e{exp_w}.vcd')
+    run(core, 'cnn.tests.test_parallel_stream_macc', ports=ports, vcd_file=vcd_file)
@@ -1,6 +1,7 @@
 from nmigen_cocotb import run
 from cnn.relu import Relu
 from cnn.tests.interfaces import SignedStreamDriver as Driver
+from cnn.tests.interfaces import SignedMatrixStreamDriver as MatrixDriver
 from cnn.tests.utils import vcd_only_if_env, int_from_twos_comp
 import pytest
 import numpy as np
@@ -20,13 +21,14 @@ except:
 def calc_expected(width, wr_data, leak):
     expected = []
     for val in wr_data:
-        if val >= 0:
-            exp = val
+        if isinstance(val, list):
+            expected.append(calc_expected(width, val, leak))
+        elif val >= 0:
+            expected.append(val)
         elif leak == 0:
-            exp = 0
+            expected.append(0)
         else:
-            exp = int(floor(val / 2**(width-leak)))
-        expected.append(exp)
+            expected.append(int(floor(val / 2**(width-leak))))
     return expected
 
 
@@ -47,9 +49,14 @@ def reset(dut):
 @cocotb.coroutine
 def check_data(dut, leak, burps_in=False, burps_out=False, dummy=0):
 
-    m_axis = Driver(dut, name='input_', clock=dut.clk)
-    s_axis = Driver(dut, name='output_', clock=dut.clk)
-    width = len(dut.input__data)
+    if n_lanes == 1:
+        m_axis = Driver(dut, name='input_', clock=dut.clk)
+        s_axis = Driver(dut, name='output_', clock=dut.clk)
+        width = len(dut.input__data)
+    else:
+        m_axis = MatrixDriver(dut, name='input_', clock=dut.clk, shape=(n_lanes,))
+        s_axis = MatrixDriver(dut, name='output_', clock=dut.clk, shape=(n_lanes,))
+        width = m_axis.width
 
     create_clock(dut)
     m_axis.init_master()
@@ -58,6 +65,8 @@ def check_data(dut, leak, burps_in=False, burps_out=False, dummy=0):
 
     test_size = 50
     wr_data = [int_from_twos_comp(random.getrandbits(width), width) for _ in range(test_size)]
+    if n_lanes > 1:
+        wr_data = [m_axis._get_random_data() for _ in range(test_size)]
     
     cocotb.fork(m_axis.monitor())
     cocotb.fork(s_axis.monitor())
@@ -74,6 +83,7 @@ def check_data(dut, leak, burps_in=False, burps_out=False, dummy=0):
 try:
     running_cocotb = True
     leak = int(os.environ['coco_param_leak'], 10)
+    n_lanes = int(os.environ.get('coco_param_n_lanes', '1'), 10)
 except KeyError as e:
     running_cocotb = False
 
@@ -94,8 +104,28 @@ if running_cocotb:
 ])
 def test_main(width, leak):
     os.environ['coco_param_leak'] = str(leak)
+    os.environ['coco_param_n_lanes'] = '1'
     core = Relu(width=width,
                 leak=leak)
     ports = core.get_ports()
     vcd_file = vcd_only_if_env(f'./test_relu_w{width}_l{leak}.vcd')
     run(core, 'cnn.tests.test_relu', ports=ports, vcd_file=vcd_file)
+
+
+@pytest.mark.timeout(10)
+@pytest.mark.parametrize("width, leak, n_lanes, registered", [
+    (8, 0, 1, True),
+    (8, 1, 4, False),
+    (8, 7, 4, True),
+    (16, 0, 8, True),
+])
+def test_relu_lanes(width, leak, n_lanes, registered):
+    os.environ['coco_param_leak'] = str(leak)
+    os.environ['coco_param_n_lanes'] = str(n_lanes)
+    core = Relu(width=width,
+                leak=leak,
+                n_lanes=n_lanes,
+                registered=registered)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_relu_w{width}_l{leak}_n{n_lanes}_r{int(registered)}.vcd')
+    run(core, 'cnn.tests.test_relu', ports=ports, vcd_file=vcd_file)
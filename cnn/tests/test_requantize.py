@@ -0,0 +1,93 @@
+from nmigen_cocotb import run
+from cnn.requantize import Requantizer, requantize
+from cnn.tests.interfaces import SignedStreamDriver as Driver
+from cnn.tests.utils import vcd_only_if_env
+import pytest
+import os
+import random
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+
+def calc_expected(wr_data, multiplier, shift, width_o, zero_point):
+    expected = []
+    for i, val in enumerate(wr_data):
+        mult = multiplier[i % len(multiplier)]
+        expected.append(requantize(val, mult, shift, width_o, zero_point))
+    return expected
+
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+
+    m_axis = Driver(dut, name='input_', clock=dut.clk)
+    s_axis = Driver(dut, name='output_', clock=dut.clk)
+    width_i = len(dut.input__data)
+    width_o = len(dut.output__data)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    for i in range(3):
+        # a whole number of channels, so the channel counter restarts with last
+        test_size = 10 * len(multiplier)
+        wr_data = [random.randint(-2**(width_i-1), 2**(width_i-1)-1) for _ in range(test_size)]
+        cocotb.fork(m_axis.send(wr_data, burps=burps_in))
+        rd_data = yield s_axis.recv(burps=burps_out)
+
+        expected = calc_expected(wr_data, multiplier, shift, width_o, zero_point)
+        assert rd_data == expected, f'\n{rd_data}\n!=\n{expected}'
+
+
+try:
+    running_cocotb = True
+    multiplier = [int(x) for x in os.environ['coco_param_multiplier'].split(',')]
+    shift = int(os.environ['coco_param_shift'], 10)
+    zero_point = int(os.environ['coco_param_zero_point'], 10)
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('dummy', [0] * 3)
+    tf_test_data.generate_tests()
+
+
+@pytest.mark.parametrize("width_i, width_o, multiplier, shift, zero_point", [
+    (24, 8, [77], 10, 0),
+    (16, 4, [1], 0, 0),
+    (20, 8, [100, -50, 3], 12, 5),
+    (24, 8, [200, 127], 9, -3),
+    (16, 8, [0, 64], 6, 2),
+])
+def test_requantize(width_i, width_o, multiplier, shift, zero_point):
+    os.environ['coco_param_multiplier'] = ','.join([str(x) for x in multiplier])
+    os.environ['coco_param_shift'] = str(shift)
+    os.environ['coco_param_zero_point'] = str(zero_point)
+    core = Requantizer(width_i=width_i,
+                       width_o=width_o,
+                       multiplier=multiplier,
+                       shift=shift,
+                       zero_point=zero_point)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_requantize_i{width_i}_o{width_o}_m{len(multiplier)}.vcd')
+    run(core, 'cnn.tests.test_requantize', ports=ports, vcd_file=vcd_file)
@@ -1,5 +1,6 @@
 from nmigen_cocotb import run
-from cnn.rom import CircularROM
+from cnn.rom import CircularROM, CodebookROM
+from cnn.tests.utils import pack
 
 import pytest
 import random
@@ -15,6 +16,7 @@ except:
     pass
 
 mem_init = list(range(10, 138))
+codebook_init = [[-100, 0, 0, 5, 0, 77, -3][i % 7] for i in range(128)]
 CLK_PERIOD = 10
 
 def create_clock(dut):
@@ -31,7 +33,10 @@ def reset(dut):
 
 @cocotb.coroutine
 def read_and_check(dut, burps):
-    expected = 2 * mem_init[:depth]
+    width = int(len(dut.r_data) / n_banks)
+    init = codebook_init if codebook else mem_init
+    init = [x & (2**width - 1) for x in init[:depth]]
+    expected = 2 * list(pack(init, n_banks, width))
     
     while len(expected):
         r_en = random.randint(0, 1) if burps else 1
@@ -61,7 +66,7 @@ def check_restart(dut, burps=False, dummy=0):
     yield reset(dut)
     
     # random state
-    for i in range(3 * depth):
+    for i in range(3 * int(depth / n_banks)):
         r_en = random.randint(0, 1)
         dut.r_en <= r_en
         yield RisingEdge(dut.clk)
@@ -77,6 +82,8 @@ def check_restart(dut, burps=False, dummy=0):
 try:
     running_cocotb = True
     depth = int(os.environ['cocotb_param_depth'], 10)
+    n_banks = int(os.environ['cocotb_param_n_banks'], 10)
+    codebook = int(os.environ['cocotb_param_codebook'], 10)
 except KeyError:
     running_cocotb = False
 
@@ -93,13 +100,36 @@ if running_cocotb:
 
 
 @pytest.mark.parametrize(
-    "width, depth", [
-    (8, 8),
+    "width, depth, n_banks", [
+    (8, 8, 1),
+    (8, 8, 2),
+    (8, 10, 3),
+    (8, 8, 8),
     ])
-def test_core(width, depth):
+def test_core(width, depth, n_banks):
     core = CircularROM(width=width,
-                       init=mem_init[:depth])
+                       init=mem_init[:depth],
+                       n_banks=n_banks)
     os.environ['cocotb_param_depth'] = str(depth)
+    os.environ['cocotb_param_n_banks'] = str(n_banks)
+    os.environ['cocotb_param_codebook'] = '0'
     ports = core.get_ports()
-    run(core, 'cnn.tests.test_rom', ports=ports, vcd_file=f'./test_rom_w{width}_d{depth}.vcd')
+    run(core, 'cnn.tests.test_rom', ports=ports, vcd_file=f'./test_rom_w{width}_d{depth}_b{n_banks}.vcd')
+
+
+@pytest.mark.parametrize(
+    "width, depth, n_banks", [
+    (8, 8, 1),
+    (8, 64, 1),
+    (8, 10, 3),
+    ])
+def test_codebook(width, depth, n_banks):
+    core = CodebookROM(width=width,
+                       init=codebook_init[:depth],
+                       n_banks=n_banks)
+    os.environ['cocotb_param_depth'] = str(depth)
+    os.environ['cocotb_param_n_banks'] = str(n_banks)
+    os.environ['cocotb_param_codebook'] = '1'
+    ports = core.get_ports()
+    run(core, 'cnn.tests.test_rom', ports=ports, vcd_file=f'./test_codebook_rom_w{width}_d{depth}_b{n_banks}.vcd')
 
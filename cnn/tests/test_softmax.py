@@ -0,0 +1,85 @@
+from nmigen_cocotb import run
+from cnn.classifier import Softmax, softmax
+from cnn.tests.interfaces import SignedStreamDriver, StreamDriver
+from cnn.tests.utils import vcd_only_if_env
+import pytest
+import os
+import random
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+
+    m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
+    s_axis = StreamDriver(dut, name='output_', clock=dut.clk)
+    width_i = len(dut.input__data)
+    width_o = len(dut.output__data)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    for i in range(3):
+        length = random.randint(1, n_inputs)
+        wr_data = [random.randint(-2**(width_i-1), 2**(width_i-1)-1) for _ in range(length)]
+        cocotb.fork(m_axis.send(wr_data, burps=burps_in))
+        rd_data = yield s_axis.recv(burps=burps_out)
+
+        expected = softmax(wr_data, table, sum_w, width_o, frac_o)
+        assert rd_data == expected, f'\n{rd_data}\n!=\n{expected}'
+
+
+try:
+    running_cocotb = True
+    n_inputs = int(os.environ['coco_param_n_inputs'], 10)
+    table = [int(x) for x in os.environ['coco_param_table'].split(',')]
+    sum_w = int(os.environ['coco_param_sum_w'], 10)
+    frac_o = int(os.environ['coco_param_frac_o'], 10)
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('dummy', [0] * 3)
+    tf_test_data.generate_tests()
+
+
+@pytest.mark.parametrize("width_i, frac_i, n_inputs, width_o, frac_o, frac_e", [
+    (8, 4, 10, 8, 8, 16),
+    (12, 6, 16, 16, 15, 12),
+    (8, 2, 5, 8, 7, 10),
+])
+def test_softmax(width_i, frac_i, n_inputs, width_o, frac_o, frac_e):
+    core = Softmax(width_i=width_i,
+                   frac_i=frac_i,
+                   n_inputs=n_inputs,
+                   width_o=width_o,
+                   frac_o=frac_o,
+                   frac_e=frac_e)
+    os.environ['coco_param_n_inputs'] = str(n_inputs)
+    os.environ['coco_param_table'] = ','.join([str(x) for x in core.table])
+    os.environ['coco_param_sum_w'] = str(core.sum_w)
+    os.environ['coco_param_frac_o'] = str(frac_o)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_softmax_i{width_i}_n{n_inputs}_o{width_o}.vcd')
+    run(core, 'cnn.tests.test_softmax', ports=ports, vcd_file=vcd_file)
@@ -0,0 +1,154 @@
+from nmigen_cocotb import run
+from cnn.mlp_node import SparseMlpNode
+from cnn.tests.utils import vcd_only_if_env
+from cnn.tests.interfaces import SignedStreamDriver
+
+import os
+import pytest
+import random
+import numpy as np
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+CLK_PERIOD_BASE = 100
+random.seed()
+
+def get_rom(width, depth, density, seed=None):
+    random.seed(seed)
+    _min, _max = -2**(width-1), +2**(width-1)-1
+    rom = [random.randint(_min, _max) for _ in range(depth)]
+    rom = [w if random.random() < density else 0 for w in rom]
+    return rom
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+def check_output(buff_in, coeff, bias, buff_out, shift=0, bias_shift=0):
+    assert len(buff_out) == n_neurons, (
+        f'{len(buff_out)} != {n_neurons}')
+    for i in range(n_neurons):
+        co = coeff[i*n_inputs:(i+1)*n_inputs]
+        acc = sum([a * b for a, b in zip(buff_in, co)])
+        acc += bias[i] << bias_shift
+        assert (acc >> shift) == buff_out[i], f'{acc} != {buff_out[i]}'
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+
+    width_i = len(dut.input__data)
+    width_b = len(dut.bias_rom.r_data)
+    output_w = len(dut.output__data)
+    acc_w = len(dut.macc.accumulator)
+    shift = acc_w - output_w
+    rom_init = get_rom(width_w, n_inputs*n_neurons, density, seed=seed)
+    bias_init = get_rom(width_b, n_neurons, 1, seed=seed+1)
+
+    m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
+    s_axis = SignedStreamDriver(dut, name='output_', clock=dut.clk)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    for i in range(3):
+        data_in = [random.getrandbits(width_i) for _ in range(n_inputs)]
+        cocotb.fork(m_axis.send(data_in, burps_in))
+        rd = yield s_axis.recv(n_neurons, burps_out)
+
+        data_in = [x - 2**width_i if x >> (width_i - 1) else x for x in data_in]
+        check_output(buff_in=data_in,
+                     coeff=rom_init,
+                     bias=bias_init,
+                     buff_out=rd,
+                     shift=shift,
+                     bias_shift=shift)
+
+
+@cocotb.coroutine
+def check_cycles(dut, dummy=0):
+
+    width_i = len(dut.input__data)
+    rom_init = get_rom(width_w, n_inputs*n_neurons, density, seed=seed)
+    n_weights = 0
+    for i in range(n_neurons):
+        n_weights += max(1, len([w for w in rom_init[i*n_inputs:(i+1)*n_inputs] if w != 0]))
+
+    m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
+    s_axis = SignedStreamDriver(dut, name='output_', clock=dut.clk)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    data_in = [random.getrandbits(width_i) for _ in range(n_inputs)]
+    yield m_axis.send(data_in)
+    dut.output__ready <= 1
+    cycles = 0
+    while not (dut.output__valid.value.integer and dut.output__last.value.integer):
+        yield RisingEdge(dut.clk)
+        cycles += 1
+
+    # one cycle per non zero weight (plus the pipeline latency)
+    latency = 10
+    assert cycles <= n_weights + latency, f'{cycles} > {n_weights} + {latency}'
+
+
+try:
+    running_cocotb = True
+    width_w = int(os.environ['coco_param_width_w'], 10)
+    n_inputs = int(os.environ['coco_param_n_inputs'], 10)
+    n_neurons = int(os.environ['coco_param_n_neurons'], 10)
+    density = float(os.environ['coco_param_density'])
+    seed = int(os.environ['coco_param_seed'], 10)
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('dummy', [0] * 5)
+    tf_test_data.generate_tests()
+
+    tf_test_cycles = TF(check_cycles)
+    tf_test_cycles.generate_tests()
+
+
+@pytest.mark.parametrize("width_i, width_w, n_inputs, n_neurons, density",
+[
+    (8, 8, 8, 1, 0.5),
+    (8, 8, 8, 4, 0.2),
+    (8, 8, 100, 3, 0.1),
+    (8, 8, 8, 2, 0.0),
+])
+def test_sparse_mlp_node(width_i, width_w, n_inputs, n_neurons, density):
+    seed = random.randint(0, 99999)
+    os.environ['coco_param_width_w'] = str(width_w)
+    os.environ['coco_param_n_inputs'] = str(n_inputs)
+    os.environ['coco_param_n_neurons'] = str(n_neurons)
+    os.environ['coco_param_density'] = str(density)
+    os.environ['coco_param_seed'] = str(seed) # so from cocotb can generate same random data
+    rom_init = get_rom(width_w, n_inputs*n_neurons, density, seed=seed)
+    bias_init = get_rom(width_i, n_neurons, 1, seed=seed+1)
+    core = SparseMlpNode(width_i=width_i,
+                         width_w=width_w,
+                         n_inputs=n_inputs,
+                         rom_init=rom_init,
+                         bias_init=bias_init)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_sparse_mlp_node_d{width_i}_w{width_w}_n{n_inputs}_m{n_neurons}.vcd')
+    run(core, 'cnn.tests.test_sparse_mlp_node', ports=ports, vcd_file=vcd_file)
@@ -1,8 +1,10 @@
 from nmigen_cocotb import run
 from cnn.stream_macc import StreamMacc
+from cnn.log_quant import log_decode, log_code_width
 from cnn.tests.utils import vcd_only_if_env
 from cnn.tests.interfaces import SignedStreamDriver
 
+import os
 import pytest
 import random
 import numpy as np
@@ -58,6 +60,12 @@ def reset(dut):
     dut.rst <= 0
     yield RisingEdge(dut.clk)
 
+def decode_coeff(coeff, width_c):
+    if log_exp_w is None:
+        return coeff
+    # every code is a valid power of two weight
+    return list(log_decode([c % 2**width_c for c in coeff], log_exp_w))
+
 def check_output(buff_in, coeff, buff_out, shift=0):
     assert len(buff_in) == len(coeff), (
         f'{len(buff_in)} != {len(coeff)}')
@@ -101,7 +109,7 @@ def check_data(dut, burps_in=False, burps_out=False, dummy=0, profile='random'):
     cocotb.fork(m_axis.send(data_in, burps_in))
     yield s_axis.recv(test_size, burps_out)
     
-    check_output(m_axis.buffer, rom.buffer, s_axis.buffer, shift=shift)
+    check_output(m_axis.buffer, decode_coeff(rom.buffer, width_b), s_axis.buffer, shift=shift)
 
 
 @cocotb.coroutine
@@ -143,9 +151,97 @@ def check_multiple(dut, burps_in=False, burps_out=False, dummy=0):
     cocotb.fork(m_axis.send(data_in, burps_in))
     yield s_axis.recv(test_size, burps_out)
     
-    check_output(m_axis.buffer, rom.buffer, s_axis.buffer, shift=shift)
+    check_output(m_axis.buffer, decode_coeff(rom.buffer, width_b), s_axis.buffer, shift=shift)
+
+
+@cocotb.coroutine
+def send_vectors(m_axis, vectors, burps):
+    for v in vectors:
+        yield m_axis.send(v, burps)
+
+
+@cocotb.coroutine
+def check_back_to_back(dut, burps_in=False, burps_out=False, dummy=0):
+
+    width_a = len(dut.input__data)
+    width_b = len(dut.r_data)
+    width_out = len(dut.output__data)
+    width_acc = len(dut.accumulator)
+    shift = width_acc - width_out
+
+    vector_size = 3
+    n_vectors = 10
+    rom = ROM(dut, width=width_b, depth=vector_size, profile='random')
+    m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
+    s_axis = SignedStreamDriver(dut, name='output_', clock=dut.clk)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    rom.init()
+    yield reset(dut)
+
+    cocotb.fork(m_axis.monitor())
+    cocotb.fork(rom.run())
+
+    vectors = [[random.getrandbits(width_a) for _ in range(vector_size)] for _ in range(n_vectors)]
+    cocotb.fork(send_vectors(m_axis, vectors, burps_in))
+
+    while len(s_axis.buffer) < n_vectors:
+        rd = yield s_axis.recv(1, burps_out)
+        s_axis.buffer += rd
+
+    coeff = decode_coeff(rom.buffer, width_b)
+    for i in range(n_vectors):
+        check_output(m_axis.buffer[i*vector_size:(i+1)*vector_size],
+                     coeff[i*vector_size:(i+1)*vector_size],
+                     s_axis.buffer[i:i+1],
+                     shift=shift)
 
 
+@cocotb.coroutine
+def check_throughput(dut, dummy=0):
+
+    width_a = len(dut.input__data)
+    width_b = len(dut.r_data)
+    latency = 5
+
+    vector_size = 2
+    n_vectors = 10
+    rom = ROM(dut, width=width_b, depth=vector_size, profile='random')
+    m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
+    s_axis = SignedStreamDriver(dut, name='output_', clock=dut.clk)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    rom.init()
+    yield reset(dut)
+
+    cocotb.fork(s_axis.monitor())
+    cocotb.fork(rom.run())
+
+    # wait for the memory to be ready
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+
+    dut.output__ready <= 1
+    vectors = [[random.getrandbits(width_a) for _ in range(vector_size)] for _ in range(n_vectors)]
+    cocotb.fork(send_vectors(m_axis, vectors, burps=False))
+
+    cycles = 0
+    while len(s_axis.buffer) < n_vectors:
+        yield RisingEdge(dut.clk)
+        cycles += 1
+
+    # one sample per clock, also across vector boundaries
+    max_cycles = n_vectors * vector_size + latency + 1
+    assert cycles <= max_cycles, f'{cycles} > {max_cycles}'
+
+
+log_exp_w = os.environ.get('coco_param_log_exp_w', '')
+log_exp_w = int(log_exp_w, 10) if log_exp_w else None
+
 tf_test_random = TF(check_data)
 tf_test_random.add_option('burps_in', [False, True])
 tf_test_random.add_option('burps_out', [False, True])
@@ -163,18 +259,31 @@ tf_test_multiple.add_option('burps_out', [False, True])
 tf_test_multiple.add_option('dummy', [0] * 5)
 tf_test_multiple.generate_tests()
 
+tf_test_back_to_back = TF(check_back_to_back)
+tf_test_back_to_back.add_option('burps_in', [False, True])
+tf_test_back_to_back.add_option('burps_out', [False, True])
+tf_test_back_to_back.add_option('dummy', [0] * 5)
+tf_test_back_to_back.generate_tests()
+
+tf_test_throughput = TF(check_throughput)
+tf_test_throughput.generate_tests()
+
 
 @pytest.mark.parametrize("args, kwargs", [
     ([], {'width_i': 8, 'width_c': 9}),
     ([], {'width_i': 8, 'width_c': 9, 'width_acc': 19}),
     ([], {'width_i': 8, 'width_c': 9, 'width_acc': 20, 'shift': 3}),
+    ([], {'width_i': 8, 'width_c': log_code_width(2), 'width_acc': 32, 'log_exp_w': 2}),
+    ([], {'width_i': 8, 'width_c': log_code_width(3), 'width_acc': 32, 'log_exp_w': 3}),
 ])
 def test_stream_macc(args, kwargs):
     core = StreamMacc(*args, **kwargs)
+    os.environ['coco_param_log_exp_w'] = str(kwargs.get('log_exp_w', ''))
     ports = core.get_ports()
     iw = len(core.input.data)
     cw = len(core.r_data)
     aw = len(core.accumulator)
     ow = len(core.output.data)
-    vcd_file = vcd_only_if_env(f'./test_stream_macc_i{iw}_c{cw}_a{aw}_w{ow}.vcd')
+    log = f'_e{kwargs["log_exp_w"]}' if 'log_exp_w' in kwargs else ''
+    vcd_file = vcd_only_if_env(f'./test_stream_macc_i{iw}_c{cw}_a{aw}_w{ow}{log}.vcd')
     run(core, 'cnn.tests.test_stream_macc', ports=ports, vcd_file=vcd_file)
\ No newline at end of file
@@ -0,0 +1,140 @@
+from nmigen_cocotb import run
+from cnn.weight_fetch import WeightFetcher
+from cnn.tests.memory_model import ExternalMemory
+from cnn.tests.utils import vcd_only_if_env
+
+import pytest
+import random
+import os
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+CLK_PERIOD = 10
+base_addr = 0x100
+
+def create_clock(dut):
+    cocotb.fork(Clock(dut.clk, CLK_PERIOD, 'ns').start())
+
+@cocotb.coroutine
+def reset(dut):
+    dut.r_en <= 0
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+
+def get_memory(width, depth, seed):
+    random.seed(seed)
+    return [random.getrandbits(width) for _ in range(depth)]
+
+@cocotb.coroutine
+def check_data(dut, burps_mem=False, burps_rd=False, dummy=0):
+
+    width = len(dut.r_data)
+    data = get_memory(width, depth, seed)
+    memory = ExternalMemory(dut, req_name='mem_req_', resp_name='mem_resp_', clock=dut.clk,
+                            data=data, burst=burst, latency=latency, base_addr=base_addr)
+
+    create_clock(dut)
+    memory.init()
+    yield reset(dut)
+
+    cocotb.fork(memory.run(burps=burps_mem))
+
+    expected = 3 * data
+    while len(expected):
+        r_en = random.randint(0, 1) if burps_rd else 1
+        dut.r_en <= r_en
+        yield RisingEdge(dut.clk)
+        if dut.r_en.value.integer and dut.r_rdy.value.integer:
+            exp = expected.pop(0)
+            got = dut.r_data.value.integer
+            assert got == exp, f'{got} != {exp}'
+
+    for i, addr in enumerate(memory.requests):
+        exp = base_addr + (i * burst) % depth
+        assert addr == exp, f'{addr} != {exp}'
+
+
+@cocotb.coroutine
+def check_throughput(dut, dummy=0):
+
+    width = len(dut.r_data)
+    data = get_memory(width, depth, seed)
+    memory = ExternalMemory(dut, req_name='mem_req_', resp_name='mem_resp_', clock=dut.clk,
+                            data=data, burst=burst, latency=latency, base_addr=base_addr)
+
+    create_clock(dut)
+    memory.init()
+    yield reset(dut)
+
+    cocotb.fork(memory.run())
+
+    dut.r_en <= 1
+    while not dut.r_rdy.value.integer:
+        yield RisingEdge(dut.clk)
+
+    n_reads = 3 * depth
+    cycles = 0
+    reads = 0
+    while reads < n_reads:
+        yield RisingEdge(dut.clk)
+        cycles += 1
+        if dut.r_en.value.integer and dut.r_rdy.value.integer:
+            reads += 1
+
+    assert cycles == n_reads, f'{cycles} != {n_reads}'
+
+
+try:
+    running_cocotb = True
+    depth = int(os.environ['coco_param_depth'], 10)
+    burst = int(os.environ['coco_param_burst'], 10)
+    latency = int(os.environ['coco_param_latency'], 10)
+    full_rate = int(os.environ['coco_param_full_rate'], 10)
+    seed = int(os.environ['coco_param_seed'], 10)
+except KeyError:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_data = TF(check_data)
+    tf_data.add_option('burps_mem', [False, True])
+    tf_data.add_option('burps_rd', [False, True])
+    tf_data.add_option('dummy', [0]*3)
+    tf_data.generate_tests()
+
+    if full_rate:
+        tf_throughput = TF(check_throughput)
+        tf_throughput.generate_tests()
+
+
+@pytest.mark.parametrize(
+    "width, depth, burst, n_buffers, latency", [
+    (8, 16, 4, 2, 0),
+    (8, 16, 4, 2, 10),
+    (8, 64, 8, 4, 10),
+    (16, 48, 16, 3, 12),
+    (8, 12, 1, 3, 1),
+    ])
+def test_weight_fetch(width, depth, burst, n_buffers, latency):
+    seed = random.randint(0, 99999)
+    full_rate = (n_buffers - 2) * burst >= latency + 3
+    os.environ['coco_param_depth'] = str(depth)
+    os.environ['coco_param_burst'] = str(burst)
+    os.environ['coco_param_latency'] = str(latency)
+    os.environ['coco_param_full_rate'] = str(int(full_rate))
+    os.environ['coco_param_seed'] = str(seed)
+    core = WeightFetcher(width=width,
+                         depth=depth,
+                         burst=burst,
+                         n_buffers=n_buffers,
+                         base_addr=base_addr)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_weight_fetch_w{width}_d{depth}_b{burst}_n{n_buffers}_l{latency}.vcd')
+    run(core, 'cnn.tests.test_weight_fetch', ports=ports, vcd_file=vcd_file)
@@ -0,0 +1,139 @@
+from nmigen_cocotb import run
+from cnn.zero_skip import ZeroSkip
+from cnn.tests.utils import vcd_only_if_env
+from cnn.tests.interfaces import StreamDriver, MatrixStreamDriver, SparseStreamDriver
+
+import os
+import pytest
+import random
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+CLK_PERIOD_BASE = 100
+random.seed()
+
+
+def get_activations(width, n, density):
+    return [random.getrandbits(width) if random.random() < density else 0 for _ in range(n)]
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+def check_output(buff_in, buff_out):
+    expected = [(i, x) for i, x in enumerate(buff_in) if x != 0]
+    non_zero = [(i, x) for i, x in buff_out if x != 0]
+    assert non_zero == expected, f'{non_zero} != {expected}'
+    # at most one (index, 0) pair to carry the last
+    assert len(buff_out) - len(non_zero) <= 1, f'{buff_out}'
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+
+    if n_lanes == 1:
+        m_axis = StreamDriver(dut, name='input_', clock=dut.clk)
+    else:
+        m_axis = MatrixStreamDriver(dut, name='input_', clock=dut.clk, shape=(n_lanes,))
+    s_axis = SparseStreamDriver(dut, name='output_', clock=dut.clk)
+    width = len(dut.output__data)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    for i in range(3):
+        data_in = get_activations(width, n_inputs, density)
+        if n_lanes == 1:
+            words = data_in
+        else:
+            words = [data_in[j:j+n_lanes] for j in range(0, n_inputs, n_lanes)]
+        cocotb.fork(m_axis.send(words, burps_in))
+        rd = yield s_axis.recv(burps=burps_out)
+        check_output(data_in, rd)
+
+
+@cocotb.coroutine
+def check_cycles(dut, dummy=0):
+
+    s_axis = SparseStreamDriver(dut, name='output_', clock=dut.clk)
+    width = len(dut.output__data)
+    data_in = get_activations(width, n_inputs, density)
+    n_non_zero = len([x for x in data_in if x != 0])
+    n_words = n_inputs // n_lanes
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    s_axis.init_slave()
+    dut.input__valid <= 0
+    yield reset(dut)
+
+    # the input is sent as fast as the core accepts it
+    cocotb.fork(s_axis.recv())
+    dut.input__valid <= 1
+    word = 0
+    cycles = 0
+    while word < n_words:
+        for i in range(n_lanes):
+            value = data_in[word * n_lanes + i]
+            if n_lanes == 1:
+                dut.input__data <= value
+            else:
+                getattr(dut, f'input__data_{i}') <= value
+        yield RisingEdge(dut.clk)
+        cycles += 1
+        if dut.input__ready.value.integer:
+            word += 1
+    dut.input__valid <= 0
+
+    # one cycle per non zero activation or per input word
+    assert cycles <= max(n_non_zero, n_words) + 1, (
+        f'{cycles} > max({n_non_zero}, {n_words}) + 1')
+
+
+try:
+    running_cocotb = True
+    n_inputs = int(os.environ['coco_param_n_inputs'], 10)
+    n_lanes = int(os.environ['coco_param_n_lanes'], 10)
+    density = float(os.environ['coco_param_density'])
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('dummy', [0] * 5)
+    tf_test_data.generate_tests()
+
+    tf_test_cycles = TF(check_cycles)
+    tf_test_cycles.generate_tests()
+
+
+@pytest.mark.parametrize("width, n_inputs, n_lanes, density", [
+    (8, 16, 1, 0.5),
+    (8, 16, 4, 0.3),
+    (8, 32, 8, 0.1),
+    (8, 12, 3, 1.0),
+    (8, 16, 4, 0.0),
+])
+def test_zero_skip(width, n_inputs, n_lanes, density):
+    core = ZeroSkip(width=width,
+                    n_inputs=n_inputs,
+                    n_lanes=n_lanes)
+    os.environ['coco_param_n_inputs'] = str(n_inputs)
+    os.environ['coco_param_n_lanes'] = str(n_lanes)
+    os.environ['coco_param_density'] = str(density)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_zero_skip_w{width}_n{n_inputs}_l{n_lanes}.vcd')
+    run(core, 'cnn.tests.test_zero_skip', ports=ports, vcd_file=vcd_file)
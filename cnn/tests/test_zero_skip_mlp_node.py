@@ -0,0 +1,134 @@
+from nmigen_cocotb import run
+from cnn.zero_skip import ZeroSkipMlpNode
+from cnn.tests.utils import vcd_only_if_env
+from cnn.tests.interfaces import SignedStreamDriver, SignedMatrixStreamDriver
+
+import os
+import pytest
+import random
+import numpy as np
+
+try:
+    import cocotb
+    from cocotb.triggers import RisingEdge
+    from cocotb.clock import Clock
+    from cocotb.regression import TestFactory as TF
+except:
+    pass
+
+CLK_PERIOD_BASE = 100
+random.seed()
+
+def get_rom(width, depth, seed=None):
+    random.seed(seed)
+    _min, _max = -2**(width-1), +2**(width-1)-1
+    return [random.randint(_min, _max) for _ in range(depth)]
+
+def get_activations(width, n, density):
+    # relu output: non negative, with many zeros
+    return [random.randint(1, 2**(width-1)-1) if random.random() < density else 0 for _ in range(n)]
+
+@cocotb.coroutine
+def reset(dut):
+    dut.rst <= 1
+    yield RisingEdge(dut.clk)
+    yield RisingEdge(dut.clk)
+    dut.rst <= 0
+    yield RisingEdge(dut.clk)
+
+def check_output(buff_in, coeff, bias, buff_out, shift=0, bias_shift=0):
+    assert len(buff_out) == n_neurons, (
+        f'{len(buff_out)} != {n_neurons}')
+    for i in range(n_neurons):
+        co = coeff[i*n_inputs:(i+1)*n_inputs]
+        acc = sum([a * b for a, b in zip(buff_in, co)])
+        acc += bias[i] << bias_shift
+        assert (acc >> shift) == buff_out[i], f'{acc} != {buff_out[i]}'
+
+
+@cocotb.coroutine
+def check_data(dut, burps_in=False, burps_out=False, dummy=0):
+
+    width_b = len(dut.bias_rom.r_data)
+    output_w = len(dut.output__data)
+    acc_w = len(dut.macc.accumulator)
+    shift = acc_w - output_w
+    rom_init = get_rom(width_w, n_inputs*n_neurons, seed=seed)
+    bias_init = get_rom(width_b, n_neurons, seed=seed+1)
+
+    if n_lanes == 1:
+        m_axis = SignedStreamDriver(dut, name='input_', clock=dut.clk)
+        width_i = len(dut.input__data)
+    else:
+        m_axis = SignedMatrixStreamDriver(dut, name='input_', clock=dut.clk, shape=(n_lanes,))
+        width_i = m_axis.width
+    s_axis = SignedStreamDriver(dut, name='output_', clock=dut.clk)
+
+    cocotb.fork(Clock(dut.clk, 10, 'ns').start())
+    m_axis.init_master()
+    s_axis.init_slave()
+    yield reset(dut)
+
+    for i in range(3):
+        data_in = get_activations(width_i, n_inputs, density)
+        if n_lanes == 1:
+            words = data_in
+        else:
+            words = [data_in[j:j+n_lanes] for j in range(0, n_inputs, n_lanes)]
+        # the input vector is sent once for each neuron
+        cocotb.fork(m_axis.send(words * n_neurons, burps_in))
+        rd = yield s_axis.recv(n_neurons, burps_out)
+        check_output(buff_in=data_in,
+                     coeff=rom_init,
+                     bias=bias_init,
+                     buff_out=rd,
+                     shift=shift,
+                     bias_shift=shift)
+
+
+try:
+    running_cocotb = True
+    width_w = int(os.environ['coco_param_width_w'], 10)
+    n_inputs = int(os.environ['coco_param_n_inputs'], 10)
+    n_neurons = int(os.environ['coco_param_n_neurons'], 10)
+    n_lanes = int(os.environ['coco_param_n_lanes'], 10)
+    density = float(os.environ['coco_param_density'])
+    seed = int(os.environ['coco_param_seed'], 10)
+except KeyError as e:
+    running_cocotb = False
+
+if running_cocotb:
+    tf_test_data = TF(check_data)
+    tf_test_data.add_option('burps_in', [False, True])
+    tf_test_data.add_option('burps_out', [False, True])
+    tf_test_data.add_option('dummy', [0] * 5)
+    tf_test_data.generate_tests()
+
+
+@pytest.mark.parametrize("width_i, width_w, n_inputs, n_neurons, n_lanes, density",
+[
+    (8, 8, 8, 1, 1, 0.5),
+    (8, 8, 16, 3, 4, 0.3),
+    (8, 8, 64, 2, 8, 0.1),
+    (8, 8, 12, 2, 3, 1.0),
+    (8, 8, 8, 2, 4, 0.0),
+])
+def test_zero_skip_mlp_node(width_i, width_w, n_inputs, n_neurons, n_lanes, density):
+    seed = random.randint(0, 99999)
+    os.environ['coco_param_width_w'] = str(width_w)
+    os.environ['coco_param_n_inputs'] = str(n_inputs)
+    os.environ['coco_param_n_neurons'] = str(n_neurons)
+    os.environ['coco_param_n_lanes'] = str(n_lanes)
+    os.environ['coco_param_density'] = str(density)
+    os.environ['coco_param_seed'] = str(seed) # so from cocotb can generate same random data
+    rom_init = get_rom(width_w, n_inputs*n_neurons, seed=seed)
+    bias_init = get_rom(width_i, n_neurons, seed=seed+1)
+    core = ZeroSkipMlpNode(width_i=width_i,
+                           width_w=width_w,
+                           n_inputs=n_inputs,
+                           rom_init=rom_init,
+                           bias_init=bias_init,
+                           n_lanes=n_lanes)
+    ports = core.get_ports()
+    vcd_file = vcd_only_if_env(f'./test_zero_skip_mlp_node_d{width_i}_w{width_w}_n{n_inputs}_m{n_neurons}_l{n_lanes}.vcd')
+    run(core, 'cnn.tests.test_zero_skip_mlp_node', ports=ports, vcd_file=vcd_file)
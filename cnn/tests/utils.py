@@ -1,5 +1,7 @@
 import os
 import numpy as np
+from math import floor
+from cnn.requantize import requantize
 
 def twos_comp_from_int(val, bits):
     """compute the 2's complement of int value val"""
@@ -83,4 +85,16 @@ def incremental_matrix(shape, size, max_value):
         matrix = [x % max_value for x in range(count, count + n_elements)]
         data.append(matrix)
         count = (count + n_elements) % max_value
-    return data
\ No newline at end of file
+    return data
+
+
+def fused_output(x, acc_w, bias, bias_shift, relu_leak, multiplier, shift, zero_point, width_act):
+    """reference of the fused output stage of the Convolution"""
+    if bias is not None:
+        x = x + (bias << bias_shift)
+        x = (x + 2**(acc_w-1)) % 2**acc_w - 2**(acc_w-1)
+    if relu_leak is not None and x < 0:
+        x = 0 if relu_leak == 0 else int(floor(x / 2**(acc_w-relu_leak)))
+    if multiplier is not None:
+        x = requantize(x, multiplier, shift, width_act, zero_point)
+    return x
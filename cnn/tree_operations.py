@@ -41,7 +41,11 @@ class TreeStage(Elaboratable):
 class TreeOperation(Elaboratable):
     _operation = None
 
-    def __init__(self, width_i, n_stages, *args, **kwargs):
+    def __init__(self, width_i, n_stages, *args, width_o=None, **kwargs):
+        # width_o: maximum bit width of the stages. The adder trees grow
+        # one bit per stage, but when the result is known to fit in
+        # fewer bits (or only its lower bits are used, as in an
+        # accumulator) the stages can be truncated to width_o bits.
         class _Stage(TreeStage):
             _operation = self._operation
 
@@ -55,8 +59,11 @@ class TreeOperation(Elaboratable):
                 stage_width_i = width_i
             else:
                 stage_width_i = self.stages[-1].output_w
+            stage_width_o = self._stage_output_w(stage_width_i)
+            if width_o is not None:
+                stage_width_o = min(stage_width_o, width_o)
             stage = _Stage(stage_width_i,
-                           self._stage_output_w(stage_width_i),
+                           stage_width_o,
                            2**(n_stages-i),
                            n='S'+str(i),
                            *args,
@@ -6,3 +6,37 @@ def required_bits(value):
     else: 
         return ceil(log2(-value)+1)
 
+
+
+def signed_range(width):
+    return -2**(width-1), 2**(width-1)-1
+
+def range_required_bits(low, high):
+    # signed bits to represent every value in [low, high]
+    n = 1
+    while low < -2**(n-1) or high > 2**(n-1)-1:
+        n += 1
+    return n
+
+def dot_product_range(coeffs, input_range):
+    # range of sum(coeffs[i] * x[i]) with each x[i] in input_range
+    low, high = input_range
+    r_low = sum([min(c * low, c * high) for c in coeffs])
+    r_high = sum([max(c * low, c * high) for c in coeffs])
+    return r_low, r_high
+
+def dot_product_bits(coeffs, input_range):
+    return range_required_bits(*dot_product_range(coeffs, input_range))
+
+def accumulator_bits(coeffs, n_inputs, input_range, bias=None, bias_shift=0):
+    # coeffs has n_inputs coefficients for each vector (as the rom_init of
+    # the MLP Node), and the accumulator has to fit the worst of them.
+    n_vectors = len(coeffs) // n_inputs
+    if bias is None:
+        bias = [0] * n_vectors
+    bits = 1
+    for i in range(n_vectors):
+        low, high = dot_product_range(coeffs[i*n_inputs:(i+1)*n_inputs], input_range)
+        b = bias[i] * 2**bias_shift
+        bits = max(bits, range_required_bits(low + b, high + b))
+    return bits
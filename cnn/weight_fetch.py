@@ -0,0 +1,167 @@
+from nmigen import *
+from cnn.interfaces import DataStream
+from cnn.utils.operations import _incr
+
+
+class WeightFetcher(Elaboratable):
+    _doc_ = """
+    Weight Fetcher streams the weights from an external memory
+    into on-chip buffers, and provides the same read interface
+    as the Circular ROM, so it can feed a Stream Macc.
+
+    The weights are read in bursts of 'burst' words. Each on-chip
+    buffer holds one burst, and a burst is requested as soon as
+    a buffer is free, so the next bursts are prefetched while the
+    current one is being read. Several requests can be
+    outstanding, and the memory must answer them in order.
+    A buffer is refilled only after it is completely read, so
+    with 2 buffers (ping-pong) the refill of one buffer, which
+    takes at least burst clocks, never fits in the read of the
+    other one. To keep reading one weight per clock, the
+    prefetched bursts have to cover the memory latency (plus a
+    few clocks of handshake overhead):
+        (n_buffers - 2) * burst >= latency + 3
+    which holds with the default n_buffers=3 when
+    burst >= latency + 3.
+
+    The external memory region is read circularly, as the
+    Circular ROM does with its init data.
+
+    Interfaces
+    ----------
+    mem_req : Data Stream, output
+        Burst read requests to the external memory. The data is
+        the word address of the first word of the burst.
+
+    mem_resp : Data Stream, input
+        Read data from the external memory, 'burst' words for
+        each request.
+
+    read port : {r_data, r_en, r_rdy}, output
+        Same as in the Circular ROM.
+
+    Parameters
+    ----------
+    width : int
+        Bit width of the weights.
+
+    depth : int
+        Number of weights in the external memory. It must be a
+        multiple of burst.
+
+    burst : int
+        Number of words of each burst.
+
+    n_buffers : int
+        Number of on-chip buffers of 'burst' words (at least 2).
+
+    base_addr : int
+        Address of the first weight in the external memory.
+
+    addr_w : int
+        Bit width of the external memory addresses.
+    """
+
+    def __init__(self, width, depth, burst, n_buffers=3, base_addr=0, addr_w=32):
+        assert depth % burst == 0, f'{depth} is not a multiple of {burst}'
+        assert n_buffers >= 2
+        self.width = width
+        self.depth = depth
+        self.burst = burst
+        self.n_buffers = n_buffers
+        self.base_addr = base_addr
+        self.buffer = Memory(width=width, depth=n_buffers * burst)
+        self.mem_req = DataStream(width=addr_w, direction='source', name='mem_req')
+        self.mem_resp = DataStream(width=width, direction='sink', name='mem_resp')
+        self.r_en = Signal()
+        self.r_rdy = Signal()
+        self.r_data = Signal(width)
+
+    def get_ports(self):
+        ports = [self.r_en, self.r_rdy, self.r_data]
+        ports += [self.mem_req[f] for f in self.mem_req.fields]
+        ports += [self.mem_resp[f] for f in self.mem_resp.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        m.submodules.wr_port = wr_port = self.buffer.write_port()
+        m.submodules.rd_port = rd_port = self.buffer.read_port(domain='sync')
+
+        n_words = self.n_buffers * self.burst
+
+        # buffer status
+        requested = Array([Signal(name='requested_' + str(i)) for i in range(self.n_buffers)])
+        full = Array([Signal(name='full_' + str(i)) for i in range(self.n_buffers)])
+
+        # requests
+        n_bursts = self.depth // self.burst
+        req_buf = Signal(range(self.n_buffers))
+        req_burst = Signal(range(n_bursts))
+
+        comb += self.mem_req.valid.eq(~requested[req_buf] & ~full[req_buf])
+        comb += self.mem_req.data.eq(self.base_addr + req_burst * self.burst)
+        comb += self.mem_req.last.eq(0)
+
+        with m.If(self.mem_req.accepted()):
+            sync += [requested[req_buf].eq(1),
+                     req_buf.eq(_incr(req_buf, self.n_buffers)),
+                     req_burst.eq(_incr(req_burst, n_bursts)),
+                    ]
+
+        # responses --> buffers
+        wr_buf = Signal(range(self.n_buffers))
+        wr_cnt = Signal(range(self.burst))
+        wr_addr = Signal(range(n_words))
+        set_full = Signal()
+
+        comb += self.mem_resp.ready.eq(1)
+        comb += [wr_port.addr.eq(wr_addr),
+                 wr_port.data.eq(self.mem_resp.data),
+                 wr_port.en.eq(self.mem_resp.accepted()),
+                ]
+
+        sync += set_full.eq(0)
+        with m.If(self.mem_resp.accepted()):
+            sync += [wr_cnt.eq(_incr(wr_cnt, self.burst)),
+                     wr_addr.eq(_incr(wr_addr, n_words)),
+                    ]
+            with m.If(wr_cnt == self.burst - 1):
+                sync += [wr_buf.eq(_incr(wr_buf, self.n_buffers)),
+                         set_full.eq(1),
+                        ]
+
+        # the buffer is marked as full one clock after the last write,
+        # so the read port is already updated.
+        full_buf = Signal.like(wr_buf)
+        sync += full_buf.eq(wr_buf)
+        with m.If(set_full):
+            sync += [full[full_buf].eq(1),
+                     requested[full_buf].eq(0),
+                    ]
+
+        # buffers --> read port
+        rd_buf = Signal(range(self.n_buffers))
+        rd_cnt = Signal(range(self.burst))
+        prev_addr = Signal.like(rd_port.addr)
+
+        do_read = self.r_en & self.r_rdy
+
+        comb += self.r_rdy.eq(full[rd_buf])
+        comb += self.r_data.eq(rd_port.data)
+        sync += prev_addr.eq(rd_port.addr)
+
+        with m.If(do_read):
+            comb += rd_port.addr.eq(_incr(prev_addr, n_words))
+            sync += rd_cnt.eq(_incr(rd_cnt, self.burst))
+            with m.If(rd_cnt == self.burst - 1):
+                sync += [full[rd_buf].eq(0),
+                         rd_buf.eq(_incr(rd_buf, self.n_buffers)),
+                        ]
+        with m.Else():
+            comb += rd_port.addr.eq(prev_addr)
+
+        return m
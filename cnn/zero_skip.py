@@ -0,0 +1,273 @@
+from nmigen import *
+from cnn.interfaces import DataStream, MatrixStream, SparseStream
+from cnn.rom import CircularROM
+from cnn.stream_macc import StreamMacc
+from cnn.mlp_node import node_accum_bits
+from cnn.utils.operations import _incr
+
+from math import ceil, log2
+
+
+class ZeroSkip(Elaboratable):
+    _doc_ = """
+    Zero Skip compresses a stream of activations (usually after
+    a ReLu) into (index, value) pairs of the non zero values.
+    The input can have n_lanes activations per clock, and one
+    non zero activation is output per clock, so a vector of
+    n_inputs activations takes max(n_inputs / n_lanes, non zeros)
+    cycles.
+    The vectors are delimited by counting n_inputs activations
+    (the input last is ignored), and the output last is asserted
+    with the last pair of each vector. If the vector ends with
+    zeros, a (index, 0) pair is output to carry the last.
+
+    Interfaces
+    ----------
+    input : Data Stream (n_lanes=1) or Matrix Stream (n_lanes,), input
+        Activations.
+
+    output : Sparse Stream, output
+        Non zero activations and their index in the vector.
+
+    Parameters
+    ----------
+    width : int
+        Bit width of the activations.
+
+    n_inputs : int
+        Number of activations of each vector. It must be a
+        multiple of n_lanes.
+
+    n_lanes : int
+        Number of activations in each input sample.
+    """
+
+    def __init__(self, width, n_inputs, n_lanes=1):
+        assert n_inputs % n_lanes == 0, (
+            f'{n_inputs} inputs can not be splitted in {n_lanes} lanes')
+        self.width = width
+        self.n_inputs = n_inputs
+        self.n_lanes = n_lanes
+        self.index_w = max(1, ceil(log2(n_inputs)))
+        if n_lanes == 1:
+            self.input = DataStream(width=width, direction='sink', name='input')
+        else:
+            self.input = MatrixStream(width=width, shape=(n_lanes,), direction='sink', name='input')
+        self.output = SparseStream(width=width, index_w=self.index_w, direction='source', name='output')
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        n_words = self.n_inputs // self.n_lanes
+
+        # current input word
+        word = Array([Signal(self.width, name='word_' + str(i)) for i in range(self.n_lanes)])
+        mask = Signal(self.n_lanes) # non zero lanes not sent yet
+        base = Signal(self.index_w)
+        word_last = Signal()
+        word_valid = Signal()
+        word_cnt = Signal(range(n_words))
+
+        sel = Signal(range(self.n_lanes))
+        rest = Signal(self.n_lanes)
+        load = Signal()
+
+        # lowest non zero lane
+        comb += sel.eq(0)
+        for i in reversed(range(self.n_lanes)):
+            with m.If(mask[i]):
+                comb += sel.eq(i)
+        comb += rest.eq(mask & ~(1 << sel))
+
+        with m.If(mask != 0):
+            comb += [self.output.valid.eq(word_valid),
+                     self.output.index.eq(base + sel),
+                     self.output.data.eq(word[sel]),
+                     self.output.last.eq(word_last & (rest == 0)),
+                    ]
+        with m.Else():
+            # only the last has to be sent
+            comb += [self.output.valid.eq(word_valid & word_last),
+                     self.output.index.eq(base + self.n_lanes - 1),
+                     self.output.data.eq(0),
+                     self.output.last.eq(1),
+                    ]
+
+        comb += load.eq(~word_valid |
+                        ((mask == 0) & ~word_last) |
+                        (self.output.accepted() & (rest == 0)))
+        comb += self.input.ready.eq(load)
+
+        with m.If(self.input.accepted()):
+            sync += [word_valid.eq(1),
+                     base.eq(word_cnt * self.n_lanes),
+                     word_last.eq(word_cnt == n_words - 1),
+                     word_cnt.eq(_incr(word_cnt, n_words)),
+                    ]
+            sync += [w.eq(d) for w, d in zip(word, self.input.data_ports)]
+            sync += mask.eq(Cat(*[d != 0 for d in self.input.data_ports]))
+        with m.Elif(load):
+            sync += word_valid.eq(0)
+        with m.Elif(self.output.accepted()):
+            sync += mask.eq(rest)
+
+        return m
+
+
+class ZeroSkipMlpNode(Elaboratable):
+    _doc_ = """
+    MLP Node that skips the zero activations. A Zero Skip
+    core compresses the input, and only the non zero
+    activations are multiplied by its weight, read from a
+    memory addressed by the activation index.
+    Same as the MLP Node, it can do the job of N neurons
+    serially, and the input vector has to be sent once for
+    each neuron. The output has one value for each neuron,
+    and last is asserted with the last neuron.
+
+    Parameters
+    ----------
+    width_i : int
+        Bit width of data in stream interface.
+
+    width_w : int
+        Bit width of the weights.
+
+    n_inputs : int
+        Number of inputs for each neuron.
+
+    rom_init : list
+        List with the weights, with the same form as in the
+        MLP Node.
+
+    bias_init : list
+        List with the bias of each neuron. See mlpNode.
+
+    width_b : int
+        Bit width of the bias. See mlpNode.
+
+    bias_shift : int
+        Fixed point scale of the bias. See mlpNode.
+
+    n_lanes : int
+        Number of activations in each input sample. See ZeroSkip.
+
+    input_range : tuple
+        (min, max) of the input samples. See mlpNode.
+    """
+
+    def __init__(self, width_i, width_w, n_inputs, rom_init, bias_init=None, width_b=None, bias_shift=None, n_lanes=1, input_range=None):
+        assert len(rom_init) % n_inputs == 0
+        n_neurons = len(rom_init) // n_inputs
+        if bias_init is None:
+            bias_init = [0] * n_neurons
+        assert len(bias_init) == n_neurons, f'{len(bias_init)} != {n_neurons}'
+        if width_b is None:
+            width_b = width_i
+        shift = width_w - 1 # compensate weights gain
+        if bias_shift is None:
+            bias_shift = shift
+        accum_w = node_accum_bits(width_i, width_w, n_inputs, rom_init, bias_init,
+                                  width_b, bias_shift, input_range)
+
+        self.n_inputs = n_inputs
+        self.n_neurons = n_neurons
+        self.n_weights = len(rom_init)
+
+        self.zero_skip = ZeroSkip(width=width_i,
+                                  n_inputs=n_inputs,
+                                  n_lanes=n_lanes)
+
+        self.weights = Memory(width=width_w,
+                              depth=len(rom_init),
+                              init=rom_init)
+
+        self.bias_rom = CircularROM(width=width_b,
+                                    init=bias_init)
+
+        self.macc = StreamMacc(width_i=width_i,
+                               width_c=width_w,
+                               width_acc=accum_w,
+                               shift=shift,
+                               width_b=width_b,
+                               bias_shift=bias_shift)
+
+        output_w = len(self.macc.output.data)
+        self.input = self.zero_skip.input
+        self.output = DataStream(width=output_w, direction='source', name='output')
+
+    def get_ports(self):
+        ports = []
+        ports += [self.input[f] for f in self.input.fields]
+        ports += [self.output[f] for f in self.output.fields]
+        return ports
+
+    def elaborate(self, platform):
+        m = Module()
+        sync = m.d.sync
+        comb = m.d.comb
+
+        m.submodules.zero_skip = zero_skip = self.zero_skip
+        m.submodules.bias_rom = bias_rom = self.bias_rom
+        m.submodules.macc = macc = self.macc
+        m.submodules.rd_port = rd_port = self.weights.read_port(domain='sync', transparent=False)
+
+        sparse = zero_skip.output
+        neuron_base = Signal(range(self.n_weights))
+        out_cnt = Signal(range(self.n_neurons))
+
+        # stage with the activation and its weight read from the memory
+        data = Signal.like(sparse.data)
+        last = Signal()
+        valid = Signal()
+        advance = Signal()
+
+        comb += advance.eq(macc.input.accepted() | ~valid)
+        comb += sparse.ready.eq(advance)
+
+        comb += rd_port.addr.eq(neuron_base + sparse.index)
+        comb += rd_port.en.eq(advance)
+
+        with m.If(advance):
+            sync += [data.eq(sparse.data),
+                     last.eq(sparse.last),
+                     valid.eq(sparse.valid),
+                    ]
+
+        with m.If(sparse.accepted() & sparse.last):
+            with m.If(neuron_base == self.n_weights - self.n_inputs):
+                sync += neuron_base.eq(0)
+            with m.Else():
+                sync += neuron_base.eq(neuron_base + self.n_inputs)
+
+        # stage --> macc
+        comb += [macc.input.valid.eq(valid),
+                 macc.input.data.eq(data),
+                 macc.input.last.eq(last),
+                 macc.r_data.eq(rd_port.data),
+                 macc.r_rdy.eq(1),
+                ]
+
+        comb += bias_rom.restart.eq(0)
+        comb += macc.b_data.eq(bias_rom.r_data)
+        comb += macc.b_rdy.eq(bias_rom.r_rdy)
+        comb += bias_rom.r_en.eq(macc.b_en)
+
+        # macc --> output
+        comb += [self.output.valid.eq(macc.output.valid),
+                 self.output.data.eq(macc.output.data),
+                 self.output.last.eq(out_cnt == self.n_neurons - 1),
+                 macc.output.ready.eq(self.output.ready),
+                ]
+        with m.If(self.output.accepted()):
+            sync += out_cnt.eq(_incr(out_cnt, self.n_neurons))
+
+        return m